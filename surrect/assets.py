@@ -0,0 +1,62 @@
+"""
+assets - content hashed resource names.
+
+A fingerprinted resource has a digest of its contents in its name, such as
+logo.3f9a1c2e.png, so it can be cached for as long as a browser likes.
+Digests are kept with the signature of the file they were taken from,
+so a file is only hashed again once it changes.
+"""
+
+import json
+import logging
+
+from os import makedirs, path, replace
+
+from .pagecache import file_digest
+from .source import path_signature
+
+
+log = logging.getLogger(__name__)
+
+
+def fingerprinted(dst: str, digest: str, length: int=8) -> str:
+    """Add a digest to a path, before its extension."""
+    base, ext = path.splitext(dst)
+    return "{0}.{1}{2}".format(base, digest[:length], ext)
+
+
+class DigestCache:
+    """Content digests of files, keyed by path and checked against path_signature."""
+    def __init__(self, digests: dict=None):
+        self.digests = {} if digests is None else digests
+        self.hashed = 0
+
+    @classmethod
+    def load(cls, digestpath: str) -> "DigestCache":
+        try:
+            with open(digestpath, "r") as digestfile:
+                return cls(json.load(digestfile))
+        except FileNotFoundError:
+            return cls()
+        except ValueError as e:
+            log.warning("Ignoring unreadable digest cache \"%s\": %s" % (digestpath, e))
+            return cls()
+
+    def save(self, digestpath: str) -> None:
+        makedirs(path.dirname(digestpath) or ".", exist_ok=True)
+        tmppath = digestpath + ".tmp"
+        with open(tmppath, "w") as digestfile:
+            json.dump(self.digests, digestfile)
+        replace(tmppath, digestpath)
+
+    def digest(self, pth: str) -> str:
+        """sha1 of a file's contents, hashing it only if it has changed."""
+        sig = path_signature(pth)
+        sig = list(sig) if sig is not None else None
+        record = self.digests.get(pth)
+        if record is not None and record[0] == sig:
+            return record[1]
+        digest = file_digest(pth)
+        self.digests[pth] = [sig, digest]
+        self.hashed += 1
+        return digest
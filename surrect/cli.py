@@ -2,15 +2,29 @@ import sys
 import json
 import logging
 
-from os import listdir, mkdir, path, walk
-from argparse import ArgumentParser, FileType
+from os import listdir, mkdir, path, remove, walk
+from argparse import ArgumentParser, ArgumentTypeError, FileType
+from fnmatch import fnmatch
+from concurrent.futures import ThreadPoolExecutor
 from shutil import rmtree
 
 from . import meta
 
 from . import rune, scroll
-from .source import Category, category_build, scrape_scroll_metadata
-from .summon import get_outfunc_msg, load_renderers, load_globmap, globmap_sources_to_renderers, DEFAULT_CONFIG
+from .assets import DigestCache
+from .compress import Precompressor
+from .manifest import build_manifest, diff_manifests, load_manifest, save_manifest
+from .depgraph import DependencyGraph, config_digest
+from .journal import Journal
+from .source import Category, CategorySnapshot, SourceType, category_build, scrape_scroll_metadata
+from .output import ArchiveOutput, DirectoryOutput, MemoryOutput, output_for
+from .pagecache import PageCache, rune_digest
+from .pipeline import Pipeline, Stage
+from .serve import Site, serve
+from .shard import merge_shards, parse_shard, shard_of, site_digest, write_record
+from .util import brace_expand, current_rss, over_rss_limit, peak_rss
+from .summon import get_outfunc_msg, load_renderers, load_globmap, globmap_sources_to_renderers, \
+    DEFAULT_CONFIG, SUMMON_STAGES
 
 
 VERBOSITY_TO_LOGLEVEL = {
@@ -20,6 +34,9 @@ VERBOSITY_TO_LOGLEVEL = {
     3: logging.DEBUG
 }
 
+# Seconds between journal checkpoints when resuming without --checkpoint.
+CHECKPOINT_INTERVAL = 10.0
+
 
 log = logging.getLogger(__name__)
 out = get_outfunc_msg()
@@ -37,6 +54,56 @@ def load_runedir(runedir):
                 rune.load(runepath)
 
 
+def shard_spec(spec):
+    try:
+        return parse_shard(spec)
+    except ValueError as e:
+        raise ArgumentTypeError(str(e))
+
+
+def summon_pipelined(summon_list, category_tree, args, over_memory_limit, done):
+    """
+    Summon sources in a pipeline of stages. Resources are copied on a thread
+    pool meanwhile. done is called with each source and renderer once written.
+    Returns True if the build had to stop.
+    """
+    def stage_func(name):
+        method = "summon_" + name
+        return lambda item: (item[0], getattr(item[0], method)(item[1]))
+
+    def write(item):
+        renderer, job = item
+        renderer.summon_write(job)
+        done(job.source, renderer)
+        return item
+
+    def copy(source, renderer):
+        renderer.summon(source, category_tree)
+        done(source, renderer)
+
+    # Stages keep their order, bar writing, which may have several workers.
+    stages = [Stage(name, write if name == "write" else stage_func(name),
+                    args.jobs if name == "write" else 1, args.queue_depth)
+              for name in SUMMON_STAGES]
+    copies = []
+    with ThreadPoolExecutor(max_workers=args.jobs) as copier, Pipeline(stages) as pipeline:
+        for source, renderer in summon_list:
+            if source.kind is SourceType.RESOURCE:
+                copies.append(copier.submit(copy, source, renderer))
+            else:
+                pipeline.put((renderer, renderer.begin(source, category_tree)))
+            if over_memory_limit(source):
+                return True
+    for copy in copies:
+        copy.result()
+
+    out("Pipeline stages:")
+    for st in pipeline.stats():
+        out("    %-8s %6d items, %5.1f%% busy (%.2fs busy, %.2fs idle, %.2fs blocked)"
+            % (st.name, st.items, st.utilisation * 100, st.busy, st.idle, st.blocked))
+    return False
+
+
 # Mode functions - invoked like surrect [global opts] mode [mode opts]
 # Argument is always the arg namespace.
 
@@ -58,23 +125,63 @@ def gen_mode(args):
 
 
 def build_mode(args):
+    if args.memory_limit and current_rss() is None:
+        log.error("--memory-limit needs the current memory usage, which can't be measured here.")
+        return 1
+
     with open(args.summonfile) as cfgsrc:
         cfg = json.load(cfgsrc)
 
     cat_root = cfg["summon"]["root dir"]    # category root, aka root dir
     phy_root = cfg["summon"]["build dir"]   # physical root, aka build dir
     root_ctx = cfg["summon"].get("context", {}).copy()  # root context.
+    cache_dir = cfg["summon"].get("cache dir")  # optional, caching is off without it.
+    page_cache_dir = cfg["summon"].get("page cache")  # optional, may be shared between checkouts.
+    compress_cfg = cfg["summon"].get("compress")  # optional, writes precompressed sidecars.
+    # optional, the output manifest. Kept in the cache dir by default.
+    manifest_path = cfg["summon"].get("manifest",
+                                      path.join(cache_dir, "manifest.json") if cache_dir is not None else None)
 
     load_runedir(cfg["summon"]["rune dir"])
+    rune.memo.maxsize = args.rune_memo
 
     out("Initialising renderers...")
-    renderers = load_renderers(cfg["renderers"], phy_root, root_ctx)
+    try:
+        renderers = load_renderers(cfg["renderers"], phy_root, root_ctx)
+    except ValueError as e:
+        log.error("Bad renderer configuration: %s" % e)
+        return 1
     globmap = load_globmap(cfg["summon"]["map"])
+    depgraph = None
+    if cache_dir is not None:
+        depgraph_path = path.join(cache_dir, "dependencies.json")
+        depgraph = DependencyGraph.load(depgraph_path, config_digest(cfg, cfg["summon"]["rune dir"]))
+    elif args.incremental:
+        log.warning("No cache dir configured, all pages will be summoned.")
+    digests = None
+    if cache_dir is not None:
+        digests_path = path.join(cache_dir, "digests.json")
+        digests = DigestCache.load(digests_path)
+    page_cache = None
+    if page_cache_dir is not None and not args.force:
+        salt = "%s %s" % (meta.version, rune_digest(cfg["summon"]["rune dir"]))
+        page_cache = PageCache(page_cache_dir, salt)
     for renderer in renderers.values():
-        renderer.set_opt(noop=args.noop, force=args.force)
+        renderer.set_opt(noop=args.noop, force=args.force, stream=args.stream, depgraph=depgraph,
+                         rune_concurrency=args.rune_concurrency, page_cache=page_cache, digests=digests)
 
     out("Gathering source information...")
-    category_tree = category_build(cat_root)
+    snapshot = None
+    if cache_dir is not None:
+        snapshot_path = path.join(cache_dir, "categories.snapshot")
+        snapshot = CategorySnapshot.load(snapshot_path, cat_root)
+    category_tree = category_build(cat_root, snapshot=snapshot, workers=args.jobs)
+    if snapshot is not None:
+        log.info("category snapshot: %d categories reused, %d rescanned"
+                 % (snapshot.hits, snapshot.misses))
+        if not args.noop:
+            # Must happen before the rituals modify the tree.
+            snapshot.save(snapshot_path)
     log.info("source tree:")
     def log_cat_tree(cat, indent=""):
         for ent in cat:
@@ -86,7 +193,9 @@ def build_mode(args):
     log_cat_tree(category_tree)
     src_rend_list = globmap_sources_to_renderers(category_tree.sources(), globmap, renderers)
 
-    if path.exists(phy_root):
+    # Archives are replaced, and a noop build writes nothing.
+    directory = args.output is None and not args.noop
+    if args.output is None and path.exists(phy_root):
         if len(listdir(phy_root)) > 0:
             if args.force:
                 if args.noop:
@@ -95,22 +204,305 @@ def build_mode(args):
                     out("Removing '%s'..." % phy_root)
                     rmtree(phy_root)
                     mkdir(phy_root)
+            elif args.incremental or args.resume or args.only:
+                # Outputs that aren't summoned are left as they are.
+                pass
             else:
                 log.error("Build directory \"%s\" exists and is not empty!"
                           % phy_root)
                 return 1
-    else:
-        if not args.noop:
-            mkdir(phy_root)
+    elif directory:
+        mkdir(phy_root)
+
+    try:
+        output = MemoryOutput(keep=False) if args.noop else output_for(args.output, phy_root)
+    except (ValueError, OSError) as e:
+        log.error("Can't write output \"%s\": %s" % (args.output, e))
+        return 1
+    for renderer in renderers.values():
+        renderer.set_opt(output=output)
 
     out("Conducting riturals...")
     for source, renderer in src_rend_list:
         renderer.ritual(source)
+    if digests is not None and not args.noop:
+        log.info("digest cache: %d files hashed" % digests.hashed)
+        digests.save(digests_path)
 
-    out("Summoning...")
+    # Runes may add missing keys while summoning, so they are only warned about.
     for source, renderer in src_rend_list:
-        renderer.summon(source, category_tree)
+        for name, keys in renderer.check(source):
+            log.warning("Undefined key%s %s in \"%s\" for \"%s\""
+                        % ("s" if len(keys) > 1 else "", ", ".join(keys), name, source.source))
+
+    # Nothing else may be written over a page.
+    destinations = {source.destination: source for source, _ in src_rend_list}
+    collisions = 0
+    for source, renderer in src_rend_list:
+        for extra in renderer.extra_outputs(source):
+            if extra in destinations:
+                log.error("\"%s\", written for \"%s\", is also the output of \"%s\""
+                          % (extra, source.source, destinations[extra].source))
+                collisions += 1
+    if collisions > 0:
+        return 1
+
+    if not args.noop:
+        out("Summoning...")
+    memory_limit = args.memory_limit * 1024 * 1024 if args.memory_limit else None
+    # A noop build still works out what an incremental build would summon.
+    incremental = args.incremental and depgraph is not None and not args.force and args.output is None
+    skipped = 0
+
+    def over_memory_limit(source):
+        if memory_limit is None:
+            return False
+        rss = over_rss_limit(memory_limit)
+        if rss is not None:
+            log.error("Memory ceiling of %d MiB exceeded (%d MiB resident) after summoning \"%s\""
+                      % (args.memory_limit, rss // (1024 * 1024), source.source))
+            return True
+        return False
+
+    relpaths = {source: path.relpath(source.source, cat_root).replace(path.sep, "/")
+                for source, _ in src_rend_list}
+    shard_list = src_rend_list
+    if args.shard is not None:
+        shard, shards = args.shard
+        shard_list = [(source, renderer) for source, renderer in src_rend_list
+                      if shard_of(relpaths[source], shards) == shard]
+        out("Shard %d of %d: %d of %d sources." % (shard, shards, len(shard_list), len(src_rend_list)))
+    selected_list = shard_list
+    if args.only:
+        globs = [glob for metaglob in args.only for glob in brace_expand(metaglob)]
+        selected_list = [(source, renderer) for source, renderer in shard_list
+                         if any(fnmatch(relpaths[source], glob) for glob in globs)]
+        out("Only summoning %d of %d sources." % (len(selected_list), len(shard_list)))
+    if depgraph is not None and len(selected_list) < len(src_rend_list):
+        # Unselected pages aren't stale, just not summoned by this build.
+        selected = {source for source, _ in selected_list}
+        for source, _ in src_rend_list:
+            if source not in selected and source.destination in depgraph.previous:
+                depgraph.keep(source)
+
+    # Journalling hashes every output, so is only done when asked for.
+    journal = None
+    journalled = args.resume or args.checkpoint is not None
+    checkpoint = args.checkpoint if args.checkpoint is not None else CHECKPOINT_INTERVAL
+    if journalled and cache_dir is not None and directory:
+        journal_path = path.join(cache_dir, "journal")
+        journal_config = config_digest(cfg, cfg["summon"]["rune dir"])
+        if args.resume and not args.force:
+            journal = Journal.load(journal_path, journal_config, checkpoint)
+        else:
+            journal = Journal(journal_path, journal_config, checkpoint)
+        journal.start()
+    elif args.resume:
+        log.warning("Resuming needs a cache dir and the build dir, all pages will be summoned.")
+    rendnames = {renderer: name for name, renderer in renderers.items()}
+    resumed = 0
+
+    def done(source, renderer):
+        if journal is not None:
+            journal.record(source.destination, source.source, rendnames[renderer], phy_root,
+                           depgraph.current.get(source.destination) if depgraph is not None else None)
+
+    summon_list = []
+    for source, renderer in selected_list:
+        if journal is not None and journal.entries:
+            entry = journal.completed(source.destination, source.source, rendnames[renderer], phy_root)
+            # The output is intact, but its navigation or references may have changed since.
+            if entry is not None and entry["deps"] is not None \
+                    and depgraph.changed(entry["deps"], source, renderer.nav_digest(source, category_tree),
+                                         renderer.referencer(source, category_tree)):
+                entry = None
+            if entry is not None:
+                journal.add(entry)
+                if depgraph is not None and entry["deps"] is not None:
+                    depgraph.current[source.destination] = entry["deps"]
+                resumed += 1
+                continue
+        if incremental and not depgraph.dirty(source, renderer.nav_digest(source, category_tree),
+                                              renderer.referencer(source, category_tree), phy_root):
+            depgraph.keep(source)
+            skipped += 1
+            continue
+        summon_list.append((source, renderer))
+
+    if resumed > 0:
+        out("%d summons resumed from the journal." % resumed)
+
+    # A dry run stops before summoning, --output memory renders without writing.
+    if args.noop:
+        if incremental:
+            out("%d of %d sources were up to date." % (skipped, len(selected_list)))
+            for dst in depgraph.previous:
+                if dst not in destinations and path.exists(path.join(phy_root, dst)):
+                    out("Would have removed stale output '%s'" % path.join(phy_root, dst))
+        out("Would have summoned %d sources." % len(summon_list))
+        return 0
+
+    try:
+        if args.pipeline:
+            if summon_pipelined(summon_list, category_tree, args, over_memory_limit, done):
+                return 1
+        else:
+            for source, renderer in summon_list:
+                renderer.summon(source, category_tree)
+                done(source, renderer)
+                if over_memory_limit(source):
+                    return 1
+    finally:
+        # Whatever happens, keep what was completed for --resume.
+        if journal is not None:
+            journal.checkpoint()
+
+    if page_cache is not None:
+        log.info("page cache: %d hits, %d misses" % (page_cache.hits, page_cache.misses))
+    if rune.memo.hits + rune.memo.misses > 0:
+        log.info("rune memo: %d hits, %d misses (%.1f%% hit rate)"
+                 % (rune.memo.hits, rune.memo.misses, rune.memo.hit_rate() * 100))
+
+    for renderer in renderers.values():
+        renderer.conclude()
+    if args.shard is not None:
+        write_record(output, shard, shards, site_digest(cfg, cfg["summon"]["rune dir"], relpaths.values()),
+                     len(src_rend_list), [source.destination for source, _ in shard_list])
+    output.close()
+    if not directory:
+        out("Wrote %d files, %d bytes to '%s'." % (output.files, output.bytes, args.output))
+
+    precompressor = None
+    if compress_cfg is not None and directory:
+        digest_path = path.join(cache_dir, "compressed.json") if cache_dir is not None else None
+        precompressor = Precompressor.load(phy_root, compress_cfg, digest_path) \
+            if digest_path is not None else Precompressor(phy_root, compress_cfg)
+
+    if incremental:
+        out("%d of %d sources were up to date." % (skipped, len(selected_list)))
+        for dst in depgraph.stale():
+            stale_path = path.join(phy_root, dst)
+            if path.exists(stale_path):
+                log.info("Removing stale output \"%s\"" % stale_path)
+                remove(stale_path)
+                if precompressor is not None:
+                    precompressor.forget(dst)
+
+    if precompressor is not None:
+        out("Compressing...")
+        written = [source.destination for source, _ in src_rend_list]
+        for renderer in renderers.values():
+            written += getattr(renderer, "nav_fragments", {}).keys()
+        precompressor.run(dst for dst in written if path.isfile(path.join(phy_root, dst)))
+        log.info("compression: %d files compressed, %d unchanged"
+                 % (precompressor.compressed, precompressor.unchanged))
+        if digest_path is not None:
+            precompressor.save(digest_path)
+    if manifest_path is not None and directory:
+        previous = load_manifest(manifest_path)
+        files = build_manifest(phy_root, digests if digests is not None else DigestCache())
+        added, modified, deleted = save_manifest(manifest_path, files, previous)
+        out("%d outputs added, %d modified, %d deleted." % (len(added), len(modified), len(deleted)))
+        if digests is not None:
+            digests.save(digests_path)
+
+    if depgraph is not None and not args.noop:
+        depgraph.save(depgraph_path)
+    if journal is not None:
+        journal.finish()
+
+    peak = peak_rss()
+    if peak is not None:
+        (out if args.stream else log.info)("Peak memory usage: %.1f MiB" % (peak / (1024 * 1024)))
+
+    return 0
+
+
+def meta_mode(args):
+    with open(args.summonfile) as cfgsrc:
+        cfg = json.load(cfgsrc)
+
+    cat_root = cfg["summon"]["root dir"]
+    cache_dir = cfg["summon"].get("cache dir")
+
+    snapshot = None
+    if cache_dir is not None:
+        snapshot = CategorySnapshot.load(path.join(cache_dir, "categories.snapshot"), cat_root)
+    category_tree = category_build(cat_root, snapshot=snapshot)
+
+    # One JSON object per line, for each page.
+    for source in category_tree.sources():
+        if source.kind is not SourceType.SCROLL:
+            continue
+        json.dump({
+            "path": source.destination,
+            "name": source.name,
+            "toc": source.toc,
+            "metadata": source.metadata
+        }, args.output, ensure_ascii=False, sort_keys=True)
+        args.output.write("\n")
+    return 0
+
+
+def serve_mode(args):
+    with open(args.summonfile) as cfgsrc:
+        cfg = json.load(cfgsrc)
+
+    out("Gathering source information...")
+    site = Site(cfg, load_runedir, cache_size=args.cache_size)
+    server = serve(site, args.bind, args.port)
+    out("Serving %d outputs at http://%s:%d/" % (len(site.pages), args.bind, server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+def diff_manifest_mode(args):
+    old = load_manifest(args.old)
+    new = load_manifest(args.new)
+    added, modified, deleted = diff_manifests(old, new)
+    for status, paths in (("A", added), ("M", modified), ("D", deleted)):
+        for pth in paths:
+            print("%s\t%s" % (status, pth))
+    return 0
+
+
+def merge_mode(args):
+    target = args.output
+    archive = target.endswith(".zip") or any(target.endswith(ext) for ext, _ in ArchiveOutput.TAR_MODES)
+    if not archive and path.exists(target) and len(listdir(target)) > 0:
+        if not args.force:
+            log.error("Merge directory \"%s\" exists and is not empty!" % target)
+            return 1
+        if args.noop:
+            out("Would have removed '%s'" % target)
+        else:
+            out("Removing '%s'..." % target)
+            rmtree(target)
+    if args.noop:
+        output = MemoryOutput(keep=False)
+    else:
+        output = ArchiveOutput(target) if archive else DirectoryOutput(target)
+
+    out("Merging %d shards..." % len(args.shards))
+    files, problems = merge_shards(args.shards, output)
+    output.close()
+    for problem in problems:
+        log.error(problem)
+    if problems:
+        return 1
+    if args.noop:
+        out("Would have written %d files, %d bytes." % (output.files, output.bytes))
+        return 0
+    out("Wrote %d files, %d bytes to '%s'." % (output.files, output.bytes, target))
 
+    if args.manifest is not None:
+        added, modified, deleted = save_manifest(args.manifest, files, load_manifest(args.manifest))
+        out("%d outputs added, %d modified, %d deleted." % (len(added), len(modified), len(deleted)))
     return 0
 
 
@@ -129,20 +521,18 @@ def asm_mode(args):
         load_runedir(args.runedir)
 
     metadata = {}
-    scroll_tree = scroll.parse(
+    rune_tree = rune.assemble_iter(scroll.iterparse(
         scrape_scroll_metadata(
             scroll.lex(args.input),
             metadata
         )
-    )
+    ))
 
-    rune_tree = rune.assemble(scroll_tree)
-    inscribed_tree = rune.inscribe(rune_tree, args.format, metadata)
+    args.output.write(args.head)
+    for node in rune.inscribe_iter(rune_tree, args.format, metadata):
+        args.output.write(node.data)
+    args.output.write(args.tail)
 
-    for node in inscribed_tree:
-        if type(node.data) is str:
-            args.output.write(node.data)
-    
     return 0
 
 arg_parser = ArgumentParser()
@@ -154,7 +544,8 @@ arg_parser.add_argument("-f", "--summonfile",
 
 arg_parser.add_argument("-n", "--noop",
     dest="noop", action="store_true", default=False,
-    help="do a dry run - no files will be written"
+    help="do a dry run - no files will be written, and builds stop before summoning "
+         "(use build --output memory to render without writing)"
 )
 
 arg_parser.add_argument("--no-core-runes",
@@ -183,14 +574,136 @@ spo = arg_parser.add_subparsers(help="mode")
 
 build_parser = spo.add_parser("build", help="build a project")
 build_parser.set_defaults(mode=build_mode)
+
+build_parser.add_argument("-j", "--jobs",
+    dest="jobs", action="store", type=int, default=1, metavar="N",
+    help="use N threads for filesystem bound work, such as gathering source information"
+)
+
+build_parser.add_argument("-s", "--stream",
+    dest="stream", action="store_true", default=False,
+    help="render and release pages one at a time, keeping only what navigation and references need"
+)
+
+build_parser.add_argument("-i", "--incremental",
+    dest="incremental", action="store_true", default=False,
+    help="build into an existing build dir, only summoning sources whose dependencies changed"
+)
+
+build_parser.add_argument("-m", "--memory-limit",
+    dest="memory_limit", action="store", type=int, default=None, metavar="MIB",
+    help="abort the build if resident memory exceeds this many MiB"
+)
+
+build_parser.add_argument("-o", "--output",
+    dest="output", action="store", default=None, metavar="TARGET",
+    help="write to a .zip, .tar, .tar.gz, .tar.bz2 or .tar.xz archive instead of the build dir, "
+         "or only measure the output with \"memory\""
+)
+
+build_parser.add_argument("-p", "--pipeline",
+    dest="pipeline", action="store_true", default=False,
+    help="summon pages in a pipeline of stages, overlapping reading and writing with rendering"
+)
+
+build_parser.add_argument("-q", "--queue-depth",
+    dest="queue_depth", action="store", type=int, default=8, metavar="N",
+    help="let up to N pages wait for each pipeline stage"
+)
+
+build_parser.add_argument("--rune-concurrency",
+    dest="rune_concurrency", action="store", type=int, default=None, metavar="N",
+    help="inscribe sibling runes concurrently, awaiting up to N coroutine runes at once"
+)
+
+build_parser.add_argument("--rune-memo",
+    dest="rune_memo", action="store", type=int, default=0, metavar="N",
+    help="remember the output of up to N pure rune invocations"
+)
+
+build_parser.add_argument("--shard",
+    dest="shard", action="store", type=shard_spec, default=None, metavar="K/N",
+    help="only summon the sources in shard K of N, for building on several machines; see merge"
+)
+
+build_parser.add_argument("-r", "--resume",
+    dest="resume", action="store_true", default=False,
+    help="resume an interrupted build, skipping summons it completed whose outputs are intact"
+)
+
+build_parser.add_argument("--checkpoint",
+    dest="checkpoint", action="store", type=float, default=None, metavar="SECONDS",
+    help="journal completed summons every SECONDS, so an interrupted build can be resumed "
+         "(every %g seconds with --resume)" % CHECKPOINT_INTERVAL
+)
+
+build_parser.add_argument("--only",
+    dest="only", action="append", default=None, metavar="GLOB",
+    help="only summon sources whose path in the root dir matches GLOB, leaving other outputs as they are; "
+         "may be given more than once"
+)
+
 gen_parser = spo.add_parser("gen", help="generate a default Summonfile")
 gen_parser.set_defaults(mode=gen_mode)
 runes_parser = spo.add_parser("runes", help="list all runes, with descriptions")
 runes_parser.set_defaults(mode=runes_mode)
+meta_parser = spo.add_parser("meta", help="write the metadata of every page as JSON lines, without building")
+meta_parser.set_defaults(mode=meta_mode)
+serve_parser = spo.add_parser("serve", help="preview a project over HTTP, summoning pages as they are requested")
+serve_parser.set_defaults(mode=serve_mode)
+diff_manifest_parser = spo.add_parser("diff-manifest", help="list the outputs added, modified or deleted between two manifests")
+diff_manifest_parser.set_defaults(mode=diff_manifest_mode)
+merge_parser = spo.add_parser("merge", help="merge the outputs of a sharded build, checking none are missing")
+merge_parser.set_defaults(mode=merge_mode)
 asm_parser = spo.add_parser("asm", help="assemble a single scroll - ignores Summonfile and noop options")
 asm_parser.set_defaults(mode=asm_mode)
 
 
+meta_parser.add_argument(nargs='?',
+    dest="output", action="store", type=FileType("w"), default=sys.stdout,
+    help="output file, defaults to stdout"
+)
+
+serve_parser.add_argument("-b", "--bind",
+    dest="bind", action="store", default="127.0.0.1", metavar="ADDRESS",
+    help="address to listen on, defaults to 127.0.0.1"
+)
+
+serve_parser.add_argument("-p", "--port",
+    dest="port", action="store", type=int, default=8000,
+    help="port to listen on, defaults to 8000"
+)
+
+serve_parser.add_argument("--cache-size",
+    dest="cache_size", action="store", type=int, default=256, metavar="N",
+    help="keep up to N summoned pages in memory"
+)
+
+diff_manifest_parser.add_argument(
+    dest="old", action="store",
+    help="manifest of the earlier build"
+)
+
+diff_manifest_parser.add_argument(
+    dest="new", action="store",
+    help="manifest of the later build"
+)
+
+merge_parser.add_argument("-m", "--manifest",
+    dest="manifest", action="store", default=None, metavar="PATH",
+    help="save a manifest of the merged output, with the changes since the last one saved there"
+)
+
+merge_parser.add_argument(
+    dest="output", action="store",
+    help="directory or archive to merge into"
+)
+
+merge_parser.add_argument(nargs="+",
+    dest="shards", action="store",
+    help="output directories or archives of every shard"
+)
+
 asm_parser.add_argument("-t", "--format",
     dest="format", action="store", default="html",
     help="use this as the output format."
@@ -222,8 +735,10 @@ asm_parser.add_argument(nargs='?',
 )
 
 
-def main():
-    args = arg_parser.parse_args()
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    args = arg_parser.parse_args(argv)
     logging.basicConfig(level=VERBOSITY_TO_LOGLEVEL[min(args.verbosity, 3)])
 
     if args.ver:
@@ -239,7 +754,8 @@ def main():
     # but only if the Summonfile exists.
     if args.mode is None:
         if path.exists(args.summonfile):
-            args.mode = build_mode
+            # Parsed again, so the build options have their defaults.
+            args = arg_parser.parse_args([*argv, "build"])
         else:
             out("no mode specified and no Summonfile found.")
             arg_parser.print_help()
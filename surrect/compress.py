@@ -0,0 +1,147 @@
+"""
+compress - precompressed sidecars (.gz, .br, .zst) for files in a build dir.
+
+gzip is always available. brotli and zstd are used if the brotli and
+zstandard modules are installed. Compression runs on a thread pool, as
+the codecs release the GIL. The digest of every compressed file is kept,
+so files whose contents haven't changed are not compressed again.
+"""
+
+import gzip
+import json
+import hashlib
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from fnmatch import fnmatch
+from os import cpu_count, makedirs, path, remove, replace
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+log = logging.getLogger(__name__)
+
+
+def compress_gzip(data: bytes) -> bytes:
+    # No timestamp, so output only changes with the input.
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def compress_brotli(data: bytes) -> bytes:
+    return brotli.compress(data)
+
+
+def compress_zstd(data: bytes) -> bytes:
+    return zstandard.ZstdCompressor(level=19).compress(data)
+
+
+# Sidecar extension to codec, None if the module is missing.
+CODECS = {
+    "gz": compress_gzip,
+    "br": compress_brotli if brotli is not None else None,
+    "zst": compress_zstd if zstandard is not None else None
+}
+
+DEFAULT_EXCLUDE = ["*.gz", "*.br", "*.zst", "*.zip", "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.woff2"]
+
+
+def sidecars(pth: str):
+    """Paths of every sidecar a file can have."""
+    return [pth + path.extsep + ext for ext in CODECS]
+
+
+class Precompressor:
+    """
+    Writes sidecars for files in build_dir. Configuration, from the
+    "compress" section of the Summonfile:
+     - formats : sidecar extensions to write, from CODECS. Defaults to ["gz"].
+     - min size : files smaller than this many bytes are left alone.
+     - exclude : globs of files to leave alone.
+     - workers : number of threads, defaults to the number of CPUs.
+    """
+    def __init__(self, build_dir: str, cfg: dict, digests: dict=None):
+        self.build_dir = build_dir
+        self.formats = []
+        for ext in cfg.get("formats", ["gz"]):
+            if ext not in CODECS:
+                log.warning("Unknown compression format \"%s\"" % ext)
+            elif CODECS[ext] is None:
+                log.warning("Compression format \"%s\" needs a module that isn't installed" % ext)
+            else:
+                self.formats.append(ext)
+        self.min_size = cfg.get("min size", 256)
+        self.exclude = cfg.get("exclude", DEFAULT_EXCLUDE)
+        self.workers = cfg.get("workers", cpu_count() or 1)
+        self.digests = {} if digests is None else digests
+        self.lock = Lock()
+        self.compressed = 0
+        self.unchanged = 0
+
+    @classmethod
+    def load(cls, build_dir: str, cfg: dict, digestpath: str) -> "Precompressor":
+        digests = {}
+        try:
+            with open(digestpath, "r") as digestfile:
+                digests = json.load(digestfile)
+        except FileNotFoundError:
+            pass
+        except ValueError as e:
+            log.warning("Ignoring unreadable compression digests \"%s\": %s" % (digestpath, e))
+        return cls(build_dir, cfg, digests)
+
+    def save(self, digestpath: str) -> None:
+        makedirs(path.dirname(digestpath) or ".", exist_ok=True)
+        tmppath = digestpath + ".tmp"
+        with open(tmppath, "w") as digestfile:
+            json.dump(self.digests, digestfile)
+        replace(tmppath, digestpath)
+
+    def compress(self, dst: str) -> None:
+        """Write the sidecars of one file, given relative to the build dir."""
+        pth = path.join(self.build_dir, dst)
+        with open(pth, "rb") as f:
+            data = f.read()
+        if len(data) < self.min_size or any(fnmatch(dst, glob) for glob in self.exclude):
+            self.forget(dst)
+            return
+        digest = hashlib.sha1(data).hexdigest()
+        record = self.digests.get(dst)
+        if record is not None and record[0] == digest and set(self.formats) <= set(record[1]) \
+                and all(path.exists(pth + path.extsep + ext) for ext in self.formats):
+            with self.lock:
+                self.unchanged += 1
+            return
+        for ext in CODECS:
+            sidecar = pth + path.extsep + ext
+            if ext in self.formats:
+                with open(sidecar, "wb") as f:
+                    f.write(CODECS[ext](data))
+            elif path.exists(sidecar):
+                # Left over from another configuration, and out of date.
+                remove(sidecar)
+        with self.lock:
+            self.digests[dst] = [digest, self.formats]
+            self.compressed += 1
+
+    def run(self, dsts) -> None:
+        """Write the sidecars of some files, given relative to the build dir."""
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for result in pool.map(self.compress, dsts):
+                pass
+
+    def forget(self, dst: str) -> None:
+        """Remove the sidecars of a file, and forget its digest."""
+        with self.lock:
+            self.digests.pop(dst, None)
+        for sidecar in sidecars(path.join(self.build_dir, dst)):
+            if path.exists(sidecar):
+                remove(sidecar)
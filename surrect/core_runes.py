@@ -3,6 +3,7 @@ import html
 from typing import List
 
 from .rune import rune, mkrune, mkdata, mknull, isdata, RuneNode, RuneType
+from .scroll.tree import NODE_RAW, NODE_TEXT
 
 
 def clamp(mn, n, mx):
@@ -18,25 +19,32 @@ def flatten_tree(nodes: List[RuneNode]) -> List[RuneNode]:
     return [RuneNode(n.kind, n.data, None, n.attributes) for n in flatree]
 
 
-@rune("heading")
+@rune("heading", pure=True)
 def heading(hl, hd, nodes, attrs, context):
     """Produces a simple heading."""
     return [mkdata("{pad} {title} {pad}\n".format(pad="="*hl, title=hd))]
 
 
-@rune("heading", "html")
+@rune("heading", "html", pure=True)
 def heading_html(hl, hd, nodes, attrs, context):
     """Formats a HTML heading."""
     return [mkdata("<h{n}>{title}</h{n}>".format(n=clamp(1, hl, 6), title=hd))]
 
 
-@rune("root")
+@rune("root", streams=True)
 def root(nodes, attrs, context):
     """Flattens the node tree and returns it."""
     return flatten_tree(nodes)
 
 
-@rune("root", "html")
+# Runs of text are joined on a space, after escaping, and raw lines written as they are.
+HTML_ROOT_COLLATORS = {
+    NODE_TEXT: (" ", lambda n: n.strip()),
+    NODE_RAW: ("", lambda n: n)
+}
+
+
+@rune("root", "html", collators=HTML_ROOT_COLLATORS, streams=True)
 def root_html(*, nodes, attrs, context):
     """HTML root node processor. Joins data nodes with the 'collate' attribute."""
     tree = []
@@ -61,7 +69,7 @@ def root_html(*, nodes, attrs, context):
     return tree
 
 
-@rune("link")
+@rune("link", pure=True)
 def link_rune(*args, nodes, attrs, context):
     """Link text. Arguments are in the form [name] url."""
     text = "(none)"
@@ -72,7 +80,7 @@ def link_rune(*args, nodes, attrs, context):
     return [mkdata(text)]
 
 
-@rune("link", "html")
+@rune("link", "html", pure=True)
 def link_rune_html(*args, nodes, attrs, context):
     """A hyperlink. Arguments are in the form [name] url."""
     url = "#"
@@ -135,12 +143,12 @@ def code_rune_html(*args, nodes, attrs, context):
     return [mkdata("<code>")] + nodes + [mkdata("</code>")]
 
 
-@rune("small")
+@rune("small", pure=True)
 def small_rune(*args, nodes, attrs, context):
     """Does nothing to it's arguments"""
     return [mkdata(" ".join(args))]
 
-@rune("small", "html")
+@rune("small", "html", pure=True)
 def small_rune_html(*args, nodes, attrs, context):
     """Wraps it's arguments in <small> tags."""
     stext = html.escape(" ".join(args))
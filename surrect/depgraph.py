@@ -0,0 +1,171 @@
+"""
+depgraph - records what each summoned page depends on.
+
+For every output, the dependency graph keeps:
+ - source : the signature of the source file.
+ - nav : a digest of the category listings the page's navigation shows.
+ - refs : every reference the page resolved, as a (key path, result) pair.
+ - files : the signatures of files runes declared (see rune.depend).
+A page whose dependencies are all unchanged does not need to be summoned again.
+"""
+
+import json
+import hashlib
+import logging
+
+from os import makedirs, path, replace, walk
+
+from . import meta
+from .source import Category, Source, Link, path_signature
+
+
+log = logging.getLogger(__name__)
+
+
+def config_digest(cfg: dict, runedir: str) -> str:
+    """
+    Digest of everything that can change the output of any page:
+    the project configuration, rune files and the surrect version.
+    """
+    h = hashlib.sha1()
+    h.update(meta.version.encode("utf8"))
+    h.update(json.dumps(cfg, sort_keys=True).encode("utf8"))
+    for rpfx, rdirs, runes in walk(runedir):
+        rdirs.sort()
+        for rid in sorted(runes):
+            runepath = path.join(rpfx, rid)
+            h.update(repr((runepath, path_signature(runepath))).encode("utf8"))
+    return h.hexdigest()
+
+
+def listing_digest(cat: Category) -> str:
+    """Digest of everything navigation shows of a category's own listing."""
+    h = hashlib.sha1()
+    h.update(repr((cat.name, cat.toc)).encode("utf8"))
+    if cat.index is not None:
+        h.update(repr(("index", cat.index.destination)).encode("utf8"))
+    for ent in cat:
+        if isinstance(ent, Category):
+            index = ent.index.destination if ent.index is not None else None
+            h.update(repr(("category", ent.name, ent.toc, index)).encode("utf8"))
+        elif isinstance(ent, Source):
+            h.update(repr(("source", ent.name, ent.toc, ent.destination)).encode("utf8"))
+        elif isinstance(ent, Link):
+            h.update(repr(("link", ent.name, ent.toc, ent.ref)).encode("utf8"))
+    return h.hexdigest()
+
+
+def scope_digest(categories, digests: dict) -> str:
+    """
+    Combined digest of the listings of some categories.
+    digests memoises listing digests by category id.
+    """
+    h = hashlib.sha1()
+    for cat in categories:
+        key = id(cat)
+        if key not in digests:
+            digests[key] = listing_digest(cat)
+        h.update(digests[key].encode("utf8"))
+    return h.hexdigest()
+
+
+def signature(pth: str) -> list:
+    """path_signature of a path, in the form it takes once saved."""
+    sig = path_signature(pth)
+    return list(sig) if sig is not None else None
+
+
+class DependencyGraph:
+    """
+    Dependency records for a build, keyed by output path.
+    Records from the previous build are kept in previous,
+    records made during this build in current.
+    """
+    VERSION = 1
+
+    def __init__(self, config):
+        self.config = config
+        self.previous = {}
+        self.current = {}
+        self.digests = {}
+
+    @classmethod
+    def load(cls, graphpath: str, config: str) -> "DependencyGraph":
+        """
+        Load a dependency graph. Records are discarded if the graph was
+        made with a different configuration, as any page may have changed.
+        """
+        graph = cls(config)
+        try:
+            with open(graphpath, "r") as graphfile:
+                saved = json.load(graphfile)
+        except FileNotFoundError:
+            return graph
+        except ValueError as e:
+            log.warning("Ignoring unreadable dependency graph \"%s\": %s" % (graphpath, e))
+            return graph
+        if saved.get("version") == cls.VERSION and saved.get("config") == config:
+            graph.previous = saved["pages"]
+        return graph
+
+    def save(self, graphpath: str) -> None:
+        makedirs(path.dirname(graphpath) or ".", exist_ok=True)
+        tmppath = graphpath + ".tmp"
+        with open(tmppath, "w") as graphfile:
+            json.dump({
+                "version": self.VERSION,
+                "config": self.config,
+                "pages": self.current
+            }, graphfile)
+        replace(tmppath, graphpath)
+
+    def scope_digest(self, categories) -> str:
+        """Combined digest of the listings of some categories."""
+        return scope_digest(categories, self.digests)
+
+    def record(self, source: Source, nav: str=None, refs=(), files=()) -> None:
+        """
+        Record the dependencies of a summoned source.
+        nav is the digest of its navigation, if it has any.
+        """
+        self.current[source.destination] = {
+            "source": signature(source.source),
+            "nav": nav,
+            "refs": [[list(keys), str(target)] for keys, target in refs],
+            "files": {f: signature(f) for f in files}
+        }
+
+    def keep(self, source: Source) -> None:
+        """Carry over the previous record of a source that was not summoned."""
+        self.current[source.destination] = self.previous[source.destination]
+
+    def dirty(self, source: Source, nav: str, referencer, build_dir: str) -> bool:
+        """
+        Does a source need summoning? nav is the digest of its navigation,
+        referencer resolves the page's references.
+        """
+        rec = self.previous.get(source.destination)
+        if rec is None or not path.exists(path.join(build_dir, source.destination)):
+            return True
+        return self.changed(rec, source, nav, referencer)
+
+    @staticmethod
+    def changed(rec: dict, source: Source, nav: str, referencer) -> bool:
+        """Has the source, navigation, a file or a reference a record was made with changed?"""
+        if rec["source"] != signature(source.source) \
+                or rec["nav"] != nav:
+            return True
+        for f, sig in rec["files"].items():
+            if sig != signature(f):
+                return True
+        for keys, target in rec["refs"]:
+            try:
+                if str(referencer.resolve(keys)) != target:
+                    return True
+            except KeyError:
+                return True
+        return False
+
+    def stale(self):
+        """Output paths recorded by the previous build that this build didn't produce."""
+        return [dst for dst in self.previous if dst not in self.current]
@@ -0,0 +1,116 @@
+"""
+journal - checkpoints of a build in progress, so an interrupted build can resume.
+
+The journal is a file of JSON lines. The first holds the build's configuration
+digest, and each after it a summon that completed: its output path, source,
+renderer, the sha1 of the source and output, and the output's dependency record.
+Lines are buffered and written out every checkpoint interval. A resumed build
+skips summons whose source and output still have the journalled hashes.
+"""
+
+import json
+import logging
+
+from os import fsync, makedirs, path, remove
+from threading import Lock
+from time import monotonic
+
+from .pagecache import file_digest
+
+
+log = logging.getLogger(__name__)
+
+
+class Journal:
+    """
+    Journal of completed summons at jpath, for a build of config.
+    entries are the completed summons of the previous, interrupted, build.
+    """
+    VERSION = 1
+
+    def __init__(self, jpath: str, config: str, interval: float=10.0):
+        self.jpath = jpath
+        self.config = config
+        self.interval = interval
+        self.entries = {}
+        self.pending = []
+        self.lock = Lock()
+        self.jfile = None
+        self.flushed = monotonic()
+
+    @classmethod
+    def load(cls, jpath: str, config: str, interval: float=10.0) -> "Journal":
+        """
+        Load the journal of an interrupted build. Its entries are discarded if the
+        build had a different configuration. A torn last line is ignored.
+        """
+        journal = cls(jpath, config, interval)
+        try:
+            with open(jpath, "r") as jfile:
+                lines = jfile.read().splitlines()
+        except FileNotFoundError:
+            return journal
+        try:
+            header = json.loads(lines[0])
+        except (IndexError, ValueError):
+            log.warning("Ignoring unreadable journal \"%s\"" % jpath)
+            return journal
+        if header.get("version") != cls.VERSION or header.get("config") != config:
+            log.warning("Ignoring journal \"%s\" from a build with a different configuration" % jpath)
+            return journal
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            journal.entries[entry["dst"]] = entry
+        return journal
+
+    def completed(self, dst: str, source: str, renderer: str, build_dir: str) -> dict:
+        """The entry for a summon, if it completed and its source and output are unchanged."""
+        entry = self.entries.get(dst)
+        if entry is None or entry["source"] != source or entry["renderer"] != renderer:
+            return None
+        if file_digest(source) != entry["source_sha1"] \
+                or file_digest(path.join(build_dir, dst)) != entry["sha1"]:
+            return None
+        return entry
+
+    def start(self) -> None:
+        """Start journalling this build, replacing the file."""
+        makedirs(path.dirname(self.jpath) or ".", exist_ok=True)
+        self.jfile = open(self.jpath, "w")
+        self.jfile.write(json.dumps({"version": self.VERSION, "config": self.config}) + "\n")
+        self.checkpoint()
+
+    def add(self, entry: dict) -> None:
+        with self.lock:
+            self.pending.append(json.dumps(entry, sort_keys=True))
+        if monotonic() - self.flushed >= self.interval:
+            self.checkpoint()
+
+    def record(self, dst: str, source: str, renderer: str, build_dir: str, deps: dict=None) -> None:
+        """Journal a completed summon."""
+        self.add({
+            "dst": dst,
+            "source": source,
+            "renderer": renderer,
+            "source_sha1": file_digest(source),
+            "sha1": file_digest(path.join(build_dir, dst)),
+            "deps": deps
+        })
+
+    def checkpoint(self) -> None:
+        """Write out pending entries."""
+        with self.lock:
+            for line in self.pending:
+                self.jfile.write(line + "\n")
+            self.pending = []
+            self.jfile.flush()
+            fsync(self.jfile.fileno())
+            self.flushed = monotonic()
+
+    def finish(self) -> None:
+        """The build completed, so the journal is no longer needed."""
+        self.jfile.close()
+        remove(self.jpath)
@@ -0,0 +1,63 @@
+"""
+manifest - content hashes of every file in a build dir, and what changed.
+
+A manifest maps each output path, relative to the build dir, to the sha1
+of its contents. Saved manifests also list the paths added, modified and
+deleted since the manifest they replaced, so deploys need only touch those.
+"""
+
+import json
+import logging
+
+from os import makedirs, path, replace, walk
+
+
+log = logging.getLogger(__name__)
+
+
+def build_manifest(build_dir: str, digests) -> dict:
+    """Hash every file in a build dir, using a DigestCache."""
+    files = {}
+    for dpfx, dnames, fnames in walk(build_dir):
+        dnames.sort()
+        for fname in sorted(fnames):
+            pth = path.join(dpfx, fname)
+            files[path.relpath(pth, build_dir).replace(path.sep, "/")] = digests.digest(pth)
+    return files
+
+
+def diff_manifests(old: dict, new: dict):
+    """Returns the sorted (added, modified, deleted) paths between two manifests' files."""
+    added = sorted(p for p in new if p not in old)
+    modified = sorted(p for p in new if p in old and old[p] != new[p])
+    deleted = sorted(p for p in old if p not in new)
+    return added, modified, deleted
+
+
+def load_manifest(manpath: str) -> dict:
+    """Load the files of a saved manifest, or an empty dict if there isn't one."""
+    try:
+        with open(manpath, "r") as manfile:
+            return json.load(manfile)["files"]
+    except FileNotFoundError:
+        return {}
+    except (ValueError, KeyError) as e:
+        log.warning("Ignoring unreadable manifest \"%s\": %s" % (manpath, e))
+        return {}
+
+
+def save_manifest(manpath: str, files: dict, previous: dict) -> tuple:
+    """Save a manifest with the changes since a previous one. Returns the changes."""
+    added, modified, deleted = diff_manifests(previous, files)
+    makedirs(path.dirname(manpath) or ".", exist_ok=True)
+    tmppath = manpath + ".tmp"
+    with open(tmppath, "w") as manfile:
+        json.dump({
+            "files": files,
+            "added": added,
+            "modified": modified,
+            "deleted": deleted
+        }, manfile, indent=1, sort_keys=True)
+        manfile.write("\n")
+    replace(tmppath, manpath)
+    return added, modified, deleted
@@ -0,0 +1,213 @@
+"""
+output - where summoned files go.
+
+Renderers write through an Output, with paths relative to the build root:
+ - DirectoryOutput : files in a directory, the build dir.
+ - ArchiveOutput : members of a single zip or tar archive.
+ - MemoryOutput : a dict of paths to contents, or only their sizes.
+Pages are written as text, through open, and resources are copied in.
+Every output counts the files and bytes written to it.
+"""
+
+import io
+import time
+import tarfile
+import zipfile
+
+from os import makedirs, path, remove
+from threading import Lock
+
+from .util import copy_if_changed, settle, temp_path
+
+
+class Output:
+    """Base output, counting what is written."""
+    def __init__(self):
+        self.lock = Lock()
+        self.files = 0
+        self.bytes = 0
+
+    def count(self, size: int) -> None:
+        with self.lock:
+            self.files += 1
+            self.bytes += size
+
+    def open(self, dst: str):
+        """A text file to write dst with. It is committed when closed without error."""
+        return MemberFile(self, dst)
+
+    def copy(self, src: str, dst: str) -> None:
+        """Copy a file in as dst."""
+        with open(src, "rb") as srcfile:
+            self.commit(dst, srcfile.read())
+
+    def commit(self, dst: str, data: bytes) -> None:
+        """Store the complete contents of dst."""
+        raise NotImplementedError("commit not implemented.")
+
+    def close(self) -> None:
+        pass
+
+
+class MemberFile(io.TextIOWrapper):
+    """A text file buffered in memory, committed to an output when closed."""
+    def __init__(self, output: Output, dst: str):
+        super().__init__(io.BytesIO())
+        self.output = output
+        self.dst = dst
+        self.discard = False
+
+    def close(self):
+        if not self.closed:
+            self.flush()
+            if not self.discard:
+                self.output.commit(self.dst, self.buffer.getvalue())
+        super().close()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Don't commit half a file.
+        self.discard = exc_type is not None
+        return super().__exit__(exc_type, exc_value, traceback)
+
+
+class SettlingFile(io.TextIOWrapper):
+    """A text file written next to its destination, which replaces it when closed (see util.settle)."""
+    def __init__(self, output: "DirectoryOutput", pth: str):
+        self.tmppath = temp_path(pth)
+        super().__init__(open(self.tmppath, "wb"))
+        self.output = output
+        self.pth = pth
+        self.discard = False
+
+    def close(self):
+        if not self.closed:
+            super().close()
+            if self.discard:
+                remove(self.tmppath)
+            else:
+                self.output.count(path.getsize(self.tmppath))
+                settle(self.tmppath, self.pth)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.discard = exc_type is not None
+        return super().__exit__(exc_type, exc_value, traceback)
+
+
+class DirectoryOutput(Output):
+    """
+    Files under a root directory. Files are only replaced if their contents
+    change, so unchanged outputs keep their modification times.
+    """
+    def __init__(self, root: str):
+        super().__init__()
+        self.root = root
+
+    def path(self, dst: str) -> str:
+        pth = path.join(self.root, dst)
+        makedirs(path.dirname(pth), exist_ok=True)
+        return pth
+
+    def open(self, dst: str):
+        return SettlingFile(self, self.path(dst))
+
+    def copy(self, src: str, dst: str) -> None:
+        pth = self.path(dst)
+        copy_if_changed(src, pth)
+        self.count(path.getsize(pth))
+
+    def commit(self, dst: str, data: bytes) -> None:
+        pth = self.path(dst)
+        tmppath = temp_path(pth)
+        with open(tmppath, "wb") as f:
+            f.write(data)
+        self.count(len(data))
+        settle(tmppath, pth)
+
+    def __repr__(self):
+        return "DirectoryOutput({0})".format(repr(self.root))
+
+
+class ArchiveOutput(Output):
+    """
+    Members of a zip or tar archive, picked by the archive's extension:
+    .zip, .tar, .tar.gz, .tgz, .tar.bz2 or .tar.xz.
+    """
+    TAR_MODES = ((".tar.gz", "w:gz"), (".tgz", "w:gz"), (".tar.bz2", "w:bz2"),
+                 (".tar.xz", "w:xz"), (".tar", "w"))
+
+    def __init__(self, archpath: str):
+        super().__init__()
+        self.archpath = archpath
+        self.mtime = time.time()
+        makedirs(path.dirname(archpath) or ".", exist_ok=True)
+        if archpath.endswith(".zip"):
+            self.archive = zipfile.ZipFile(archpath, "w", zipfile.ZIP_DEFLATED)
+            self.tar = False
+        else:
+            for ext, mode in self.TAR_MODES:
+                if archpath.endswith(ext):
+                    break
+            else:
+                raise ValueError("Unknown archive type \"%s\"" % archpath)
+            self.archive = tarfile.open(archpath, mode)
+            self.tar = True
+
+    def commit(self, dst: str, data: bytes) -> None:
+        dst = dst.replace(path.sep, "/")
+        with self.lock:
+            if self.tar:
+                info = tarfile.TarInfo(dst)
+                info.size = len(data)
+                info.mtime = self.mtime
+                info.mode = 0o644
+                self.archive.addfile(info, io.BytesIO(data))
+            else:
+                info = zipfile.ZipInfo(dst, time.localtime(self.mtime)[:6])
+                info.compress_type = zipfile.ZIP_DEFLATED
+                info.external_attr = 0o644 << 16
+                self.archive.writestr(info, data)
+        self.count(len(data))
+
+    def close(self) -> None:
+        self.archive.close()
+
+    def __repr__(self):
+        return "ArchiveOutput({0})".format(repr(self.archpath))
+
+
+class MemoryOutput(Output):
+    """
+    Files kept in a dict of path to contents. If keep is False, only the
+    files and bytes written are counted, for measuring a build.
+    """
+    def __init__(self, keep: bool=True):
+        super().__init__()
+        self.keep = keep
+        self.contents = {}
+
+    def commit(self, dst: str, data: bytes) -> None:
+        if self.keep:
+            with self.lock:
+                self.contents[dst] = data
+        self.count(len(data))
+
+    def copy(self, src: str, dst: str) -> None:
+        if self.keep:
+            super().copy(src, dst)
+        else:
+            self.count(path.getsize(src))
+
+    def __repr__(self):
+        return "MemoryOutput(keep={0})".format(self.keep)
+
+
+def output_for(target: str, build_dir: str) -> Output:
+    """
+    The output for a --output target: None for the build dir,
+    "memory", which only measures the output, or an archive path.
+    """
+    if target is None:
+        return DirectoryOutput(build_dir)
+    if target == "memory":
+        return MemoryOutput(keep=False)
+    return ArchiveOutput(target)
@@ -0,0 +1,115 @@
+"""
+pagecache - content addressed cache of rendered pages, kept between builds.
+
+Each entry is keyed by a fingerprint of everything that goes into a page:
+the source text, the page context, its navigation, the renderer configuration,
+the rune files and the surrect version. Only file contents are hashed, never
+paths' modification times, so a cache restored into a fresh checkout still hits.
+An entry also holds the references the page resolved and the files its runes
+depended on, which are checked before the entry is used.
+"""
+
+import json
+import pickle
+import hashlib
+import logging
+
+from os import makedirs, path, replace, walk
+
+
+log = logging.getLogger(__name__)
+
+
+def file_digest(pth: str) -> str:
+    """sha1 of a file's contents, or None if it can't be read."""
+    h = hashlib.sha1()
+    try:
+        with open(pth, "rb") as f:
+            for chunk in iter(lambda: f.read(65536), b""):
+                h.update(chunk)
+    except OSError:
+        return None
+    return h.hexdigest()
+
+
+def rune_digest(runedir: str) -> str:
+    """Digest of the contents of every rune file in a directory."""
+    h = hashlib.sha1()
+    for rpfx, rdirs, runes in walk(runedir):
+        rdirs.sort()
+        for rid in sorted(runes):
+            runepath = path.join(rpfx, rid)
+            h.update(repr((path.relpath(runepath, runedir), file_digest(runepath))).encode("utf8"))
+    return h.hexdigest()
+
+
+class PageCache:
+    """
+    Rendered pages, stored under cachedir by fingerprint.
+    salt is mixed into every fingerprint, and should cover anything
+    shared by all pages, such as the rune files and surrect version.
+    """
+    VERSION = 2
+
+    def __init__(self, cachedir: str, salt: str=""):
+        self.cachedir = cachedir
+        self.salt = salt
+        self.hits = 0
+        self.misses = 0
+
+    def fingerprint(self, *parts) -> str:
+        """Fingerprint of some JSON serialisable parts. Other values are taken by repr."""
+        h = hashlib.sha1()
+        h.update(repr((self.VERSION, self.salt)).encode("utf8"))
+        h.update(json.dumps(parts, sort_keys=True, default=repr).encode("utf8"))
+        return h.hexdigest()
+
+    def entry_path(self, key: str) -> str:
+        return path.join(self.cachedir, key[:2], key)
+
+    def lookup(self, key: str, referencer) -> dict:
+        """
+        Find the entry for a fingerprint, as a dict of "data", "refs" and "files".
+        data is the text of the page.
+        referencer resolves references from the page, to check they still
+        lead to the same place. Returns None if there is no usable entry.
+        """
+        try:
+            with open(self.entry_path(key), "rb") as entfile:
+                entry = pickle.load(entfile)
+        except FileNotFoundError:
+            entry = None
+        except Exception as e:
+            log.warning("Ignoring unreadable page cache entry \"%s\": %s" % (key, e))
+            entry = None
+        if entry is None or not self.valid(entry, referencer):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    @staticmethod
+    def valid(entry: dict, referencer) -> bool:
+        for f, digest in entry["files"].items():
+            if file_digest(f) != digest:
+                return False
+        for keys, target in entry["refs"]:
+            try:
+                if str(referencer.resolve(keys)) != target:
+                    return False
+            except KeyError:
+                return False
+        return True
+
+    def store(self, key: str, data: str, refs=(), files=()) -> None:
+        """Store the text of a page, with the references and files it depended on."""
+        entpath = self.entry_path(key)
+        makedirs(path.dirname(entpath), exist_ok=True)
+        tmppath = entpath + ".tmp"
+        with open(tmppath, "wb") as entfile:
+            pickle.dump({
+                "data": data,
+                "refs": [(list(keys), str(target)) for keys, target in refs],
+                "files": {f: file_digest(f) for f in files}
+            }, entfile, protocol=pickle.HIGHEST_PROTOCOL)
+        replace(tmppath, entpath)
@@ -0,0 +1,149 @@
+"""
+pipeline - run items through stages on threads, connected by bounded queues.
+
+Each stage has its own queue and worker threads. While one item is being
+read from disk, the one before it can be inscribed and the one before that
+written out. Queues are bounded, so at most depth items wait for each stage.
+"""
+
+import logging
+
+from collections import namedtuple
+from queue import Queue
+from threading import Lock, Thread
+from time import perf_counter
+
+
+log = logging.getLogger(__name__)
+
+# Marks the end of the items, passed along from stage to stage.
+_DONE = object()
+
+StageStats = namedtuple("StageStats", ("name", "items", "busy", "idle", "blocked", "utilisation"))
+
+
+class Stage:
+    """
+    A step of a pipeline, func is called on every item and returns
+    the item to pass on. Time spent in func is busy, time spent waiting
+    for an item idle, and time spent waiting for room in the next queue blocked.
+    """
+    def __init__(self, name: str, func, workers: int=1, depth: int=8):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.queue = Queue(maxsize=max(1, depth))
+        self.lock = Lock()
+        self.active = 0
+        self.items = 0
+        self.busy = 0.0
+        self.idle = 0.0
+        self.blocked = 0.0
+
+    def account(self, items=0, busy=0.0, idle=0.0, blocked=0.0):
+        with self.lock:
+            self.items += items
+            self.busy += busy
+            self.idle += idle
+            self.blocked += blocked
+
+    def __repr__(self):
+        return "Stage({0}, workers={1})".format(repr(self.name), self.workers)
+
+
+class Pipeline:
+    """
+    Stages run in order on threads of their own. Items are put in with put,
+    close waits for every item to get through. If a stage raises, the rest of
+    the items are dropped and the exception is raised again by close.
+    May be used as a context manager, which closes the pipeline on exit.
+    """
+    def __init__(self, stages):
+        self.stages = list(stages)
+        self.threads = []
+        self.error = None
+        self.started = None
+        self.finished = None
+
+    def start(self) -> "Pipeline":
+        self.started = perf_counter()
+        for i, stage in enumerate(self.stages):
+            following = self.stages[i + 1] if i + 1 < len(self.stages) else None
+            stage.active = stage.workers
+            for n in range(stage.workers):
+                thread = Thread(target=self.work, args=(stage, following),
+                                name="{0}-{1}".format(stage.name, n), daemon=True)
+                thread.start()
+                self.threads.append(thread)
+        return self
+
+    def work(self, stage: Stage, following: Stage) -> None:
+        while True:
+            t0 = perf_counter()
+            item = stage.queue.get()
+            t1 = perf_counter()
+            if item is _DONE:
+                stage.account(idle=t1 - t0)
+                with stage.lock:
+                    stage.active -= 1
+                    last = stage.active == 0
+                if not last:
+                    # Let the other workers of this stage see it too.
+                    stage.queue.put(_DONE)
+                elif following is not None:
+                    following.queue.put(_DONE)
+                return
+            if self.error is not None:
+                # Drain, so nothing upstream waits forever.
+                continue
+            try:
+                item = stage.func(item)
+            except BaseException as e:
+                log.debug("Stage %s failed: %s" % (stage.name, e))
+                if self.error is None:
+                    self.error = e
+                continue
+            t2 = perf_counter()
+            blocked = 0.0
+            if following is not None:
+                following.queue.put(item)
+                blocked = perf_counter() - t2
+            stage.account(items=1, busy=t2 - t1, idle=t1 - t0, blocked=blocked)
+
+    def put(self, item) -> None:
+        """Feed an item to the first stage, raising early if a stage has failed."""
+        if self.error is not None:
+            raise self.error
+        self.stages[0].queue.put(item)
+
+    def close(self) -> None:
+        """Wait for every item to get through."""
+        if self.stages:
+            self.stages[0].queue.put(_DONE)
+        for thread in self.threads:
+            thread.join()
+        self.finished = perf_counter()
+        if self.error is not None:
+            raise self.error
+
+    def stats(self):
+        """A StageStats for each stage. Utilisation is busy time over wall time per worker."""
+        wall = (self.finished or perf_counter()) - (self.started or perf_counter())
+        return [StageStats(stage.name, stage.items, stage.busy, stage.idle, stage.blocked,
+                           stage.busy / (wall * stage.workers) if wall > 0 else 0.0)
+                for stage in self.stages]
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None and self.error is None:
+            # The feeder failed, drop what is still in flight.
+            self.error = exc_value
+            try:
+                self.close()
+            except BaseException:
+                pass
+            return False
+        self.close()
+        return False
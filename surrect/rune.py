@@ -3,19 +3,28 @@
 rune - module containing the rune decorator, rune registry and some built in runes.
 
 A rune is a python function that returns a list or tuple of 0 or more nodes.
+Runes may also be coroutine functions, for runes that wait on I/O. These are
+awaited one at a time by inscribe, or concurrently with their siblings by
+inscribe_async.
 
 All runes have a specific signature:
     function(args*, nodes=[list of nodes], attrs={set of attributes}, context={dict of context})
 If a rune function does not accept all of the required keyword args, it is wrapped.
 """
 
+import asyncio
 import inspect
 
-from collections import namedtuple
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from contextvars import ContextVar
 from enum import Enum
-from typing import List, Set, Sequence
+from threading import Lock
+from typing import Iterator, List, Set, Sequence
 
 from .registries import escape_lookup, escape, referencer
+from .scroll.parser import EVENT_ENTER, EVENT_LEAVE
 from .scroll.tree import ScrollNode, NODE_BLANK, NODE_RAW, NODE_ROOT, NODE_RUNE, NODE_NERU, NODE_HEADING, NODE_TEXT
 
 
@@ -25,6 +34,14 @@ def noop_rune(*args, nodes=None, context=None, attrs=None):
 
 
 runes = {None: {"noop": noop_rune}}
+# Rune functions whose output only depends on their arguments, attributes and nodes.
+pure_runes = set()
+# Collators root rune functions were registered with.
+root_collators = {}
+# Root rune functions that may be called for each run of top level nodes, see inscribe_iter.
+streaming_roots = set()
+# Set of files the runes being inscribed depend on, see depend.
+dependencies = ContextVar("dependencies", default=None)
 
 
 def argfilter(func, forbidden):
@@ -33,12 +50,20 @@ def argfilter(func, forbidden):
         for k in forbidden:
             if k in kwargs:
                 del kwargs[k]
-        return func(*args, *kwargs)
+        return func(*args, **kwargs)
     return wrapper
 
 
-def register(runeid, runetype, runefunc):
-    """Registers a rune function. Returns the rune function."""
+def register(runeid, runetype, runefunc, pure=False, collators=None, streams=False):
+    """
+    Registers a rune function. Returns the rune function.
+    A pure rune doesn't use its context or have side effects,
+    so its output may be reused for identical invocations (see RuneMemo).
+    A root rune may give collators (see scroll.tree.collate), if combining
+    adjacent top level nodes with them doesn't change its output.
+    A root rune streams if it treats runs of top level nodes independently,
+    so inscribe_iter may call it for each run rather than the whole page.
+    """
     sig = inspect.signature(runefunc)
     kset = {"nodes", "attrs", "context"}
     pset = set()
@@ -55,6 +80,23 @@ def register(runeid, runetype, runefunc):
     if runetype not in runes:
         runes[runetype] = {}
     runes[runetype][runeid] = runefunc
+    if pure:
+        pure_runes.add(runefunc)
+    if collators is not None:
+        root_collators[runefunc] = collators
+    if streams:
+        streaming_roots.add(runefunc)
+    return runefunc
+
+
+def unregister(runeid, runetype=None):
+    """Removes a registered rune function. Returns the rune function."""
+    runefunc = runes[runetype].pop(runeid)
+    if runetype is not None and not runes[runetype]:
+        del runes[runetype]
+    pure_runes.discard(runefunc)
+    root_collators.pop(runefunc, None)
+    streaming_roots.discard(runefunc)
     return runefunc
 
 
@@ -74,9 +116,35 @@ def describe():
             for rname, func in typedrunes.items()]
 
 
-def rune(runeid, runetype=None):
+def rune(runeid, runetype=None, pure=False, collators=None, streams=False):
     """Rune decorator function."""
-    return lambda runefunc: register(runeid, runetype, runefunc)
+    return lambda runefunc: register(runeid, runetype, runefunc, pure, collators, streams)
+
+
+def collators(runetype=None):
+    """The collators of the root rune for a type, or None if it can't be collated for."""
+    return root_collators.get(lookup("root", runetype))
+
+
+def depend(context, *paths):
+    """
+    Declares files a rune's output depends on,
+    so pages are summoned again when they change.
+    They are added to the set being recorded into, if any.
+    """
+    files = dependencies.get()
+    if files is not None:
+        files.update(paths)
+
+
+@contextmanager
+def recording(files: set):
+    """Within the with block, files runes declare they depend on are added to files."""
+    token = dependencies.set(files)
+    try:
+        yield files
+    finally:
+        dependencies.reset(token)
 
 
 def load(fpath):
@@ -84,6 +152,7 @@ def load(fpath):
     with open(fpath, "r") as src:
         runescope = {
             "rune": rune,
+            "depend": depend,
             "RuneNode": RuneNode,
             "RuneType": RuneType,
             # constructor/typecheck functions
@@ -108,6 +177,12 @@ def load(fpath):
 RuneNode = namedtuple("RuneNode", ("kind", "data", "nodes", "attributes"))
 RuneType = Enum("RuneType", ("RUNE", "NERU", "TEXT", "DATA", "NULL"))
 
+# Nodes that are replaced by what they evaluate to.
+REPLACED_KINDS = {RuneType.RUNE, RuneType.NERU, RuneType.TEXT}
+
+# How many coroutine runes inscribe_async awaits at once, by default.
+DEFAULT_CONCURRENCY = 8
+
 
 # Quick rune node constructors: mk[type]
 
@@ -169,8 +244,8 @@ def isnull(nod: RuneNode) -> bool:
     return nod.kind is RuneType.NULL
 
 
-def assemble(scroll_node: ScrollNode) -> RuneNode:
-    """Assembles a rune tree from a scroll tree."""
+def assemble_node(scroll_node: ScrollNode, nodes: List[RuneNode]) -> RuneNode:
+    """Assembles a single rune node from a scroll node, given its children."""
     attrs = set()
     if scroll_node.kind == NODE_TEXT:
         kind = RuneType.TEXT
@@ -199,38 +274,341 @@ def assemble(scroll_node: ScrollNode) -> RuneNode:
     else:
         kind = RuneType.NULL
         data = None
-    nodes = [assemble(sn) for sn in scroll_node.nodes]
     return RuneNode(kind, data, nodes, attrs)
 
 
-def inscribe(node: RuneNode, rtype: str, context: dict) -> List[RuneNode]:
+def assemble(scroll_node: ScrollNode) -> RuneNode:
+    """Assembles a rune tree from a scroll tree."""
+    return assemble_node(scroll_node, [assemble(sn) for sn in scroll_node.nodes])
+
+
+def assemble_iter(events) -> RuneNode:
+    """
+    Assembles a rune tree from scroll parser events (see scroll.iterparse).
+    The children of the returned root node are a generator,
+    assembling each top level subtree as it is completed.
+    Such a tree can only be consumed once, by inscribe_iter.
+    """
+    events = iter(events)
+    _, scroll_root = next(events)
+    return assemble_node(scroll_root, _assemble_events(events))
+
+
+def _assemble_events(events) -> Iterator[RuneNode]:
+    """Yields top level rune subtrees from scroll parser events."""
+    scope_stack = []
+    for event, scroll_node in events:
+        if event is EVENT_LEAVE:
+            if not scope_stack:
+                # Leaving the root.
+                return
+            node = scope_stack.pop()
+        else:
+            node = assemble_node(scroll_node, [])
+            if event is EVENT_ENTER:
+                scope_stack.append(node)
+                continue
+        if scope_stack:
+            scope_stack[-1].nodes.append(node)
+        else:
+            yield node
+
+
+def copy_nodes(nodes: List[RuneNode]) -> List[RuneNode]:
+    """
+    Copy a node list, down to the node lists and attribute sets of every node.
+    Data nodes without children are final, so they are shared rather than copied.
+    """
+    return [n if n.kind is RuneType.DATA and not n.nodes else
+            RuneNode(n.kind, n.data, None if n.nodes is None else copy_nodes(n.nodes), set(n.attributes))
+            for n in nodes]
+
+
+def nodes_key(nodes: List[RuneNode]) -> tuple:
+    """
+    A flat, hashable record of the kind, data and attributes of every node
+    in a node list, depth first. Equal for structurally equal lists.
+    """
+    key = []
+    scope = [(0, n) for n in reversed(nodes)]
+    while scope:
+        depth, n = scope.pop()
+        key.append((depth, n.kind, n.data, frozenset(n.attributes)))
+        if n.nodes:
+            scope.extend((depth + 1, child) for child in reversed(n.nodes))
+    return tuple(key)
+
+
+class RuneMemo:
+    """
+    Bounded LRU cache of the output of pure runes, shared between pages
+    and the threads they are summoned on. Calls are keyed by the rune
+    function, its arguments, the node's attributes and its child nodes,
+    which are already inscribed when a rune is called. Output is copied
+    in and out, as inscription rewrites node lists in place.
+    A maxsize of 0 disables the memo.
+    """
+    def __init__(self, maxsize: int=4096):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, runefunc, rargs, node: RuneNode):
+        """The key for a call, or None if it can't be cached."""
+        if self.maxsize <= 0 or runefunc not in pure_runes:
+            return None
+        key = (runefunc, rargs, frozenset(node.attributes), nodes_key(node.nodes) if node.nodes else ())
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def get(self, key) -> List[RuneNode]:
+        with self.lock:
+            result = self.entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return copy_nodes(result)
+
+    def put(self, key, result: List[RuneNode]) -> None:
+        result = copy_nodes(result)
+        with self.lock:
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def hit_rate(self) -> float:
+        calls = self.hits + self.misses
+        return self.hits / calls if calls else 0.0
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+memo = RuneMemo(0)
+
+
+class LoopRunner:
+    """
+    Runs coroutines to completion for synchronous code, all on one event loop,
+    which is created when first needed. If the calling thread is already
+    running a loop, the runner's loop runs on a thread of its own.
+    Use one runner per inscription, and close it when done.
+    """
+    def __init__(self):
+        self.loop = None
+        self.executor = None
+
+    def run(self, awaitable):
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                pass
+            else:
+                self.executor = ThreadPoolExecutor(max_workers=1)
+        if self.executor is not None:
+            return self.executor.submit(self.loop.run_until_complete, _awaited(awaitable)).result()
+        return self.loop.run_until_complete(_awaited(awaitable))
+
+    def close(self):
+        if self.loop is None:
+            return
+        try:
+            self.run(self.loop.shutdown_asyncgens())
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
+            self.loop.close()
+            self.loop = self.executor = None
+
+
+def call(runefunc, rargs, node: RuneNode, context: dict, runner: LoopRunner=None) -> List[RuneNode]:
+    """
+    Call a rune function for a node. Coroutine runes are run to completion
+    by runner, or a runner of their own. Pure runes are called through the memo.
+    """
+    key = memo.key(runefunc, rargs, node)
+    if key is not None:
+        result = memo.get(key)
+        if result is not None:
+            return result
+    result = runefunc(*rargs, nodes=node.nodes, attrs=node.attributes, context=context)
+    if inspect.isawaitable(result):
+        if runner is None:
+            with closing(LoopRunner()) as own:
+                result = own.run(result)
+        else:
+            result = runner.run(result)
+    if key is not None:
+        memo.put(key, result)
+    return result
+
+
+async def _awaited(awaitable):
+    return await awaitable
+
+
+def inscribe_nodes(nodes: List[RuneNode], rtype: str, context: dict, runner: LoopRunner=None) -> None:
+    """
+    Inscribe a list of sibling nodes in place.
+    Runes are allowed to evaluate to 0 -> n arbitrary nodes.
+    Other nodes may only evaluate to themselves.
+    As runes can produce runes, they need to be reevaluated.
+    """
+    i = 0
+    while i < len(nodes):
+        if nodes[i].kind in REPLACED_KINDS:
+            nodes[i:i+1] = inscribe(nodes[i], rtype, context, runner)
+        else:
+            inscribe(nodes[i], rtype, context, runner)
+            i += 1
+
+
+def inscribe(node: RuneNode, rtype: str, context: dict, runner: LoopRunner=None) -> List[RuneNode]:
     """
     Inscribe all runes in a tree.
     This function works by rewriting sections of the tree
     with the output of rune functions.
     Note that the rune function can return rune nodes - this allows
     for both loops and recursion and should be used with care.
+    Coroutine runes are run by runner, or one runner for the whole tree.
     """
+    if runner is None:
+        with closing(LoopRunner()) as runner:
+            return inscribe(node, rtype, context, runner)
     nodes = node.nodes
     if node.kind is RuneType.NERU:
         rid, rargs = node.data
-        runefunc = lookup(rid, rtype)
-        return runefunc(*rargs, nodes=nodes, attrs=node.attributes, context=context)
-    i = 0
-    while i < len(nodes):
-        # Runes are allowed to evaluate to 0 -> n arbitrary nodes.
-        # Other nodes may only evaluate to themselves.
-        # As runes can produce runes, they need to be reevaluated.
-        if nodes[i].kind in {RuneType.RUNE, RuneType.NERU, RuneType.TEXT}:
-            nodes[i:i+1] = inscribe(nodes[i], rtype, context)
-        else:
-            inscribe(nodes[i], rtype, context)
-            i += 1
+        return call(lookup(rid, rtype), rargs, node, context, runner)
+    inscribe_nodes(nodes, rtype, context, runner)
     if node.kind is RuneType.RUNE:
         rid, rargs = node.data
-        runefunc = lookup(rid, rtype)
-        return runefunc(*rargs, nodes=nodes, attrs=node.attributes, context=context)
+        return call(lookup(rid, rtype), rargs, node, context, runner)
     if node.kind is RuneType.TEXT:
         escfunc = escape_lookup(rtype)
         escdata = escfunc(node.data, context=context)
         return [RuneNode(RuneType.DATA, escdata, node.nodes, node.attributes)]
+
+
+async def call_async(runefunc, rargs, node: RuneNode, context: dict,
+                     limit: asyncio.Semaphore) -> List[RuneNode]:
+    """Call a rune function for a node, awaiting coroutine runes within a limit."""
+    key = memo.key(runefunc, rargs, node)
+    if key is not None:
+        result = memo.get(key)
+        if result is not None:
+            return result
+    result = runefunc(*rargs, nodes=node.nodes, attrs=node.attributes, context=context)
+    if inspect.isawaitable(result):
+        async with limit:
+            result = await result
+    if key is not None:
+        memo.put(key, result)
+    return result
+
+
+async def inscribe_nodes_async(nodes: List[RuneNode], rtype: str, context: dict,
+                               limit: asyncio.Semaphore) -> None:
+    """
+    Inscribe a list of sibling nodes in place, like inscribe_nodes.
+    Siblings are inscribed concurrently, in rounds: the nodes runes
+    evaluate to are spliced in and inscribed in the next round.
+    """
+    final = [False] * len(nodes)
+    while not all(final):
+        todo = [i for i, f in enumerate(final) if not f]
+        results = await asyncio.gather(*(inscribe_async(nodes[i], rtype, context, limit) for i in todo))
+        # Splice from the end, so earlier indices stay valid.
+        for i, result in reversed(list(zip(todo, results))):
+            if nodes[i].kind in REPLACED_KINDS:
+                nodes[i:i+1] = result
+                final[i:i+1] = [False] * len(result)
+            else:
+                final[i] = True
+
+
+async def inscribe_async(node: RuneNode, rtype: str, context: dict,
+                         limit: asyncio.Semaphore=None) -> List[RuneNode]:
+    """
+    Inscribe all runes in a tree, like inscribe, running sibling runes concurrently.
+    At most limit coroutine runes are awaited at once. Rune functions that are not
+    coroutines still run one at a time, but siblings may run in any order.
+    """
+    if limit is None:
+        limit = asyncio.Semaphore(DEFAULT_CONCURRENCY)
+    nodes = node.nodes
+    if node.kind is RuneType.NERU:
+        rid, rargs = node.data
+        return await call_async(lookup(rid, rtype), rargs, node, context, limit)
+    await inscribe_nodes_async(nodes, rtype, context, limit)
+    if node.kind is RuneType.RUNE:
+        rid, rargs = node.data
+        return await call_async(lookup(rid, rtype), rargs, node, context, limit)
+    if node.kind is RuneType.TEXT:
+        escfunc = escape_lookup(rtype)
+        escdata = escfunc(node.data, context=context)
+        return [RuneNode(RuneType.DATA, escdata, node.nodes, node.attributes)]
+
+
+async def _inscribe_runs(nodes: List[RuneNode], rtype: str, context: dict, concurrency: int):
+    """Inscribe each node as a list of its own, concurrently. Returns the lists."""
+    limit = asyncio.Semaphore(concurrency)
+    runs = [[child] for child in nodes]
+    await asyncio.gather(*(inscribe_nodes_async(run, rtype, context, limit) for run in runs))
+    return runs
+
+
+def inscribe_iter(node: RuneNode, rtype: str, context: dict, concurrency: int=None) -> Iterator[RuneNode]:
+    """
+    Inscribe a rune tree, yielding finished data nodes in document order.
+    Top level nodes are inscribed one at a time. If the root rune streams
+    (see register), they are handed to it in runs ending with a childless
+    node that is not collated (e.g. a blank line or a heading), as soon as
+    such a run is complete. Other root runes are called once, for the whole tree.
+    If concurrency is given, the whole tree is inscribed up front by
+    inscribe_async, with at most that many coroutine runes awaited at once.
+    Coroutine runes all run on one event loop, for the whole inscription.
+    """
+    rid, rargs = node.data
+    runefunc = lookup(rid, rtype)
+    streams = runefunc in streaming_roots
+    with closing(LoopRunner()) as runner:
+        if concurrency is None:
+            runs = (_inscribed([child], rtype, context, runner) for child in node.nodes)
+        else:
+            runs = runner.run(_inscribe_runs(node.nodes, rtype, context, concurrency))
+        flushed = False
+        pending = []
+        for run in runs:
+            pending += run
+            if streams and pending and len(pending[-1].nodes) == 0 \
+                    and "collate" not in pending[-1].attributes:
+                yield from _data_nodes(call(runefunc, rargs, node._replace(nodes=pending), context, runner))
+                flushed = True
+                pending = []
+        if pending or not flushed:
+            yield from _data_nodes(call(runefunc, rargs, node._replace(nodes=pending), context, runner))
+
+
+def _inscribed(nodes: List[RuneNode], rtype: str, context: dict, runner: LoopRunner) -> List[RuneNode]:
+    inscribe_nodes(nodes, rtype, context, runner)
+    return nodes
+
+
+def _data_nodes(nodes: List[RuneNode]) -> Iterator[RuneNode]:
+    """Filter an inscribed node list down to nodes carrying output."""
+    for node in nodes:
+        if type(node.data) is str:
+            yield node
@@ -56,7 +56,8 @@ Catfiles have the from:
 from collections import namedtuple
 from . import lexer, parser, tree
 from .lexer import lex
-from .parser import parse
+from .tree import collate
+from .parser import parse, iterparse, itercollate, EVENT_ENTER, EVENT_LEAVE, EVENT_LEAF
 from .util import interpret_bool, interpret_str, interpret_strlist
 
 # Functions for lexing/parsing 'catfiles'.
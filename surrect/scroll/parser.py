@@ -5,7 +5,7 @@ scroll.parser:
 from .lexer import TOKEN_BLANK, TOKEN_COMMENT, TOKEN_HEADING, \
     TOKEN_INDENT, TOKEN_RAW, TOKEN_RUNE, TOKEN_NERU, TOKEN_TEXT
 from .tree import ScrollNode, NODE_ROOT, NODE_RUNE, NODE_NERU,\
-    NODE_RAW, NODE_HEADING, NODE_TEXT, NODE_BLANK
+    NODE_RAW, NODE_HEADING, NODE_TEXT, NODE_BLANK, DEFAULT_COLLATORS, join_nodes
 
 
 # Map of tokens to corresponding nodes.
@@ -19,15 +19,29 @@ NODE_TOKEN_MAP = {
 }
 
 
-def parse(tokens):
-    """Parse a series of tokens into a scroll tree."""
+# Parser event symbols
+EVENT_ENTER = "<enter>"
+EVENT_LEAVE = "<leave>"
+EVENT_LEAF = "<leaf>"
+
+
+def iterparse(tokens):
+    """
+    Parse a series of tokens into a series of (event, node) pairs.
+    A node that has children is bracketed by an enter and a leave event,
+    all other nodes produce a single leaf event. The first event enters
+    the root node, the last leaves it.
+    Nodes are yielded without their children attached.
+    """
     indent = 0
     prev_indent = 0
     root = ScrollNode(NODE_ROOT, None)
-    scope_stack = []
-    scope_cur = root
+    scope_stack = [root]
+    # The previous node is held back until it is known
+    # whether it opens a scope or not.
     prev_node = root
 
+    yield EVENT_ENTER, root
     for toksym, tokval in tokens:
         # Determine indentation level.
         if toksym is TOKEN_INDENT:
@@ -36,7 +50,6 @@ def parse(tokens):
             continue
 
         # Construct a node from a token symbol, if possible.
-        node = None
         if toksym not in NODE_TOKEN_MAP:
             continue
 
@@ -45,21 +58,71 @@ def parse(tokens):
         if node.kind is NODE_BLANK:
             # Blank nodes should not affect the scope.
             indent = prev_indent
+            if prev_node is not root:
+                yield EVENT_LEAF, prev_node
 
         elif indent > prev_indent:
-            # Push current scope to the scope stack.
-            scope_stack.append(scope_cur)
-            scope_cur = prev_node
-
-        elif indent < prev_indent:
-            # Pop from the scope stack.
-            scope_cur = scope_stack.pop()
+            # Push the previous node to the scope stack.
+            if prev_node is not root:
+                yield EVENT_ENTER, prev_node
+            scope_stack.append(prev_node)
 
-        if node is not None:
-            scope_cur.nodes.append(node)
-            prev_node = node
+        else:
+            if prev_node is not root:
+                yield EVENT_LEAF, prev_node
+            if indent < prev_indent:
+                # Pop from the scope stack.
+                scope = scope_stack.pop()
+                if scope is not scope_stack[-1]:
+                    yield EVENT_LEAVE, scope
 
+        prev_node = node
         prev_indent = indent
         indent = 0
 
+    if prev_node is not root:
+        yield EVENT_LEAF, prev_node
+    while scope_stack:
+        scope = scope_stack.pop()
+        if not scope_stack or scope is not scope_stack[-1]:
+            yield EVENT_LEAVE, scope
+
+
+def itercollate(events, collators=DEFAULT_COLLATORS):
+    """
+    Collate a series of parser events (see iterparse) as tree.collate
+    collates a tree: adjacent childless nodes of the root with the same
+    kind, if it has a collator, are combined into one leaf event.
+    """
+    depth = 0
+    run = []
+    for event, node in events:
+        if depth == 1 and event is EVENT_LEAF and node.kind in collators:
+            if run and node.kind is not run[0].kind:
+                yield EVENT_LEAF, join_nodes(run, collators)
+                run = []
+            run.append(node)
+            continue
+        if run:
+            yield EVENT_LEAF, join_nodes(run, collators)
+            run = []
+        if event is EVENT_ENTER:
+            depth += 1
+        elif event is EVENT_LEAVE:
+            depth -= 1
+        yield event, node
+
+
+def parse(tokens):
+    """Parse a series of tokens into a scroll tree."""
+    scope_stack = []
+    for event, node in iterparse(tokens):
+        if event is EVENT_LEAF:
+            scope_stack[-1].nodes.append(node)
+        elif event is EVENT_ENTER:
+            if scope_stack:
+                scope_stack[-1].nodes.append(node)
+            scope_stack.append(node)
+        elif event is EVENT_LEAVE:
+            root = scope_stack.pop()
     return root
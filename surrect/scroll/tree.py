@@ -105,18 +105,27 @@ def collate(root, collators=DEFAULT_COLLATORS):
     and each value is a string, function pair.
     The string being the joining string (see str.join) and the function
     turning a given node into a string.
+    Only adjacent childless nodes of the root are combined.
     """
-    nodegen = iter(root.nodes)
+    nodes = root.nodes
     root.nodes = []
-
-    node = next(nodegen, None)
-    while node is not None:
-        root.nodes.append(node)
-        if node.kind in collators:
-            adjns = [node]
-            next_node = collect_nodes(node.kind, adjns, nodegen)
-            jc, fn = collators[node.kind]
-            node.value = jc.join(fn(n.value) for n in adjns)
+    run = []
+    for node in nodes:
+        if run and (node.kind is not run[0].kind or node.nodes):
+            root.nodes.append(join_nodes(run, collators))
+            run = []
+        if node.kind in collators and not node.nodes:
+            run.append(node)
         else:
-            next_node = next(nodegen, None)
-        node = next_node
+            root.nodes.append(node)
+    if run:
+        root.nodes.append(join_nodes(run, collators))
+
+
+def join_nodes(run, collators):
+    """Combines a run of nodes of one kind into the first of them."""
+    node = run[0]
+    if len(run) > 1:
+        jc, fn = collators[node.kind]
+        node.value = jc.join(fn(n.value) for n in run)
+    return node
@@ -0,0 +1,159 @@
+"""
+serve - preview a project over HTTP, summoning pages as they are requested.
+
+The category tree is built and the rituals conducted up front, as navigation
+and references need them, but no page is summoned until it is asked for.
+Summoned pages are kept in an LRU cache. Every check interval, the signatures
+of the project's directories, catfiles, sources and rune files are checked,
+and if any have changed the project is loaded again and the cache dropped.
+"""
+
+import pickle
+import logging
+import mimetypes
+
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from os import path, walk
+from threading import Lock
+from time import monotonic
+from urllib.parse import unquote, urlsplit
+
+from . import rune
+from .output import MemoryOutput
+from .source import CategorySnapshot, SourceType, category_build, path_signature
+from .summon import load_renderers, load_globmap, globmap_sources_to_renderers
+
+
+log = logging.getLogger(__name__)
+
+
+def rune_signatures(runedir: str) -> dict:
+    """Signatures of every rune file in a directory."""
+    signatures = {}
+    for rpfx, rdirs, runes in walk(runedir):
+        for rid in runes:
+            runepath = path.join(rpfx, rid)
+            if runepath.endswith(".py"):
+                signatures[runepath] = path_signature(runepath)
+    return signatures
+
+
+class Site:
+    """
+    A project loaded for previewing. load_runes is called with the rune dir
+    whenever rune files need loading. Pages are fetched with get.
+    """
+    def __init__(self, cfg: dict, load_runes, cache_size: int=256, check_interval: float=1.0):
+        self.cfg = cfg
+        self.load_runes = load_runes
+        self.cache_size = cache_size
+        self.check_interval = check_interval
+        self.lock = Lock()
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.listings = None
+        self.load()
+
+    def load(self) -> None:
+        summon_cfg = self.cfg["summon"]
+        cat_root = summon_cfg["root dir"]
+        runedir = summon_cfg["rune dir"]
+
+        self.runes = rune_signatures(runedir)
+        self.load_runes(runedir)
+        rune.memo.clear()
+
+        self.output = MemoryOutput()
+        renderers = load_renderers(self.cfg["renderers"], summon_cfg["build dir"],
+                                   summon_cfg.get("context", {}).copy())
+        for renderer in renderers.values():
+            renderer.set_opt(output=self.output)
+
+        # Listings are copied, so the rituals don't change the ones reused next time.
+        snapshot = CategorySnapshot(cat_root)
+        if self.listings is not None:
+            snapshot.listings = pickle.loads(self.listings)
+        self.tree = category_build(cat_root, snapshot=snapshot)
+        self.listings = pickle.dumps(snapshot.current, protocol=pickle.HIGHEST_PROTOCOL)
+        self.signature = {}
+        for listing in snapshot.current.values():
+            self.signature.update(listing.signature)
+
+        self.pages = {}
+        globmap = load_globmap(summon_cfg["map"])
+        for source, renderer in globmap_sources_to_renderers(self.tree.sources(), globmap, renderers):
+            renderer.ritual(source)
+            self.pages[source.destination.replace(path.sep, "/")] = (source, renderer)
+        self.cache.clear()
+        self.checked = monotonic()
+
+    def changed(self) -> bool:
+        """Has anything the project was loaded from changed?"""
+        return rune_signatures(self.cfg["summon"]["rune dir"]) != self.runes \
+            or any(path_signature(p) != sig for p, sig in self.signature.items())
+
+    def refresh(self) -> None:
+        """Load the project again if it has changed, checking at most every check interval."""
+        if monotonic() - self.checked < self.check_interval:
+            return
+        if self.changed():
+            log.info("Project changed, reloading.")
+            self.load()
+        self.checked = monotonic()
+
+    def get(self, dst: str) -> bytes:
+        """The contents of an output path, or None if there is no such output."""
+        with self.lock:
+            self.refresh()
+            if dst in self.cache:
+                self.hits += 1
+                self.cache.move_to_end(dst)
+                return self.cache[dst]
+            if dst in self.output.contents:
+                # Written while summoning another page, e.g. shared navigation.
+                return self.output.contents[dst]
+            if dst not in self.pages:
+                return None
+            self.misses += 1
+            source, renderer = self.pages[dst]
+            renderer.summon(source, self.tree)
+            data = self.output.contents.pop(dst)
+            if source.kind is SourceType.SCROLL:
+                self.cache[dst] = data
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+            return data
+
+
+class SiteRequestHandler(BaseHTTPRequestHandler):
+    """Serves the pages of the server's site."""
+    def do_GET(self):
+        dst = unquote(urlsplit(self.path).path).lstrip("/")
+        if dst == "" or dst.endswith("/"):
+            dst += "index.html"
+        try:
+            data = self.server.site.get(dst)
+        except Exception:
+            log.exception("Summoning \"%s\" failed" % dst)
+            self.send_error(500)
+            return
+        if data is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", mimetypes.guess_type(dst)[0] or "application/octet-stream")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        log.info(format % args)
+
+
+def serve(site: Site, bind: str, port: int) -> HTTPServer:
+    """An HTTP server for a site, which is yet to be started with serve_forever."""
+    server = HTTPServer((bind, port), SiteRequestHandler)
+    server.site = site
+    return server
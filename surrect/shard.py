@@ -0,0 +1,178 @@
+"""
+shard - split a build between machines, and merge the results.
+
+Every shard builds the whole category tree and conducts every ritual, so
+navigation and references are complete, but only summons the sources
+whose relative path hashes to it. Each shard writes a record of what it
+was responsible for into its output, which merge uses to check that the
+shards fit together and that nothing is missing.
+"""
+
+import json
+import hashlib
+import logging
+import tarfile
+import zipfile
+
+from os import path, walk
+
+from . import meta
+from .pagecache import rune_digest
+
+
+log = logging.getLogger(__name__)
+
+RECORD_FORMAT = ".surrect-shard-{0}-of-{1}.json"
+
+
+def parse_shard(spec: str) -> tuple:
+    """Parse a "K/N" shard spec, with 1 <= K <= N."""
+    k, _, n = spec.partition("/")
+    try:
+        k, n = int(k), int(n)
+    except ValueError:
+        raise ValueError("shard must be given as K/N, not \"%s\"" % spec)
+    if not 1 <= k <= n:
+        raise ValueError("shard %d/%d is out of range" % (k, n))
+    return k, n
+
+
+def shard_of(relpath: str, shards: int) -> int:
+    """The shard, from 1 to shards, a source belongs to. Stable between machines and runs."""
+    digest = hashlib.sha1(relpath.replace(path.sep, "/").encode("utf8")).digest()
+    return int.from_bytes(digest[:8], "big") % shards + 1
+
+
+def site_digest(cfg: dict, runedir: str, relpaths) -> str:
+    """
+    Digest of what all shards of a build must agree on: the configuration, rune
+    files, surrect version and set of sources. Only contents are hashed.
+    """
+    h = hashlib.sha1()
+    h.update(meta.version.encode("utf8"))
+    h.update(json.dumps(cfg, sort_keys=True).encode("utf8"))
+    h.update(rune_digest(runedir).encode("utf8"))
+    for relpath in sorted(p.replace(path.sep, "/") for p in relpaths):
+        h.update(relpath.encode("utf8") + b"\0")
+    return h.hexdigest()
+
+
+def write_record(output, shard: int, shards: int, digest: str, total: int, outputs) -> None:
+    """Write a shard's record into its output."""
+    with output.open(RECORD_FORMAT.format(shard, shards)) as recfile:
+        json.dump({
+            "shard": shard,
+            "shards": shards,
+            "site": digest,
+            "total": total,
+            "outputs": sorted(dst.replace(path.sep, "/") for dst in outputs)
+        }, recfile, indent=1)
+        recfile.write("\n")
+
+
+def is_record(name: str) -> bool:
+    return name.startswith(".surrect-shard-") and name.endswith(".json") and "/" not in name
+
+
+def read_shard(shardpath: str):
+    """Yields (path, contents) for every file in a shard's output, a directory or archive."""
+    if path.isdir(shardpath):
+        for dpfx, dnames, fnames in walk(shardpath):
+            dnames.sort()
+            for fname in sorted(fnames):
+                pth = path.join(dpfx, fname)
+                with open(pth, "rb") as f:
+                    yield path.relpath(pth, shardpath).replace(path.sep, "/"), f.read()
+    elif zipfile.is_zipfile(shardpath):
+        with zipfile.ZipFile(shardpath) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    yield info.filename, archive.read(info)
+    else:
+        with tarfile.open(shardpath) as archive:
+            for member in archive:
+                if member.isfile():
+                    yield member.name, archive.extractfile(member).read()
+
+
+def read_record(shardpath: str) -> dict:
+    """Find the record in a shard's output. Raises ValueError if there isn't exactly one."""
+    if path.isdir(shardpath):
+        # Records are at the root, so there's no need to read everything.
+        records = []
+        for name in sorted(next(walk(shardpath))[2]):
+            if is_record(name):
+                with open(path.join(shardpath, name), encoding="utf8") as recfile:
+                    records.append(json.load(recfile))
+    else:
+        records = [json.loads(data.decode("utf8")) for name, data in read_shard(shardpath) if is_record(name)]
+    if len(records) != 1:
+        raise ValueError("\"%s\" has %d shard records, not 1" % (shardpath, len(records)))
+    return records[0]
+
+
+def check_records(records: dict) -> list:
+    """
+    Check shard records, given by shard path, fit together.
+    Returns a list of problems, empty if there are none.
+    """
+    problems = []
+    recs = list(records.values())
+    shards = {rec["shards"] for rec in recs}
+    sites = {rec["site"] for rec in recs}
+    if len(shards) > 1:
+        problems.append("shards disagree on the number of shards: %s" % sorted(shards))
+    if len(sites) > 1:
+        problems.append("shards were built from different configurations, runes or sources")
+    if problems:
+        return problems
+    n = shards.pop()
+    seen = {}
+    for shardpath, rec in records.items():
+        if rec["shard"] in seen:
+            problems.append("shard %d/%d appears twice, in \"%s\" and \"%s\""
+                            % (rec["shard"], n, seen[rec["shard"]], shardpath))
+        seen[rec["shard"]] = shardpath
+    missing = [k for k in range(1, n + 1) if k not in seen]
+    if missing:
+        problems.append("missing shard%s %s of %d"
+                        % ("s" if len(missing) > 1 else "", ", ".join(map(str, missing)), n))
+    elif sum(len(rec["outputs"]) for rec in recs) != recs[0]["total"]:
+        problems.append("shards summoned %d sources, not %d"
+                        % (sum(len(rec["outputs"]) for rec in recs), recs[0]["total"]))
+    return problems
+
+
+def merge_shards(shardpaths, output) -> tuple:
+    """
+    Merge shard outputs into an output. Files written by more than one shard,
+    such as shared navigation, must be identical.
+    Returns a dict of merged path to sha1, and a list of problems.
+    """
+    records = {}
+    for shardpath in shardpaths:
+        try:
+            records[shardpath] = read_record(shardpath)
+        except (ValueError, OSError) as e:
+            return {}, [str(e)]
+    problems = check_records(records)
+    if problems:
+        return {}, problems
+
+    files = {}
+    for shardpath, rec in records.items():
+        outputs = set(rec["outputs"])
+        for name, data in read_shard(shardpath):
+            if is_record(name):
+                continue
+            outputs.discard(name)
+            digest = hashlib.sha1(data).hexdigest()
+            if name in files:
+                if files[name] != digest:
+                    problems.append("\"%s\" differs between shards" % name)
+                continue
+            files[name] = digest
+            output.commit(name, data)
+        for name in sorted(outputs):
+            problems.append("\"%s\" is missing from shard %d (\"%s\")" % (name, rec["shard"], shardpath))
+    return files, problems
@@ -1,6 +1,10 @@
-from collections import OrderedDict
+import pickle
+import logging
+
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
 from collections.abc import MutableMapping
-from os import listdir, path
+from os import listdir, makedirs, path, replace, stat
 
 from enum import Enum
 from typing import Tuple, Callable
@@ -8,6 +12,9 @@ from typing import Tuple, Callable
 from . import scroll
 
 
+log = logging.getLogger(__name__)
+
+
 def parse_scroll_metadata(lexer, metadata):
     """
     Metadata exists as series of special comments, each starting with
@@ -42,17 +49,46 @@ def scrape_scroll_metadata(lexer, metadata):
     yield from lexer
 
 
+def read_scroll_header(source, metadata, chunk_size=4096):
+    """
+    Reads metadata from the leading comment block of a scroll file,
+    in chunks of chunk_size characters, without lexing it.
+    Reading stops at the first line that isn't an unindented comment,
+    which gives the same metadata as parse_scroll_metadata.
+    """
+    buf = ""
+    searched = 0
+    while True:
+        end = buf.find("\n", searched)
+        if end < 0:
+            chunk = source.read(chunk_size)
+            if chunk:
+                # Don't search the start of a long line again.
+                searched = len(buf)
+                buf += chunk
+                continue
+            if not buf:
+                break
+            line, buf = buf, ""
+        else:
+            line, buf = buf[:end], buf[end + 1:]
+            searched = 0
+        if not line.startswith("#"):
+            break
+        # Metadata comments start with three hashes.
+        elif line.startswith("###"):
+            key, _, value = line[3:].partition(":")
+            metadata[key.strip()] = value.strip()
+    return metadata
+
+
 def read_scroll_metadata(scrpath: str) -> dict:
     """
     Read metadata from a scroll file.
-    Uses parse_scroll_metadata to do so.
+    Uses read_scroll_header to do so.
     """
-    metadata = {}
     with open(scrpath, "r") as source:
-        lexer = scroll.lexer.lex(source)
-        parse_scroll_metadata(lexer, metadata)
-        lexer.close()
-    return metadata
+        return read_scroll_header(source, {})
 
 
 def category_load(catpath: str) -> dict:
@@ -117,7 +153,33 @@ def category_scan(catcfg: dict) -> None:
 
 
 class Entity:
-    __slots__ = ("name", "toc")
+    __slots__ = ("name", "toc", "parent")
+
+    def __getstate__(self):
+        # Entities are pickled without their parent,
+        # they are given one when added to a category.
+        return None, {slot: getattr(self, slot)
+                      for cls in type(self).__mro__
+                      for slot in getattr(cls, "__slots__", ())
+                      if slot != "parent" and hasattr(self, slot)}
+
+    def ancestors(self):
+        """Yields the categories containing this entity, innermost first."""
+        cat = getattr(self, "parent", None)
+        while cat is not None:
+            yield cat
+            if cat.parent is cat:
+                break
+            cat = cat.parent
+
+    def location(self) -> tuple:
+        """The tuple of names leading from the root category to this entity."""
+        names = []
+        ent = self
+        while ent.parent is not None and ent.parent is not ent:
+            names.append(ent.name)
+            ent = ent.parent
+        return tuple(reversed(names))
 
 
 SourceType = Enum("SourceType", ("SCROLL", "RESOURCE"))
@@ -127,6 +189,7 @@ class Source(Entity):
     __slots__ = ("kind", "source", "destination", "metadata")
 
     def __init__(self, kind, name, toc, source, destination, metadata, relsrc=None):
+        self.parent = None
         self.kind = kind
         self.toc = toc
         self.source = source
@@ -162,6 +225,7 @@ class Link(Entity):
     __slots__ = ("ref",)
 
     def __init__(self, name, toc, ref):
+        self.parent = None
         self.toc = toc
         self.ref = ref
         if name is None:
@@ -178,8 +242,19 @@ class Link(Entity):
         )
 
 
+class UnknownPath(KeyError):
+    """A path of names that leads to nothing in a category tree."""
+    def __str__(self):
+        return self.args[0]
+
+
 class Category(Entity, MutableMapping):
-    __slots__ = ("index", "parent", "entities")
+    """
+    A category of entities. Every category keeps a flat index of the entities
+    below it, by path, and a list of its sources. Both are built when first
+    needed, and dropped by the category and its ancestors whenever one changes.
+    """
+    __slots__ = ("index", "entities", "path_index", "source_list")
 
     def __init__(self, name):
         self.name = name
@@ -187,6 +262,8 @@ class Category(Entity, MutableMapping):
         self.index = None
         self.parent = self
         self.entities = OrderedDict()
+        self.path_index = None
+        self.source_list = None
 
     def __str__(self):
         if self.name is not None:
@@ -207,6 +284,8 @@ class Category(Entity, MutableMapping):
         else:
             if isinstance(val, Entity):
                 self.entities[key] = val
+                val.parent = self
+                self.changed()
             else:
                 raise TypeError("Cannot assign non-entity to a category key.")
         return val
@@ -222,6 +301,7 @@ class Category(Entity, MutableMapping):
             self.parent = self
         else:
             del self.entities[key]
+            self.changed()
 
     def __len__(self):
         return len(self.entities)
@@ -232,24 +312,100 @@ class Category(Entity, MutableMapping):
     def add(self, ent: Entity):
         if ent.name is not None:
             self.entities[ent.name] = ent
+            ent.parent = self
+            self.changed()
         else:
             raise ValueError("category entities cannot be anonymous")
 
-    def sources(self):
+    def changed(self):
+        """Drop the path index and source list of this category and its ancestors."""
+        cat = self
+        while True:
+            cat.path_index = cat.source_list = None
+            if cat.parent is cat:
+                break
+            cat = cat.parent
+
+    def paths(self) -> dict:
+        """Every entity below this category, by the tuple of names leading to it."""
+        if self.path_index is None:
+            # Subcategories aren't indexed along the way, which would multiply memory use by depth.
+            index = {}
+            scope = [((), self)]
+            while scope:
+                prefix, cat = scope.pop()
+                for key, entity in cat.entities.items():
+                    index[prefix + (key,)] = entity
+                    if isinstance(entity, Category):
+                        scope.append((prefix + (key,), entity))
+            self.path_index = index
+        return self.path_index
+
+    def lookup(self, keys) -> Entity:
+        """
+        The entity at a path of names, given as a sequence or a "/" separated string.
+        Raises UnknownPath if there is none.
+        """
+        if isinstance(keys, str):
+            keys = tuple(keys.split("/"))
+        else:
+            keys = tuple(str(key) for key in keys)
+        ent = self.paths().get(keys)
+        if ent is not None:
+            return ent
+        # Not indexed, so walk the path, which may go through "..".
+        ent = self
+        for i, key in enumerate(keys):
+            try:
+                if not isinstance(ent, Category):
+                    raise KeyError(key)
+                ent = ent[key]
+            except KeyError:
+                raise UnknownPath("No \"%s\" in \"%s\", looking up \"%s\""
+                                  % (key, "/".join(keys[:i]) or "[root]", "/".join(keys)))
+        return ent
+
+    def walk_sources(self):
+        """Yields every source below this category, walking the tree."""
         if isinstance(self.index, Source):
             yield self.index
         for entity in self.entities.values():
             if isinstance(entity, Category):
-                yield from entity.sources()
+                yield from entity.walk_sources()
             elif isinstance(entity, Source):
                 yield entity
 
+    def sources(self):
+        if self.source_list is None:
+            self.source_list = list(self.walk_sources())
+        return iter(self.source_list)
+
 
-def category_build(catroot: str, catpath: str=None, name: str=None) -> Category:
-    root = False
-    if catpath is None:
-        root = True
-        catpath = catroot
+CategoryListing = namedtuple("CategoryListing", ("name", "index", "entries", "signature"))
+CategoryListing.__doc__ = """
+The contents of a single category, as read from the filesystem.
+entries holds entities, with subcategories left as "subcat" CatEntry tuples
+holding absolute paths. signature maps every path the listing was built
+from to its path_signature.
+"""
+
+
+def path_signature(pth: str) -> Tuple[int, int]:
+    """Returns the (mtime, size) of a path, or None if it doesn't exist."""
+    try:
+        st = stat(pth)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def category_list(catroot: str, catpath: str, mapper=map) -> CategoryListing:
+    """
+    Reads the contents of a category, without descending into subcategories.
+    Scroll metadata is read with mapper, which can be swapped
+    for a parallel map function.
+    """
+    signature = {catpath: path_signature(catpath)}
 
     # Get the category configuration.
     catcfg = category_load(catpath)
@@ -257,47 +413,183 @@ def category_build(catroot: str, catpath: str=None, name: str=None) -> Category:
         category_scan(catcfg)
     catpath = catcfg["catpath"]
     exclude = catcfg["exclude"]
+    signature[catpath] = path_signature(catpath)
+    cfpath = path.join(catpath, "cat")
+    signature[cfpath] = path_signature(cfpath)
 
-    # The category object.
-    cat = Category(None if root else name or catcfg["name"])
-
+    # Work out the entries first, so scroll metadata can be read in one go.
+    index = None
+    planned = []
     if catcfg["index"] is not None:
         srcpath = path.abspath(path.join(catpath, catcfg["index"]))
-        relpath = path.relpath(srcpath, start=catroot)
-
+        signature[srcpath] = path_signature(srcpath)
         if path.exists(srcpath):
-            metadata = read_scroll_metadata(srcpath)
-            srcent = Source(SourceType.SCROLL, None, False,
-                            srcpath, relpath, metadata)
-            cat.index = srcent
+            planned.append(("index", None, srcpath))
             exclude.add(catcfg["index"])
 
     for ent in catcfg["entries"]:
         # Category and scroll paths are all relative to their directory.
         srcpath = path.abspath(path.join(catpath, ent.path))
-        relpath = path.relpath(srcpath, start=catroot)
 
         if ent.path in exclude:
             # Nothing to do.
             continue
-        if ent.kind == "subcat":
-            sco = category_build(catroot, srcpath, ent.name)
+        if ent.kind != "subcat":
+            signature[srcpath] = path_signature(srcpath)
+        if ent.kind == "subcat" or ent.kind == "link" or path.exists(srcpath):
+            planned.append((ent.kind, ent, srcpath))
+
+    scrolls = [srcpath for kind, _, srcpath in planned
+               if kind == "index" or kind == "page" or kind == "secret"]
+    metadata = dict(zip(scrolls, mapper(read_scroll_metadata, scrolls)))
+
+    entries = []
+    for kind, ent, srcpath in planned:
+        relpath = path.relpath(srcpath, start=catroot)
+        if kind == "index":
+            index = Source(SourceType.SCROLL, None, False,
+                           srcpath, relpath, metadata[srcpath])
+        elif kind == "subcat":
+            entries.append(scroll.CatEntry(kind, ent.name, srcpath))
+        elif kind == "page" or kind == "secret":
+            entries.append(Source(SourceType.SCROLL, ent.name, True if kind != "secret" else False,
+                                  srcpath, relpath, metadata[srcpath], ent.path))
+        elif kind == "asis" or kind == "resource":
+            entries.append(Source(SourceType.RESOURCE, ent.name, True if kind != "resource" else False,
+                                  srcpath, relpath, None, ent.path))
+        elif kind == "link":
+            entries.append(Link(ent.name, True, ent.path))
+        else:
+            # Print a warning?
+            continue
+    return CategoryListing(catcfg["name"], index, entries, signature)
+
+
+class CategorySnapshot:
+    """
+    A saved category tree, kept as one listing per category path.
+    A listing is reused by category_build while the signatures of all
+    the paths it was built from are unchanged.
+    """
+    VERSION = 1
+
+    def __init__(self, catroot: str):
+        self.catroot = path.abspath(catroot)
+        self.listings = {}
+        self.current = {}
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def load(cls, snappath: str, catroot: str) -> "CategorySnapshot":
+        """Load a snapshot, returning an empty one if it is missing or unusable."""
+        snapshot = cls(catroot)
+        try:
+            with open(snappath, "rb") as snapfile:
+                version, snaproot, listings = pickle.load(snapfile)
+        except FileNotFoundError:
+            return snapshot
+        except Exception as e:
+            log.warning("Ignoring unreadable category snapshot \"%s\": %s" % (snappath, e))
+            return snapshot
+        if version == cls.VERSION and snaproot == snapshot.catroot:
+            snapshot.listings = listings
+        return snapshot
+
+    def save(self, snappath: str) -> None:
+        """Save the listings recorded during the last build."""
+        makedirs(path.dirname(snappath) or ".", exist_ok=True)
+        tmppath = snappath + ".tmp"
+        with open(tmppath, "wb") as snapfile:
+            pickle.dump((self.VERSION, self.catroot, self.current), snapfile,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        replace(tmppath, snappath)
+
+    def lookup(self, catpath: str) -> CategoryListing:
+        """Find an up to date listing for a category path."""
+        listing = self.listings.get(catpath)
+        if listing is not None and all(path_signature(p) == sig
+                                       for p, sig in listing.signature.items()):
+            return listing
+        return None
+
+    def record(self, catpath: str, listing: CategoryListing) -> None:
+        """Record the listing used for a category path in this build."""
+        if self.listings.get(catpath) is listing:
+            self.hits += 1
+        else:
+            self.misses += 1
+        self.current[catpath] = listing
+
+
+class SerialExecutor(Executor):
+    """Executor that runs everything as it is submitted."""
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+
+def category_fetch(catroot: str, catpath: str, snapshot: "CategorySnapshot",
+                   dirs: Executor, reads: Executor):
+    """
+    Gets the listing for a category path, from a snapshot or the filesystem,
+    and submits fetches for its subcategories to dirs without waiting on them.
+    Metadata reads go to reads, which must be a different executor.
+    Returns the listing, and a list of futures for its subcategories.
+    """
+    listing = None
+    if snapshot is not None:
+        listing = snapshot.lookup(catpath)
+    if listing is None:
+        listing = category_list(catroot, catpath, reads.map)
+    subcats = [dirs.submit(category_fetch, catroot, ent.path, snapshot, dirs, reads)
+               for ent in listing.entries if isinstance(ent, scroll.CatEntry)]
+    return listing, subcats
+
+
+def category_assemble(catpath: str, fetched: Future, name: str,
+                      snapshot: "CategorySnapshot", root: bool=False) -> Category:
+    """Builds a category tree from fetched listings, in listing order."""
+    listing, subcats = fetched.result()
+    if snapshot is not None:
+        snapshot.record(catpath, listing)
+
+    # The category object.
+    cat = Category(None if root else name or listing.name)
+    cat.index = listing.index
+    if cat.index is not None:
+        cat.index.parent = cat
+
+    subcats = iter(subcats)
+    for ent in listing.entries:
+        if isinstance(ent, scroll.CatEntry):
+            sco = category_assemble(ent.path, next(subcats), ent.name, snapshot)
             # Set parent category reference.
             sco.parent = cat
             cat.add(sco)
-        elif (ent.kind == "page" or ent.kind == "secret") \
-                and path.exists(srcpath):
-            metadata = read_scroll_metadata(srcpath)
-            cat.add(Source(SourceType.SCROLL, ent.name, True if ent.kind != "secret" else False,
-                           srcpath, relpath, metadata, ent.path))
-        elif (ent.kind == "asis" or ent.kind == "resource") \
-                and path.exists(srcpath):
-            cat.add(Source(SourceType.RESOURCE, ent.name, True if ent.kind != "resource" else False,
-                           srcpath, relpath, None, ent.path))
-        elif ent.kind == "link":
-            cat.add(Link(ent.name, True, ent.path))
         else:
-            # Print a warning?
-            continue
+            cat.add(ent)
     return cat
 
+
+def category_build(catroot: str, snapshot: CategorySnapshot=None, workers: int=1) -> Category:
+    """
+    Builds a category tree from a directory.
+    If a snapshot is given, unchanged categories are taken from it,
+    and every category used is recorded in it.
+    Note that snapshots must be saved before the tree is modified.
+    With more than one worker, categories are listed and scroll metadata is
+    read on thread pools; the tree is the same as a serial build.
+    """
+    if workers > 1:
+        dirs = ThreadPoolExecutor(workers)
+        reads = ThreadPoolExecutor(workers)
+    else:
+        dirs = reads = SerialExecutor()
+    with dirs, reads:
+        fetched = dirs.submit(category_fetch, catroot, catroot, snapshot, dirs, reads)
+        return category_assemble(catroot, fetched, None, snapshot, root=True)
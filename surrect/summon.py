@@ -1,25 +1,68 @@
 """summon: Core surrect logic."""
 
 import sys
+import json
 import codecs
+import hashlib
+import logging
 
-from os import path, makedirs
+from io import StringIO
+from os import path
+from collections import ChainMap
 from functools import partial
-from shutil import copyfile
+from threading import Lock
 from fnmatch import fnmatch
 
 from . import scroll
 from . import registries
 from . import rune
+from .assets import fingerprinted
+from .depgraph import scope_digest
+from .pagecache import file_digest
 from .source import Category, Source, SourceType, Link
+from .template import Template
+from .output import DirectoryOutput
 from .util import path_attributes, brace_expand
 
 
+log = logging.getLogger(__name__)
+
+
 def get_outfunc_msg(colour=sys.stdout.isatty()):
     u8f = codecs.getwriter("utf8")(sys.stderr.buffer, "replace")
     return partial(print, "\033[35m⛧ \033[0m" if colour else "⛧ ", flush=True, file=u8f)
 
 
+def navigation_expanded(catpath: tuple, ancestors: set, depth: int) -> bool:
+    """
+    Is the listing of a category, given by its path of names, shown by navigation?
+    The root has the empty path. ancestors is None or a set of paths of
+    categories to expand, depth is None or the deepest level to expand.
+    """
+    return not catpath or ((ancestors is None or catpath in ancestors)
+                           and (depth is None or len(catpath) <= depth))
+
+
+def navigation_ancestors(current: Source, expand: str) -> set:
+    """The ancestors argument for navigation_expanded."""
+    if expand == "ancestors":
+        return {cat.location() for cat in current.ancestors()}
+    return None
+
+
+def navigation_scope(cat: Category, current: Source, expand="all", depth=None):
+    """Yields every category whose listing navigation shows for a source."""
+    ancestors = navigation_ancestors(current, expand)
+    scope = [(cat, cat.location())]
+    while scope:
+        cat, catpath = scope.pop()
+        yield cat
+        for ent in cat:
+            if ent.toc and isinstance(ent, Category) \
+                    and navigation_expanded(catpath + (ent.name,), ancestors, depth):
+                scope.append((ent, catpath + (ent.name,)))
+
+
 def gen_navigation_renderer(wrap_init_func,
                             wrap_fini_func,
                             nav_init_func,
@@ -31,11 +74,24 @@ def gen_navigation_renderer(wrap_init_func,
                             lnk_func,
                             curlnk_func,
                             escape_func,
-                            ref_func):
-    def navigation_render(cat: Category, current: Source, ctx, function_entry=True):
-        ctx = ctx.copy()
+                            ref_func,
+                            expand="all",
+                            depth=None):
+    """
+    Generates a navigation renderer.
+    With expand set to "ancestors", only the categories containing the
+    current source have their listings shown, and depth limits how many
+    levels of categories below the root are shown.
+    """
+    def navigation_render(cat: Category, current: Source, ctx, function_entry=True,
+                          catpath=None, ancestors=None):
+        # Each level writes into its own layer.
+        ctx = ctx.new_child() if isinstance(ctx, ChainMap) else ChainMap({}, ctx)
         if function_entry:
+            catpath = cat.location()
+            ancestors = navigation_ancestors(current, expand)
             yield wrap_init_func(ctx)
+        expanded = navigation_expanded(catpath, ancestors, depth)
         entrywrap = bool(cat.name)
         if entrywrap:
             ctx["name"] = cat.name
@@ -44,6 +100,8 @@ def gen_navigation_renderer(wrap_init_func,
                 yield idxcat_func(ctx)
             else:
                 yield cat_func(ctx)
+            if not expanded:
+                return
             yield nav_init_func(ctx)
         for ent in cat:
             if not ent.toc:
@@ -52,7 +110,8 @@ def gen_navigation_renderer(wrap_init_func,
                 yield ent_init_func(ctx)
             # If we encounter a category here, recurse into it.
             if isinstance(ent, Category):
-                yield from navigation_render(ent, current, ctx, function_entry=False)
+                yield from navigation_render(ent, current, ctx, function_entry=False,
+                                             catpath=catpath + (ent.name,), ancestors=ancestors)
             else:
                 name = escape_func(ent.name, context=ctx)
                 ctx["name"] = name
@@ -74,6 +133,45 @@ def gen_navigation_renderer(wrap_init_func,
     return navigation_render
 
 
+# Navigation template keys and their defaults,
+# in the order gen_navigation_renderer takes them.
+NAV_TEMPLATES = (
+    ("start", ""),
+    ("end", ""),
+    ("entry list start", ""),
+    ("entry list end", ""),
+    ("entry start", ""),
+    ("entry end", ""),
+    ("category", "{name}\n"),
+    ("indexed category", "{name} ({ref})\n"),
+    ("link", "{name} ({ref})\n"),
+    ("current link", "{name} ({ref})\n")
+)
+
+
+# Default references to shared navigation fragments, by format. Formats
+# without one have no way to include a fragment, so need a reference configured.
+# The html fragment is given the current page after the "#", and its head marks
+# the link to it as the current link. Its links open in the page, not the frame.
+SHARED_NAV_REFERENCES = {
+    "html": "<iframe class=\"navigation\" src=\"{navref}#{curref}\" title=\"Navigation\"></iframe>\n"
+}
+SHARED_NAV_HEADS = {
+    "html": "\n".join([
+        "<base target=\"_top\">",
+        "<script>",
+        "document.addEventListener(\"DOMContentLoaded\", function () {",
+        "    var current = decodeURIComponent(location.hash.slice(1));",
+        "    document.querySelectorAll(\"a\").forEach(function (a) {",
+        "        if (a.getAttribute(\"href\") === current) a.classList.add(\"curlnk\");",
+        "    });",
+        "});",
+        "</script>",
+        ""
+    ])
+}
+
+
 renderers = {}
 
 
@@ -90,50 +188,161 @@ def renderer_lookup(rendid):
 
 
 class Referencer:
-    def __init__(self, cat, current, ref_func):
+    """
+    Resolves references from the current source, as ref[a][b][c] or ref["a/b/c"].
+    Paths are looked up in the category's path index, so each level is a
+    single dict lookup. A path that leads nowhere raises UnknownPath.
+    If given a record list, resolved references are appended
+    to it as (key path, result) pairs.
+    """
+    def __init__(self, cat, current, ref_func, record=None, keys=()):
         self.cat = cat
         self.current = current
         self.ref_func = ref_func
+        self.record = record
+        self.keys = keys
 
     def __getitem__(self, key):
-        return RecursiveReferencer(self.cat, self.current, self.ref_func)[key]
-
-
-class RecursiveReferencer(Referencer):
-    def __getitem__(self, key):
-        ent = self.cat[key]
+        # str.format passes digit only indexes as ints.
+        key = str(key)
+        keys = self.keys + (key,)
+        paths = self.cat.paths()
+        if keys not in paths and "/" in key:
+            keys = self.keys + tuple(key.split("/"))
+        ent = paths.get(keys)
+        return self.reference(keys, ent if ent is not None else self.cat.lookup(keys))
+
+    def resolve(self, keys):
+        """Resolve a whole key path at once."""
+        keys = tuple(str(key) for key in keys)
+        return self.reference(keys, self.cat.lookup(keys))
+
+    def reference(self, keys, ent):
         if isinstance(ent, Category):
-            self.cat = ent
-            return self
+            return Referencer(self.cat, self.current, self.ref_func, self.record, keys)
         elif isinstance(ent, Source):
-            return self.ref_func(ent, self.current)
+            ref = self.ref_func(ent, self.current)
         elif isinstance(ent, Link):
-            return ent.ref
+            ref = ent.ref
+        else:
+            return None
+        if self.record is not None:
+            self.record.append((keys, ref))
+        return ref
+
+SUMMON_STAGES = ("read", "parse", "assemble", "inscribe", "write")
+
+# Keys that summon adds to the page context.
+SUMMON_KEYS = {"ref"}
+
+
+class Summoning:
+    """A source on its way through the stages of a summon."""
+    __slots__ = ("source", "catroot", "ctx", "refs", "files", "data", "key", "cached")
+
+    def __init__(self, source, catroot):
+        self.source = source
+        self.catroot = catroot
+        self.ctx = None
+        self.refs = []
+        self.files = set()
+        self.data = None
+        # Page cache fingerprint, and whether data is a cached page.
+        self.key = None
+        self.cached = False
+
 
 class Renderer:
     def __init__(self, build_dir, root_context, fmt):
         self.build_dir = build_dir
-        self.context = root_context.copy()
+        # Renderer context is layered over the root context, which is shared.
+        self.context = ChainMap({}, root_context)
         self.fmt = fmt
         self.context["type"] = self.fmt
         # Default options:
         self.noop = False
         self.force = False
-
-    def set_opt(self, noop=None, force=None):
+        self.stream = False
+        self.depgraph = None
+        self.rune_concurrency = None
+        self.page_cache = None
+        self.digests = None
+        self.output = DirectoryOutput(build_dir)
+
+    def set_opt(self, noop=None, force=None, stream=None, depgraph=None, rune_concurrency=None,
+                page_cache=None, digests=None, output=None):
         if noop is not None:
             self.noop = noop
         if force is not None:
             self.force = force
+        if stream is not None:
+            self.stream = stream
+        if depgraph is not None:
+            self.depgraph = depgraph
+        if rune_concurrency is not None:
+            self.rune_concurrency = rune_concurrency
+        if page_cache is not None:
+            self.page_cache = page_cache
+        if digests is not None:
+            self.digests = digests
+        if output is not None:
+            self.output = output
+
+    def referencer(self, source, catroot, record=None):
+        """Returns a Referencer for references made by a source."""
+        return Referencer(catroot, source, registries.referencer_lookup(self.fmt), record)
 
     def ritual(self, source):
         """Prep step"""
         pass
 
+    def check(self, source):
+        """
+        Check a source that has been through a ritual can be summoned.
+        Returns a list of (template name, [missing keys]) pairs.
+        """
+        return []
+
+    def nav_digest(self, source, catroot):
+        """Digest of the navigation a source's output includes, if any."""
+        return None
+
+    def extra_outputs(self, source):
+        """Paths summoning a source writes besides its destination."""
+        return []
+
     def summon(self, source, catroot):
         """Output step"""
         raise NotImplementedError("summon not implemented.")
 
+    def conclude(self):
+        """Called once every source has been summoned."""
+        pass
+
+    # A summon can also be done in stages, so a pipeline can overlap the
+    # stages of different sources. begin returns a job, which each stage
+    # takes and returns. By default, the write stage does the whole summon.
+
+    def begin(self, source, catroot):
+        """Start a staged summon of a source."""
+        return Summoning(source, catroot)
+
+    def summon_read(self, job):
+        return job
+
+    def summon_parse(self, job):
+        return job
+
+    def summon_assemble(self, job):
+        return job
+
+    def summon_inscribe(self, job):
+        return job
+
+    def summon_write(self, job):
+        self.summon(job.source, job.catroot)
+        return job
+
 
 @renderer("site")
 class SiteRenderer(Renderer):
@@ -152,26 +361,54 @@ class SiteRenderer(Renderer):
         self.page_comp = cfg.get("page composition", ["main", "nav"])
         self.running_blocks = {}
         for name, block in cfg.get("running blocks", {}).items():
-            if isinstance(block, str):
-                self.running_blocks[name] = block
-            else:
+            if not isinstance(block, str):
                 # If the running block is not a string, join on a newline.
-                self.running_blocks[name] = "\n".join(block)
+                block = "\n".join(block)
+            self.running_blocks[name] = Template(block)
         nav = cfg.get("nav", {})
+        self.nav_expand = nav.get("expand", "all")
+        self.nav_depth = nav.get("depth")
+        self.nav_templates = [Template(nav.get(key, default)) for key, default in NAV_TEMPLATES]
         self.nav_renderer = gen_navigation_renderer(
-            nav.get("start", "").format_map,
-            nav.get("end", "").format_map,
-            nav.get("entry list start", "").format_map,
-            nav.get("entry list end", "").format_map,
-            nav.get("entry start", "").format_map,
-            nav.get("entry end", "").format_map,
-            nav.get("category", "{name}\n").format_map,
-            nav.get("indexed category", "{name} ({ref})\n").format_map,
-            nav.get("link", "{name} ({ref})\n").format_map,
-            nav.get("current link", "{name} ({ref})\n").format_map,
+            *self.nav_templates,
             registries.escape_lookup(self.fmt),
-            registries.referencer_lookup(self.fmt)
+            registries.referencer_lookup(self.fmt),
+            self.nav_expand,
+            self.nav_depth
         )
+        self.nav_digests = {}
+        self.listing_digests = {}
+        self.cfg_digest = hashlib.sha1(json.dumps(cfg, sort_keys=True).encode("utf8")).hexdigest()
+        # Shared navigation: rendered once per output directory into a
+        # fragment file, which pages reference instead of inlining.
+        shared = nav.get("shared")
+        self.nav_shared_path = None
+        if shared is not None:
+            self.nav_shared_path = shared.get("path", "{dir}nav" + path.extsep + self.fmt)
+            if "reference" not in shared and self.fmt not in SHARED_NAV_REFERENCES:
+                raise ValueError("Shared navigation in format \"%s\" needs a \"reference\"." % self.fmt)
+            self.nav_shared_ref = Template(shared.get("reference", SHARED_NAV_REFERENCES.get(self.fmt)))
+            # Written at the start of each fragment, by default only if it's embedded by the default reference.
+            self.nav_shared_head = shared.get("head", "" if "reference" in shared
+                                              else SHARED_NAV_HEADS.get(self.fmt, ""))
+            # Fragments are shared between pages, so only have the renderer context.
+            for (key, _), template in zip(NAV_TEMPLATES, self.nav_templates):
+                keys = [k for k in template.missing(self.context) if k not in {"name", "ref"}]
+                if keys:
+                    raise ValueError("Shared navigation \"%s\" uses %s, which fragments don't have."
+                                     % (key, ", ".join(keys)))
+        self.nav_fragments = {}
+        self.nav_lock = Lock()
+        # Keys runes add to the page context while summoning, which check can't see.
+        self.rune_keys = set(cfg.get("rune keys", []))
+        # Fingerprinting: content hashes in resource names, and a manifest of them.
+        fingerprint = cfg.get("fingerprint")
+        self.fingerprint = None
+        if fingerprint:
+            self.fingerprint = fingerprint if isinstance(fingerprint, dict) else {}
+        self.assets = {}
+        # Parse time collation of top level text and raw lines, where the root rune allows it.
+        self.collate = cfg.get("collate", False)
 
     @staticmethod
     def path_fmt_mapping(fmap, source):
@@ -185,51 +422,255 @@ class SiteRenderer(Renderer):
         source.destination = fmt.format_map(source.metadata)
 
     def ritual(self, source):
-        ctx = self.context.copy()
-        ctx.update(source.metadata)
-        path_attributes(source.destination, ctx)
-        source.metadata = ctx
+        # The page's own layer, over the renderer context.
+        page = path_attributes(source.destination, dict(source.metadata))
+        source.metadata = self.context.new_child(page)
         self.path_fmt(source)
-
-    def summon(self, source, catroot):
-        srcpath = source.source
-        dstpath = path.join(self.build_dir, source.destination)
-
-        source.metadata["ref"] = Referencer(
-            catroot, source,
-            registries.referencer_lookup(self.fmt)
-        )
-
-        if self.noop:
-            # TODO: more granular handling.
+        if self.fingerprint is not None and source.kind is SourceType.RESOURCE:
+            self.fingerprint_resource(source)
+
+    def fingerprint_resource(self, source):
+        """
+        Put a digest of a resource's contents in its destination.
+        The "include" and "exclude" globs of the fingerprint configuration pick
+        resources by destination, "length" is the number of hex digits used.
+        """
+        dst = source.destination
+        if not any(fnmatch(dst, glob) for glob in self.fingerprint.get("include", ["*"])) \
+                or any(fnmatch(dst, glob) for glob in self.fingerprint.get("exclude", [])):
+            return
+        digest = self.digests.digest(source.source) if self.digests is not None \
+            else file_digest(source.source)
+        source.destination = fingerprinted(dst, digest, self.fingerprint.get("length", 8))
+        self.assets[dst] = source.destination
+
+    def conclude(self):
+        """Writes the asset manifest, if fingerprinting with one."""
+        manifest = self.fingerprint.get("manifest") if self.fingerprint is not None else None
+        if manifest is None:
             return
+        with self.output.open(manifest) as manfile:
+            json.dump(self.assets, manfile, indent=4, sort_keys=True)
+            manfile.write("\n")
+
+    def page_context(self, source):
+        """
+        Returns the context to summon a source that has been through a ritual with.
+        When streaming, writes go into a layer that is dropped after summoning.
+        """
+        if self.stream:
+            return source.metadata.new_child()
+        return source.metadata
+
+    def check(self, source):
+        if source.kind is not SourceType.SCROLL:
+            return []
+        ctx = self.page_context(source)
+        missing = []
+
+        def check_template(name, template, extra=()):
+            keys = [k for k in template.missing(ctx)
+                    if k not in SUMMON_KEYS and k not in self.rune_keys and k not in extra]
+            if keys:
+                missing.append((name, keys))
+
+        for name in self.page_comp:
+            if name in self.running_blocks:
+                check_template(name, self.running_blocks[name])
+            elif name == "nav" and self.nav_shared_path is not None:
+                check_template("nav reference", self.nav_shared_ref, {"navref", "curref"})
+            elif name == "nav":
+                for (key, _), template in zip(NAV_TEMPLATES, self.nav_templates):
+                    check_template("nav " + key, template, {"name", "ref"})
+        return missing
+
+    def nav_digest(self, source, catroot):
+        if "nav" not in self.page_comp or source.kind is not SourceType.SCROLL:
+            return None
+        key = source.parent.location() if self.nav_expand == "ancestors" else None
+        if key not in self.nav_digests:
+            digests = self.depgraph.digests if self.depgraph is not None else self.listing_digests
+            self.nav_digests[key] = scope_digest(
+                navigation_scope(catroot, source, self.nav_expand, self.nav_depth), digests
+            )
+        return self.nav_digests[key]
+
+    def nav_path(self, source):
+        """Path of the shared navigation fragment for a source."""
+        return self.nav_shared_path.format(dir=path.join(path.dirname(source.destination), ""))
+
+    def extra_outputs(self, source):
+        if self.nav_shared_path is None or "nav" not in self.page_comp \
+                or source.kind is not SourceType.SCROLL:
+            return []
+        return [self.nav_path(source)]
+
+    def write_shared_nav(self, source, catroot):
+        """
+        Writes the shared navigation fragment for a source's directory,
+        if that hasn't been done yet. Fragments are rendered with the renderer
+        context, as they are shared. Returns False if the fragment's path
+        was claimed by a source it doesn't fit.
+        """
+        pagedir = path.join(path.dirname(source.destination), "")
+        navpath = self.nav_path(source)
+        # Only the directory and, when expanding ancestors,
+        # the parent category vary between fragments.
+        variant = (pagedir, source.parent.location() if self.nav_expand == "ancestors" else None)
+        # Pages may be summoned on several threads, the first to claim a fragment writes it.
+        with self.nav_lock:
+            claimed = self.nav_fragments.get(navpath)
+            if claimed is None:
+                self.nav_fragments[navpath] = variant
+                # References in the fragment are made from the page's directory,
+                # by a stand-in that never matches the current link.
+                stand_in = Source(source.kind, source.name, False, None,
+                                  source.destination, {})
+                stand_in.parent = source.parent
+                with self.output.open(navpath) as fragfile:
+                    fragfile.write(self.nav_shared_head)
+                    for fragment in self.nav_renderer(catroot, stand_in, self.context):
+                        fragfile.write(fragment)
+        return claimed is None or claimed == variant
+
+    def shared_nav(self, source, catroot, ctx):
+        """
+        Writes the shared navigation fragment for a source with write_shared_nav
+        and returns the reference to it, or the navigation itself if it doesn't fit.
+        The reference format gets "navref", the reference to the fragment,
+        and "curref", the reference to the current page.
+        """
+        if not self.write_shared_nav(source, catroot):
+            log.warning("Shared navigation \"%s\" doesn't fit \"%s\", inlining it."
+                        % (self.nav_path(source), source.destination))
+            return "".join(self.nav_renderer(catroot, source, ctx))
+        ref_func = registries.referencer_lookup(self.fmt)
+        fragment = Source(SourceType.RESOURCE, "nav", False, None, self.nav_path(source), {})
+        refctx = {
+            "navref": ref_func(fragment, source),
+            "curref": ref_func(source, source)
+        }
+        return self.nav_shared_ref(ChainMap(refctx, ctx))
+
+    def begin(self, source, catroot):
+        job = super().begin(source, catroot)
+        job.ctx = self.page_context(source)
+        job.ctx["ref"] = self.referencer(source, catroot, job.refs)
+        return job
+
+    def compose(self, job, main):
+        """Yields the page composition of a job, with main as the main block's fragments."""
+        for name in self.page_comp:
+            if name == "main":
+                yield from main
+            elif name == "nav" and self.nav_shared_path is not None:
+                yield self.shared_nav(job.source, job.catroot, job.ctx)
+            elif name == "nav":
+                yield from self.nav_renderer(job.catroot, job.source, job.ctx)
+            elif name in self.running_blocks:
+                yield self.running_blocks[name](job.ctx)
+            else:
+                # Print warning?
+                pass
+
+    def main_block(self, rune_tree, ctx):
+        """Yields the fragments of the main block, as they are inscribed."""
+        for node in rune.inscribe_iter(rune_tree, self.fmt, ctx, self.rune_concurrency):
+            yield node.data
+
+    def cache_lookup(self, job):
+        """
+        Look a scroll up in the page cache. On a hit, the job's data is the
+        cached page and its references and files are those recorded with it.
+        """
+        if self.page_cache is None or job.source.kind is not SourceType.SCROLL:
+            return
+        source = job.source
+        job.key = self.page_cache.fingerprint(
+            self.cfg_digest, file_digest(source.source), source.destination,
+            {k: v for k, v in source.metadata.items() if k not in SUMMON_KEYS},
+            self.nav_digest(source, job.catroot)
+        )
+        entry = self.page_cache.lookup(job.key, self.referencer(source, job.catroot))
+        if entry is not None:
+            job.cached = True
+            job.data = entry["data"]
+            job.refs = entry["refs"]
+            job.files = set(entry["files"])
+
+    def finish(self, job):
+        if job.key is not None and not job.cached and not self.noop:
+            self.page_cache.store(job.key, job.data, job.refs, job.files)
+        if self.depgraph is not None:
+            self.depgraph.record(job.source, self.nav_digest(job.source, job.catroot),
+                                 job.refs, job.files)
+
+    def summon_read(self, job):
+        self.cache_lookup(job)
+        if job.source.kind is SourceType.SCROLL and not job.cached:
+            with open(job.source.source, "r") as srcfile:
+                job.data = srcfile.read()
+        return job
+
+    def collators(self):
+        """Collators to collate scrolls with, or None."""
+        return rune.collators(self.fmt) if self.collate else None
+
+    def summon_parse(self, job):
+        if job.source.kind is SourceType.SCROLL and not job.cached:
+            job.data = scroll.parse(scroll.lex(StringIO(job.data)))
+            collators = self.collators()
+            if collators is not None:
+                scroll.collate(job.data, collators)
+        return job
+
+    def summon_assemble(self, job):
+        if job.source.kind is SourceType.SCROLL and not job.cached:
+            job.data = rune.assemble(job.data)
+        return job
+
+    def summon_inscribe(self, job):
+        if job.source.kind is SourceType.SCROLL and not job.cached:
+            with rune.recording(job.files):
+                job.data = "".join(self.compose(job, self.main_block(job.data, job.ctx)))
+        return job
+
+    def summon_write(self, job):
+        if job.cached and self.extra_outputs(job.source):
+            # The cached page refers to its shared navigation, which must still be written.
+            self.write_shared_nav(job.source, job.catroot)
+        if job.source.kind is SourceType.SCROLL:
+            with self.output.open(job.source.destination) as dstfile:
+                dstfile.write(job.data)
+        elif job.source.kind is SourceType.RESOURCE:
+            self.output.copy(job.source.source, job.source.destination)
+        self.finish(job)
+        return job
 
-        makedirs(path.dirname(dstpath), exist_ok=True)
-
-        if source.kind is SourceType.SCROLL:
-            with open(srcpath, "r") as srcfile:
-                scroll_tree = scroll.parse(scroll.lex(srcfile))
-
-            rune_tree = rune.assemble(scroll_tree)
-            inscribed_tree = rune.inscribe(rune_tree, self.fmt, source.metadata)
-
-            with open(dstpath, "w") as dstfile:
-                for name in self.page_comp:
-                    if name == "main":
-                        for node in inscribed_tree:
-                            if type(node.data) is str:
-                                dstfile.write(node.data)
-                    elif name == "nav":
-                        for fragment in self.nav_renderer(catroot, source, source.metadata):
-                            dstfile.write(fragment)
-                    elif name in self.running_blocks:
-                        block = self.running_blocks[name]
-                        dstfile.write(block.format_map(source.metadata))
-                    else:
-                        # Print warning?
-                        pass
-        elif source.kind is SourceType.RESOURCE:
-            copyfile(srcpath, dstpath)
+    def summon(self, source, catroot):
+        job = self.begin(source, catroot)
+        self.cache_lookup(job)
+        if source.kind is SourceType.SCROLL and not job.cached:
+            # Only kept for the page cache.
+            written = [] if job.key is not None else None
+            with open(source.source, "r") as srcfile, rune.recording(job.files), \
+                    self.output.open(source.destination) as dstfile:
+                # The scroll is read as the main block is inscribed,
+                # and fragments are written as soon as they are final.
+                events = scroll.iterparse(scroll.lex(srcfile))
+                collators = self.collators()
+                if collators is not None:
+                    events = scroll.itercollate(events, collators)
+                rune_tree = rune.assemble_iter(events)
+                for fragment in self.compose(job, self.main_block(rune_tree, job.ctx)):
+                    dstfile.write(fragment)
+                    if written is not None:
+                        written.append(fragment)
+            if written is not None:
+                job.data = "".join(written)
+            self.finish(job)
+        else:
+            self.summon_write(job)
 
 
 def load_renderers(renderer_cfg, build_dir, root_context):
@@ -263,6 +704,7 @@ DEFAULT_CONFIG = {
         "root dir": "root",
         "rune dir": "runes",
         "build dir": "build",
+        "cache dir": ".surrect-cache",
         "map": [
             ("*.man.scroll", "manual"),
             ("*.scroll", "site"),
@@ -0,0 +1,133 @@
+"""
+template - format strings compiled ahead of time.
+
+A Template is a str.format_map format string, parsed once into a list of
+literals and field functions. Calling a template with a mapping gives the same
+result as format_map, and the top level keys a template needs are known
+without rendering it, so missing keys can be found before a build starts.
+"""
+
+from functools import lru_cache
+from string import Formatter
+
+
+_formatter = Formatter()
+
+# Values of these types can't change, so output rendered from them can be shared.
+SCALARS = {str, int, float, bool, type(None)}
+
+
+def split_field_name(field_name: str) -> tuple:
+    """
+    Split a field name as str.format does, into its first part and a list
+    of (is attribute, name) pairs for the attributes and indexes after it.
+    Parts made of digits only are ints, except attribute names.
+    """
+    end = len(field_name)
+    i = 0
+    while i < end and field_name[i] not in ".[":
+        i += 1
+    first = field_name[:i]
+    rest = []
+    while i < end:
+        is_attr = field_name[i] == "."
+        start = i = i + 1
+        if is_attr:
+            while i < end and field_name[i] not in ".[":
+                i += 1
+            name = field_name[start:i]
+        else:
+            i = field_name.find("]", start)
+            if i < 0:
+                raise ValueError("Missing ']' in format string")
+            name = field_name[start:i]
+            i += 1
+            if i < end and field_name[i] not in ".[":
+                raise ValueError("Only '.' or '[' may follow ']' in format field specifier")
+        if not name:
+            raise ValueError("Empty attribute in format string")
+        rest.append((is_attr, int(name) if not is_attr and name.isdecimal() else name))
+    return int(first) if first.isdecimal() else first, rest
+
+
+def compile_field(field_name: str, conversion: str, format_spec: str):
+    """Compile a single replacement field into a function of a mapping."""
+    first, rest = split_field_name(field_name)
+    rest = tuple(rest)
+
+    def field(mapping):
+        obj = mapping[first]
+        for is_attr, i in rest:
+            obj = getattr(obj, i) if is_attr else obj[i]
+        if conversion is not None:
+            obj = _formatter.convert_field(obj, conversion)
+        return format(obj, format_spec)
+
+    return first, field
+
+
+class Template:
+    """
+    A compiled format string. Output is cached on the values of the keys used,
+    so mappings with identical inputs share the rendered string. Only values
+    of SCALARS types are cached on, others may change or be read when rendering.
+    """
+    def __init__(self, fmt: str, cache_size: int=256):
+        self.fmt = fmt
+        self.keys = []
+        self.parts = []
+        for literal, field_name, format_spec, conversion in _formatter.parse(fmt):
+            if literal:
+                self.parts.append(literal)
+            if field_name is None:
+                continue
+            if field_name == "" or field_name.isdigit() or "{" in format_spec:
+                # Positional and nested fields are left to format_map.
+                self.keys = self.nested_keys(fmt)
+                self.parts = None
+                break
+            key, field = compile_field(field_name, conversion, format_spec)
+            if key not in self.keys:
+                self.keys.append(key)
+            self.parts.append(field)
+        self.constant = fmt.format_map({}) if not self.keys and self.parts is not None else None
+        self.cached = lru_cache(maxsize=cache_size)(self.render_values)
+
+    @staticmethod
+    def nested_keys(fmt: str) -> list:
+        """Find the top level keys used anywhere in a format string."""
+        keys = []
+        for _, field_name, format_spec, _ in _formatter.parse(fmt):
+            if field_name:
+                first, _ = split_field_name(field_name)
+                if isinstance(first, str) and first not in keys:
+                    keys.append(first)
+            if format_spec:
+                keys += [k for k in Template.nested_keys(format_spec) if k not in keys]
+        return keys
+
+    def render(self, mapping) -> str:
+        """Render the template without caching."""
+        if self.parts is None:
+            return self.fmt.format_map(mapping)
+        return "".join(part if isinstance(part, str) else part(mapping)
+                       for part in self.parts)
+
+    def render_values(self, values: tuple) -> str:
+        return self.render({k: v for k, (_, v) in zip(self.keys, values)})
+
+    def __call__(self, mapping) -> str:
+        if self.constant is not None:
+            return self.constant
+        # Types are part of the key, as 1 == True but they format differently.
+        values = tuple((type(mapping[k]), mapping[k]) for k in self.keys)
+        if all(kind in SCALARS for kind, _ in values):
+            return self.cached(values)
+        return self.render(mapping)
+
+    def missing(self, mapping) -> list:
+        """Keys the template needs that a mapping doesn't have."""
+        return [k for k in self.keys if k not in mapping]
+
+    def __repr__(self):
+        return "Template({0})".format(repr(self.fmt))
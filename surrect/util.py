@@ -1,6 +1,57 @@
-from os import path
+import gc
+import sys
+
+from os import path, remove, replace, stat
+from shutil import copyfile
+
+from collections.abc import Mapping
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def same_contents(a: str, b: str, chunk_size: int=65536) -> bool:
+    """Do two files have the same contents? False if either is missing."""
+    try:
+        if stat(a).st_size != stat(b).st_size:
+            return False
+        with open(a, "rb") as fa, open(b, "rb") as fb:
+            while True:
+                ca = fa.read(chunk_size)
+                if ca != fb.read(chunk_size):
+                    return False
+                if not ca:
+                    return True
+    except OSError:
+        return False
+
+
+def temp_path(pth: str) -> str:
+    """A hidden path next to pth, to write it out before it is settled."""
+    direc, filen = path.split(pth)
+    return path.join(direc, "." + filen + ".tmp")
+
+
+def settle(tmppath: str, pth: str) -> bool:
+    """
+    Move a file written at tmppath to pth, unless pth already has the same contents,
+    so unchanged files keep their modification times. Returns True if pth changed.
+    """
+    if same_contents(tmppath, pth):
+        remove(tmppath)
+        return False
+    replace(tmppath, pth)
+    return True
+
+
+def copy_if_changed(src: str, dst: str) -> bool:
+    """Copy a file, unless dst already has the same contents. Returns True if dst changed."""
+    if same_contents(src, dst):
+        return False
+    copyfile(src, dst)
+    return True
 
-from collections import Mapping
 
 def path_attributes(pth: str, attrs=None) -> dict:
     """
@@ -84,3 +135,37 @@ def flatten(d: Mapping, p: tuple=(), visited: set=None):
             yield from flatten(v, p=(*p, k), visited=visited)
         else:
             yield (*p, k), v
+
+
+def peak_rss() -> int:
+    """Peak resident set size of this process in bytes, or None if unknown."""
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, kilobytes elsewhere.
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def current_rss() -> int:
+    """
+    Current resident set size of this process in bytes, or None if it
+    can't be measured. The peak size is no substitute, as it never falls.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except (OSError, AttributeError, IndexError, ValueError):
+        return None
+
+
+def over_rss_limit(limit: int) -> int:
+    """
+    The current resident set size in bytes, if it is over limit bytes
+    even after collecting garbage. Otherwise None.
+    """
+    if current_rss() <= limit:
+        return None
+    # Give the collector a chance before giving up.
+    gc.collect()
+    rss = current_rss()
+    return rss if rss > limit else None
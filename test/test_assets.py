@@ -0,0 +1,64 @@
+import json
+
+from unittest import TestCase
+from tempfile import TemporaryDirectory
+from os import path, utime
+
+from surrect import core_format
+from surrect.assets import *
+from surrect.source import Source, SourceType
+from surrect.summon import renderer_lookup
+
+
+def write(pth, data):
+    with open(pth, "wb") as f:
+        f.write(data)
+
+
+class TestFingerprint(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.logo = path.join(self.tmp.name, "logo.png")
+        write(self.logo, b"\x89PNG")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_fingerprinted(self):
+        self.assertEqual(fingerprinted("img/logo.png", "3f9a1c2e77", 6), "img/logo.3f9a1c.png")
+        self.assertEqual(fingerprinted("LICENSE", "3f9a1c2e77"), "LICENSE.3f9a1c2e")
+
+    def test_digest_cache(self):
+        digests = DigestCache()
+        first = digests.digest(self.logo)
+        self.assertEqual(digests.digest(self.logo), first)
+        self.assertEqual(digests.hashed, 1)
+        write(self.logo, b"\x89PNG changed")
+        utime(self.logo, ns=(1, 1))
+        self.assertNotEqual(digests.digest(self.logo), first)
+        self.assertEqual(digests.hashed, 2)
+
+    def test_ritual(self):
+        build = path.join(self.tmp.name, "build")
+        renderer = renderer_lookup("site")(build, {}, "html", {
+            "fingerprint": {"include": ["*.png"], "manifest": "assets.json"}
+        })
+        logo = Source(SourceType.RESOURCE, "logo", False, self.logo, "img/logo.png", {})
+        page = Source(SourceType.SCROLL, "page", True, None, "index.scroll", {})
+        renderer.ritual(logo)
+        renderer.ritual(page)
+        self.assertRegex(logo.destination, r"^img/logo\.[0-9a-f]{8}\.png$")
+        self.assertEqual(page.destination, "index.scroll")
+        renderer.conclude()
+        with open(path.join(build, "assets.json")) as manfile:
+            self.assertEqual(json.load(manfile), {"img/logo.png": logo.destination})
+
+    def test_off(self):
+        for fingerprint in (False, None, 0):
+            build = path.join(self.tmp.name, "build")
+            renderer = renderer_lookup("site")(build, {}, "html", {"fingerprint": fingerprint})
+            logo = Source(SourceType.RESOURCE, "logo", False, self.logo, "img/logo.png", {})
+            renderer.ritual(logo)
+            self.assertEqual(logo.destination, "img/logo.png")
+            renderer.conclude()
+            self.assertFalse(path.exists(build))
@@ -0,0 +1,379 @@
+import re
+import json
+
+from unittest import TestCase, mock
+from tempfile import TemporaryDirectory
+from os import makedirs, path, remove
+from shutil import rmtree
+
+from surrect import cli, core_runes, core_format, rune, summon
+from surrect.journal import Journal
+from surrect.output import DirectoryOutput
+from surrect.shard import shard_of, write_record
+
+
+def write(pth, text):
+    makedirs(path.dirname(pth), exist_ok=True)
+    with open(pth, "w") as f:
+        f.write(text)
+
+
+def read(pth):
+    with open(pth) as f:
+        return f.read()
+
+
+class ProjectTestCase(TestCase):
+    """A small project in a temporary directory, built with the build mode."""
+    SOURCES = {
+        "index.scroll": "== Home ==\n",
+        "page.scroll": "Some text.\n",
+        "docs/intro.scroll": "Intro.\n",
+        "docs/api/one.scroll": "One.\n",
+        "docs/api/two.scroll": "Two.\n"
+    }
+
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.root = path.join(self.tmp.name, "root")
+        self.build_dir = path.join(self.tmp.name, "build")
+        self.summonfile = path.join(self.tmp.name, "Summonfile")
+        for name, text in self.SOURCES.items():
+            write(path.join(self.root, name), text)
+        makedirs(path.join(self.tmp.name, "runes"))
+        self.cfg = {
+            "summon": {
+                "root dir": self.root,
+                "rune dir": path.join(self.tmp.name, "runes"),
+                "build dir": self.build_dir,
+                "cache dir": path.join(self.tmp.name, "cache"),
+                "map": [["*", "site"]]
+            },
+            "renderers": {
+                "site": {
+                    "renderer": "site:html",
+                    "path format": "{dir}{filebase}.html",
+                    "page composition": ["main"]
+                }
+            }
+        }
+        self.save_cfg()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def save_cfg(self):
+        with open(self.summonfile, "w") as f:
+            json.dump(self.cfg, f)
+
+    def build(self, *opts, global_opts=()):
+        args = cli.arg_parser.parse_args(["-f", self.summonfile, *global_opts, "build", *opts])
+        with mock.patch("surrect.cli.out"):
+            return cli.build_mode(args)
+
+    def output(self, dst):
+        return path.join(self.build_dir, dst)
+
+
+class TestMemoryLimit(TestCase):
+    def test_unmeasurable(self):
+        args = cli.arg_parser.parse_args(["-f", "no-such-Summonfile", "build", "-m", "100"])
+        with mock.patch("surrect.cli.current_rss", return_value=None):
+            with self.assertLogs("surrect.cli", "ERROR"):
+                self.assertEqual(cli.build_mode(args), 1)
+
+
+class TestRuneKeys(ProjectTestCase):
+    def setUp(self):
+        super().setUp()
+        write(path.join(self.tmp.name, "runes", "toc.py"),
+              "@rune(\"toc\", \"html\")\n"
+              "def toc(*args, nodes, attrs, context):\n"
+              "    context[\"toc\"] = \"TOC!\"\n"
+              "    return []\n")
+        write(path.join(self.root, "page.scroll"), ":toc()\nBody\n")
+        site = self.cfg["renderers"]["site"]
+        site["running blocks"] = {"tail": "<footer>{toc}</footer>"}
+        site["page composition"] = ["main", "tail"]
+        self.cfg["summon"]["map"] = [["*/page.scroll", "site"]]
+        self.save_cfg()
+
+    def tearDown(self):
+        rune.unregister("toc", "html")
+        super().tearDown()
+
+    def test_added_by_rune(self):
+        # Only a warning, as check can't see what runes add.
+        with self.assertLogs("surrect.cli", "WARNING") as logs:
+            self.assertEqual(self.build(), 0)
+        self.assertIn("Undefined key toc in \"tail\"", logs.output[0])
+        self.assertEqual(read(self.output("page.html")), "<p>Body</p><footer>TOC!</footer>")
+
+    def test_declared(self):
+        self.cfg["renderers"]["site"]["rune keys"] = ["toc"]
+        self.save_cfg()
+        with mock.patch.object(cli.log, "warning") as warning:
+            self.assertEqual(self.build(), 0)
+        warning.assert_not_called()
+        self.assertEqual(read(self.output("page.html")), "<p>Body</p><footer>TOC!</footer>")
+
+
+class TestMain(ProjectTestCase):
+    def test_no_mode(self):
+        # Builds with the build options' defaults.
+        with mock.patch("surrect.cli.out"):
+            self.assertEqual(cli.main(["-f", self.summonfile]), 0)
+        self.assertEqual(read(self.output("page.html")), "<p>Some text.</p>")
+
+
+class TestStream(ProjectTestCase):
+    def test_same_output(self):
+        site = self.cfg["renderers"]["site"]
+        site["page composition"] = ["main", "nav"]
+        site["nav"] = {"link": "<a href=\"{ref}\">{name}</a>"}
+        self.save_cfg()
+        self.assertEqual(self.build(), 0)
+        built = {name: read(self.output(name.replace(".scroll", ".html"))) for name in self.SOURCES}
+        rmtree(self.build_dir)
+        self.assertEqual(self.build("-s"), 0)
+        for name, text in built.items():
+            self.assertEqual(read(self.output(name.replace(".scroll", ".html"))), text)
+
+
+class TestMergeMode(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.shard = path.join(self.tmp.name, "shard")
+        self.target = path.join(self.tmp.name, "merged")
+        write(path.join(self.shard, "a.html"), "a")
+        write_record(DirectoryOutput(self.shard), 1, 1, "site", 1, ["a.html"])
+        write(path.join(self.target, "old.html"), "old")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def merge(self, *global_opts):
+        args = cli.arg_parser.parse_args([*global_opts, "merge", self.target, self.shard])
+        with mock.patch("surrect.cli.out"):
+            return cli.merge_mode(args)
+
+    def test_noop_keeps_target(self):
+        self.assertEqual(self.merge("-n", "-F"), 0)
+        self.assertEqual(read(path.join(self.target, "old.html")), "old")
+        self.assertFalse(path.exists(path.join(self.target, "a.html")))
+
+    def test_force(self):
+        self.assertEqual(self.merge("-F"), 0)
+        self.assertFalse(path.exists(path.join(self.target, "old.html")))
+        self.assertEqual(read(path.join(self.target, "a.html")), "a")
+
+
+class TestIncremental(ProjectTestCase):
+    def test_stale_removed(self):
+        self.assertEqual(self.build(), 0)
+        remove(path.join(self.root, "page.scroll"))
+        self.assertEqual(self.build("-i"), 0)
+        self.assertFalse(path.exists(self.output("page.html")))
+        self.assertTrue(path.exists(self.output("index.html")))
+
+    def test_dependencies_metadata(self):
+        # A page's own "dependencies" key isn't taken over by summoning.
+        write(path.join(self.root, "page.scroll"), "### dependencies: listed\nSome text.\n")
+        self.cfg["summon"]["context"] = {"dependencies": "none"}
+        site = self.cfg["renderers"]["site"]
+        site["running blocks"] = {"deps": "{dependencies}"}
+        site["page composition"] = ["deps", "main"]
+        self.save_cfg()
+        self.assertEqual(self.build(), 0)
+        self.assertEqual(read(self.output("page.html")), "listed<p>Some text.</p>")
+        self.assertEqual(read(self.output("index.html")), "none<h2>Home</h2>")
+
+
+class TestNoop(ProjectTestCase):
+    def build_messages(self, *opts, global_opts=()):
+        args = cli.arg_parser.parse_args(["-f", self.summonfile, *global_opts, "build", *opts])
+        with mock.patch("surrect.cli.out") as out:
+            self.assertEqual(cli.build_mode(args), 0)
+        return [call.args[0] for call in out.call_args_list]
+
+    def test_stops_before_summoning(self):
+        with mock.patch.object(summon.renderers["site"], "summon") as summoned:
+            messages = self.build_messages(global_opts=["-n"])
+        summoned.assert_not_called()
+        self.assertIn("Would have summoned 5 sources.", messages)
+        self.assertFalse(path.exists(self.build_dir))
+
+    def test_incremental(self):
+        self.assertEqual(self.build(), 0)
+        write(path.join(self.root, "page.scroll"), "Changed.\n")
+        remove(path.join(self.root, "index.scroll"))
+        messages = self.build_messages("-i", global_opts=["-n"])
+        self.assertIn("Would have summoned 1 sources.", messages)
+        self.assertIn("Would have removed stale output '%s'" % self.output("index.html"), messages)
+        self.assertEqual(read(self.output("page.html")), "<p>Some text.</p>")
+
+    def test_memory_output(self):
+        # Rendered, but not written.
+        messages = self.build_messages("-o", "memory")
+        self.assertTrue(any(m.startswith("Wrote 5 files") for m in messages))
+        self.assertFalse(path.exists(self.build_dir))
+
+
+class TestOnly(ProjectTestCase):
+    def built(self):
+        """Sources with an output in the build dir."""
+        return sorted(name for name in self.SOURCES
+                      if path.exists(self.output(name.replace(".scroll", ".html"))))
+
+    def test_globs(self):
+        self.assertEqual(self.build("--only", "docs/api/*.scroll"), 0)
+        self.assertEqual(self.built(), ["docs/api/one.scroll", "docs/api/two.scroll"])
+        rmtree(self.build_dir)
+        self.assertEqual(self.build("--only", "{page,docs/intro}.scroll", "--only", "index.*"), 0)
+        self.assertEqual(self.built(), ["docs/intro.scroll", "index.scroll", "page.scroll"])
+
+    def test_existing_build_dir(self):
+        # Outputs of other sources are left as they are.
+        self.assertEqual(self.build(), 0)
+        write(path.join(self.root, "page.scroll"), "Changed.\n")
+        write(self.output("index.html"), "left alone")
+        self.assertEqual(self.build("--only", "page.scroll"), 0)
+        self.assertEqual(read(self.output("page.html")), "<p>Changed.</p>")
+        self.assertEqual(read(self.output("index.html")), "left alone")
+
+    def test_records_kept(self):
+        self.assertEqual(self.build(), 0)
+        self.assertEqual(self.build("-i", "--only", "page.scroll"), 0)
+        with open(path.join(self.tmp.name, "cache", "dependencies.json")) as graphfile:
+            pages = json.load(graphfile)["pages"]
+        self.assertEqual(sorted(pages), sorted(name.replace(".scroll", ".html") for name in self.SOURCES))
+        # So a later incremental build neither removes nor summons them.
+        self.assertEqual(self.build("-i"), 0)
+        self.assertEqual(self.built(), sorted(self.SOURCES))
+
+    def test_shard(self):
+        # Sources must be in the shard and match a glob.
+        docs = ["docs/api/one.scroll", "docs/api/two.scroll", "docs/intro.scroll"]
+        built = []
+        for shard in (1, 2):
+            if path.exists(self.build_dir):
+                rmtree(self.build_dir)
+            self.assertEqual(self.build("--shard", "%d/2" % shard, "--only", "docs/*"), 0)
+            expected = [name for name in docs if shard_of(name, 2) == shard]
+            self.assertEqual(self.built(), expected)
+            built += expected
+        self.assertEqual(sorted(built), docs)
+
+
+class TestResume(ProjectTestCase):
+    def setUp(self):
+        super().setUp()
+        site = self.cfg["renderers"]["site"]
+        site["page composition"] = ["main", "nav"]
+        site["nav"] = {"link": "<a href=\"{ref}\">{name}</a>"}
+        self.save_cfg()
+
+    def interrupted(self, *opts):
+        # The journal is left behind, as if the build died before finishing.
+        with mock.patch.object(Journal, "finish", lambda journal: journal.jfile.close()):
+            self.assertEqual(self.build("--checkpoint", "0", *opts), 0)
+
+    def test_not_journalled(self):
+        with mock.patch.object(Journal, "record") as record:
+            self.assertEqual(self.build(), 0)
+        record.assert_not_called()
+
+    def test_resume(self):
+        self.interrupted()
+        with mock.patch.object(Journal, "record") as record:
+            self.assertEqual(self.build("-r"), 0)
+        record.assert_not_called()
+
+    def test_nav_changed(self):
+        # Outputs are intact, but their navigation needs the new page.
+        self.interrupted()
+        write(path.join(self.root, "new.scroll"), "New.\n")
+        self.assertEqual(self.build("-r"), 0)
+        self.assertIn("<a href=\"new.html\">New</a>", read(self.output("page.html")))
+
+
+class TestSharedNav(ProjectTestCase):
+    def setUp(self):
+        super().setUp()
+        self.site = self.cfg["renderers"]["site"]
+        self.site["page composition"] = ["main", "nav"]
+        self.site["nav"] = {"link": "<a href=\"{ref}\">{name}</a>", "shared": {}}
+        self.save_cfg()
+
+    def test_fragments(self):
+        self.assertEqual(self.build(), 0)
+        self.assertEqual(read(self.output("page.html")),
+                         "<p>Some text.</p><iframe class=\"navigation\" src=\"nav.html#page.html\" "
+                         "title=\"Navigation\"></iframe>\n")
+        self.assertIn("src=\"nav.html#one.html\"", read(self.output("docs/api/one.html")))
+        fragment = read(self.output("docs/api/nav.html"))
+        self.assertTrue(fragment.startswith("<base target=\"_top\">\n"))
+        self.assertIn("<a href=\"one.html\">One</a>", fragment)
+        self.assertIn("<a href=\"../../page.html\">Page</a>", fragment)
+
+    def test_current_link(self):
+        # The head script marks the link whose href is the fragment's "#" part.
+        self.assertEqual(self.build(), 0)
+        for page, fragment in (("page.html", "nav.html"), ("docs/api/two.html", "docs/api/nav.html")):
+            current = re.search(r'src="[^"#]*#([^"]*)"', read(self.output(page))).group(1)
+            fragment = read(self.output(fragment))
+            self.assertIn("<a href=\"%s\">" % current, fragment)
+            self.assertIn("location.hash", fragment)
+            self.assertIn("a.getAttribute(\"href\") === current) a.classList.add(\"curlnk\")", fragment)
+
+    def test_pipeline(self):
+        # Each fragment is written once, by whichever page thread gets to it first.
+        opened = []
+        real_open = DirectoryOutput.open
+
+        def open_spy(output, dst, *args, **kwargs):
+            opened.append(dst)
+            return real_open(output, dst, *args, **kwargs)
+
+        with mock.patch.object(DirectoryOutput, "open", open_spy):
+            self.assertEqual(self.build("-p", "-j", "4"), 0)
+        fragments = [dst for dst in opened if path.basename(dst) == "nav.html"]
+        self.assertEqual(sorted(fragments), ["docs/api/nav.html", "docs/nav.html", "nav.html"])
+        self.assertIn("<a href=\"one.html\">One</a>", read(self.output("docs/api/nav.html")))
+
+    def test_cached(self):
+        # Pages from the page cache still get their fragments, written after reading.
+        self.cfg["summon"]["page cache"] = path.join(self.tmp.name, "pages")
+        self.save_cfg()
+        self.assertEqual(self.build(), 0)
+        rmtree(self.build_dir)
+        self.assertEqual(self.build("-p"), 0)
+        self.assertIn("src=\"nav.html#one.html\"", read(self.output("docs/api/one.html")))
+        self.assertIn("<a href=\"one.html\">One</a>", read(self.output("docs/api/nav.html")))
+
+    def test_reference(self):
+        self.site["nav"]["shared"] = {"path": "{dir}_nav.html", "reference": "<nav data-src=\"{navref}\"></nav>"}
+        self.save_cfg()
+        self.assertEqual(self.build(), 0)
+        self.assertEqual(read(self.output("page.html")), "<p>Some text.</p><nav data-src=\"_nav.html\"></nav>")
+        self.assertFalse(read(self.output("_nav.html")).startswith("<base"))
+
+    def test_page_keys(self):
+        # Fragments are shared, so can't use keys pages have.
+        self.site["nav"]["link"] = "<a href=\"{ref}\" title=\"{filebase}\">{name}</a>"
+        self.save_cfg()
+        with self.assertLogs("surrect.cli", "ERROR"):
+            self.assertEqual(self.build(), 1)
+
+    def test_collision(self):
+        self.site["nav"]["shared"] = {"path": "{dir}page.html"}
+        self.save_cfg()
+        with self.assertLogs("surrect.cli", "ERROR") as logs:
+            self.assertEqual(self.build(), 1)
+        self.assertIn("is also the output of", logs.output[0])
+
+    def test_needs_reference(self):
+        self.site["renderer"] = "site:txt"
+        self.save_cfg()
+        with self.assertLogs("surrect.cli", "ERROR"):
+            self.assertEqual(self.build(), 1)
@@ -0,0 +1,50 @@
+import gzip
+
+from unittest import TestCase
+from tempfile import TemporaryDirectory
+from os import path
+
+from surrect.compress import *
+
+
+def write(pth, data):
+    with open(pth, "wb") as f:
+        f.write(data)
+
+
+class TestPrecompressor(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.root = self.tmp.name
+        write(path.join(self.root, "page.html"), b"<p>page</p>\n" * 100)
+        write(path.join(self.root, "small.html"), b"<p></p>")
+        write(path.join(self.root, "logo.png"), b"\x89PNG" * 100)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_compressor(self, digests, **cfg):
+        compressor = Precompressor(self.root, cfg, digests)
+        compressor.run(["page.html", "small.html", "logo.png"])
+        return compressor
+
+    def test_compress(self):
+        self.run_compressor({}, workers=2)
+        with gzip.open(path.join(self.root, "page.html.gz")) as f:
+            self.assertEqual(f.read(), b"<p>page</p>\n" * 100)
+        self.assertFalse(path.exists(path.join(self.root, "small.html.gz")))
+        self.assertFalse(path.exists(path.join(self.root, "logo.png.gz")))
+
+    def test_unchanged(self):
+        digests = {}
+        self.assertEqual(self.run_compressor(digests).compressed, 1)
+        self.assertEqual(self.run_compressor(digests).unchanged, 1)
+        write(path.join(self.root, "page.html"), b"<p>changed</p>\n" * 100)
+        self.assertEqual(self.run_compressor(digests).compressed, 1)
+
+    def test_below_threshold(self):
+        digests = {}
+        self.run_compressor(digests)
+        self.run_compressor(digests, **{"min size": 10000})
+        self.assertFalse(path.exists(path.join(self.root, "page.html.gz")))
+        self.assertEqual(digests, {})
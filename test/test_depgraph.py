@@ -0,0 +1,97 @@
+from unittest import TestCase
+from tempfile import TemporaryDirectory
+from os import makedirs, path, utime
+
+from surrect.depgraph import *
+from surrect.source import Source, SourceType
+
+
+def write(pth, text, mtime=None):
+    makedirs(path.dirname(pth), exist_ok=True)
+    with open(pth, "w") as f:
+        f.write(text)
+    if mtime is not None:
+        utime(pth, ns=(mtime, mtime))
+
+
+class Resolver:
+    def __init__(self, refs):
+        self.refs = refs
+
+    def resolve(self, keys):
+        return self.refs[tuple(keys)]
+
+
+class TestDependencyGraph(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.build = path.join(self.tmp.name, "build")
+        self.runes = path.join(self.tmp.name, "runes")
+        self.graphpath = path.join(self.tmp.name, "cache", "dependencies.json")
+        self.src = path.join(self.tmp.name, "page.scroll")
+        self.data = path.join(self.tmp.name, "data.csv")
+        write(self.src, "= Page\n", 1000)
+        write(self.data, "a,b\n", 1000)
+        write(path.join(self.build, "page.html"), "<h1>Page</h1>")
+        write(path.join(self.runes, "runes.py"), "", 1000)
+        self.cfg = {"summon": {"root dir": "root"}}
+        self.source = Source(SourceType.SCROLL, "page", True, self.src, "page.html", None)
+        self.refs = Resolver({("other",): "other.html"})
+        self.saved()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def saved(self):
+        graph = DependencyGraph(config_digest(self.cfg, self.runes))
+        graph.record(self.source, "nav", [(("other",), "other.html")], {self.data})
+        graph.save(self.graphpath)
+
+    def graph(self):
+        return DependencyGraph.load(self.graphpath, config_digest(self.cfg, self.runes))
+
+    def dirty(self, nav="nav", refs=None):
+        return self.graph().dirty(self.source, nav, refs or self.refs, self.build)
+
+    def test_unchanged(self):
+        self.assertFalse(self.dirty())
+
+    def test_source(self):
+        write(self.src, "= Page, changed\n", 2000)
+        self.assertTrue(self.dirty())
+
+    def test_output_missing(self):
+        self.source.destination = "moved.html"
+        self.assertTrue(self.dirty())
+
+    def test_files(self):
+        write(self.data, "a,b,c\n", 2000)
+        self.assertTrue(self.dirty())
+
+    def test_nav(self):
+        self.assertTrue(self.dirty(nav="other nav"))
+
+    def test_refs(self):
+        self.assertTrue(self.dirty(refs=Resolver({("other",): "moved/other.html"})))
+        self.assertTrue(self.dirty(refs=Resolver({})))
+
+    def test_config(self):
+        self.cfg["summon"]["root dir"] = "elsewhere"
+        self.assertTrue(self.dirty())
+
+    def test_runes(self):
+        write(path.join(self.runes, "runes.py"), "# changed\n", 2000)
+        self.assertTrue(self.dirty())
+        self.saved()
+        write(path.join(self.runes, "more.py"), "", 1000)
+        self.assertTrue(self.dirty())
+
+    def test_keep_and_stale(self):
+        graph = self.graph()
+        gone = Source(SourceType.SCROLL, "gone", True, self.src, "gone.html", None)
+        graph.previous["gone.html"] = graph.previous["page.html"]
+        graph.keep(self.source)
+        self.assertEqual(graph.current["page.html"], graph.previous["page.html"])
+        self.assertEqual(graph.stale(), ["gone.html"])
+        graph.keep(gone)
+        self.assertEqual(graph.stale(), [])
@@ -0,0 +1,61 @@
+from unittest import TestCase
+from tempfile import TemporaryDirectory
+from os import makedirs, path
+
+from surrect.journal import *
+
+
+def write(pth, text):
+    makedirs(path.dirname(pth), exist_ok=True)
+    with open(pth, "w") as f:
+        f.write(text)
+
+
+class TestJournal(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.jpath = path.join(self.tmp.name, "cache", "journal")
+        self.build = path.join(self.tmp.name, "build")
+        self.src = path.join(self.tmp.name, "page.scroll")
+        write(self.src, "= Page\n")
+        write(path.join(self.build, "page.html"), "<h1>Page</h1>\n")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def interrupted(self):
+        journal = Journal(self.jpath, "config", interval=0)
+        journal.start()
+        journal.record("page.html", self.src, "site", self.build, {"nav": None})
+        # Left unfinished, as if the build died.
+        journal.jfile.close()
+
+    def test_resume(self):
+        self.interrupted()
+        journal = Journal.load(self.jpath, "config")
+        entry = journal.completed("page.html", self.src, "site", self.build)
+        self.assertEqual(entry["deps"], {"nav": None})
+        self.assertIsNone(journal.completed("page.html", self.src, "other", self.build))
+        self.assertIsNone(journal.completed("other.html", self.src, "site", self.build))
+
+    def test_changed(self):
+        self.interrupted()
+        journal = Journal.load(self.jpath, "config")
+        write(path.join(self.build, "page.html"), "<h1>Pa")
+        self.assertIsNone(journal.completed("page.html", self.src, "site", self.build))
+        self.assertEqual(Journal.load(self.jpath, "other config").entries, {})
+
+    def test_torn(self):
+        self.interrupted()
+        with open(self.jpath, "a") as jfile:
+            jfile.write("{\"dst\": \"ot")
+        self.assertEqual(list(Journal.load(self.jpath, "config").entries), ["page.html"])
+
+    def test_finish(self):
+        journal = Journal(self.jpath, "config")
+        journal.start()
+        journal.record("page.html", self.src, "site", self.build)
+        journal.checkpoint()
+        self.assertEqual(len(Journal.load(self.jpath, "config").entries), 1)
+        journal.finish()
+        self.assertFalse(path.exists(self.jpath))
@@ -0,0 +1,44 @@
+from unittest import TestCase
+from tempfile import TemporaryDirectory
+from os import makedirs, path, remove
+
+from surrect.assets import DigestCache
+from surrect.manifest import *
+
+
+def write(pth, text):
+    makedirs(path.dirname(pth), exist_ok=True)
+    with open(pth, "w") as f:
+        f.write(text)
+
+
+class TestManifest(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.build = path.join(self.tmp.name, "build")
+        self.manpath = path.join(self.tmp.name, "manifest.json")
+        write(path.join(self.build, "index.html"), "index")
+        write(path.join(self.build, "docs", "a.html"), "a")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_diff(self):
+        self.assertEqual(diff_manifests({"a": "1", "b": "2", "c": "3"}, {"a": "1", "b": "4", "d": "5"}),
+                         (["d"], ["b"], ["c"]))
+
+    def test_build(self):
+        files = build_manifest(self.build, DigestCache())
+        self.assertEqual(sorted(files), ["docs/a.html", "index.html"])
+        self.assertEqual(save_manifest(self.manpath, files, {}), (["docs/a.html", "index.html"], [], []))
+
+        write(path.join(self.build, "docs", "a.html"), "changed")
+        write(path.join(self.build, "b.html"), "b")
+        remove(path.join(self.build, "index.html"))
+        files = build_manifest(self.build, DigestCache())
+        changes = save_manifest(self.manpath, files, load_manifest(self.manpath))
+        self.assertEqual(changes, (["b.html"], ["docs/a.html"], ["index.html"]))
+        self.assertEqual(load_manifest(self.manpath), files)
+
+    def test_missing(self):
+        self.assertEqual(load_manifest(self.manpath), {})
@@ -0,0 +1,69 @@
+import tarfile
+import zipfile
+
+from unittest import TestCase
+from tempfile import TemporaryDirectory
+from os import listdir, path
+
+from surrect.output import *
+
+
+class TestOutput(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.res = path.join(self.tmp.name, "logo.png")
+        with open(self.res, "wb") as f:
+            f.write(b"\x89PNG")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def fill(self, output):
+        with output.open("index.html") as f:
+            f.write("<p>index</p>")
+        with output.open("docs/a.html") as f:
+            f.write("<p>a</p>")
+        output.copy(self.res, "docs/logo.png")
+        with self.assertRaises(RuntimeError):
+            with output.open("broken.html") as f:
+                f.write("<p>half")
+                raise RuntimeError()
+        output.close()
+        self.assertEqual((output.files, output.bytes), (3, 12 + 8 + 4))
+
+    def test_directory(self):
+        root = path.join(self.tmp.name, "build")
+        self.fill(DirectoryOutput(root))
+        self.assertEqual(sorted(listdir(root)), ["docs", "index.html"])
+        self.assertEqual(sorted(listdir(path.join(root, "docs"))), ["a.html", "logo.png"])
+        with open(path.join(root, "docs", "a.html")) as f:
+            self.assertEqual(f.read(), "<p>a</p>")
+
+    def test_memory(self):
+        output = MemoryOutput()
+        self.fill(output)
+        self.assertEqual(output.contents, {
+            "index.html": b"<p>index</p>",
+            "docs/a.html": b"<p>a</p>",
+            "docs/logo.png": b"\x89PNG"
+        })
+        measuring = MemoryOutput(keep=False)
+        self.fill(measuring)
+        self.assertEqual(measuring.contents, {})
+
+    def test_zip(self):
+        archpath = path.join(self.tmp.name, "site.zip")
+        self.fill(output_for(archpath, None))
+        with zipfile.ZipFile(archpath) as archive:
+            self.assertEqual(sorted(archive.namelist()), ["docs/a.html", "docs/logo.png", "index.html"])
+            self.assertEqual(archive.read("docs/a.html"), b"<p>a</p>")
+
+    def test_tar(self):
+        archpath = path.join(self.tmp.name, "site.tar.gz")
+        self.fill(output_for(archpath, None))
+        with tarfile.open(archpath) as archive:
+            self.assertEqual(sorted(archive.getnames()), ["docs/a.html", "docs/logo.png", "index.html"])
+            self.assertEqual(archive.extractfile("index.html").read(), b"<p>index</p>")
+
+    def test_unknown(self):
+        self.assertRaises(ValueError, output_for, path.join(self.tmp.name, "site.rar"), None)
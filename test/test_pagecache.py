@@ -0,0 +1,53 @@
+from unittest import TestCase
+from tempfile import TemporaryDirectory
+from os import path
+
+from surrect.pagecache import *
+
+
+def write(pth, text):
+    with open(pth, "w") as f:
+        f.write(text)
+
+
+class Resolver:
+    def __init__(self, refs):
+        self.refs = refs
+
+    def resolve(self, keys):
+        return self.refs[tuple(keys)]
+
+
+class TestPageCache(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.cache = PageCache(path.join(self.tmp.name, "pages"), "salt")
+        self.dep = path.join(self.tmp.name, "data.csv")
+        write(self.dep, "a,b\n")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_fingerprint(self):
+        key = self.cache.fingerprint("src", {"b": 1, "a": 2}, None)
+        self.assertEqual(key, self.cache.fingerprint("src", {"a": 2, "b": 1}, None))
+        self.assertNotEqual(key, self.cache.fingerprint("src", {"a": 2, "b": 2}, None))
+        self.assertNotEqual(key, PageCache(self.cache.cachedir, "other").fingerprint("src", {"b": 1, "a": 2}, None))
+
+    def test_round_trip(self):
+        key = self.cache.fingerprint("src")
+        resolver = Resolver({("a", "b"): "a/b.html"})
+        self.assertIsNone(self.cache.lookup(key, resolver))
+        self.cache.store(key, "<p>page</p>\n", [(("a", "b"), "a/b.html")], {self.dep})
+        entry = self.cache.lookup(key, resolver)
+        self.assertEqual(entry["data"], "<p>page</p>\n")
+        self.assertEqual(entry["refs"], [(["a", "b"], "a/b.html")])
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_invalidated(self):
+        key = self.cache.fingerprint("src")
+        self.cache.store(key, "<p>page</p>\n", [(("a",), "a.html")], {self.dep})
+        self.assertIsNone(self.cache.lookup(key, Resolver({("a",): "moved/a.html"})))
+        self.assertIsNone(self.cache.lookup(key, Resolver({})))
+        write(self.dep, "a,b,c\n")
+        self.assertIsNone(self.cache.lookup(key, Resolver({("a",): "a.html"})))
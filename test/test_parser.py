@@ -0,0 +1,80 @@
+from unittest import TestCase
+
+from surrect.scroll import lex, parse, iterparse, itercollate, EVENT_ENTER, EVENT_LEAVE, EVENT_LEAF
+from surrect.scroll.tree import *
+
+
+SCROLL = """:foo()
+    :bar()
+        text
+
+    more text
+!raw
+"""
+
+
+class TestIterparse(TestCase):
+    def test_events(self):
+        events = [(e, n.kind) for e, n in iterparse(lex(SCROLL))]
+        self.assertEqual(events, [
+            (EVENT_ENTER, NODE_ROOT),
+            (EVENT_ENTER, NODE_RUNE),
+            (EVENT_ENTER, NODE_RUNE),
+            (EVENT_LEAF, NODE_TEXT),
+            (EVENT_LEAF, NODE_BLANK),
+            (EVENT_LEAVE, NODE_RUNE),
+            (EVENT_LEAF, NODE_TEXT),
+            (EVENT_LEAVE, NODE_RUNE),
+            (EVENT_LEAF, NODE_RAW),
+            (EVENT_LEAVE, NODE_ROOT)
+        ])
+
+    def test_leading_indent(self):
+        events = [(e, n.kind) for e, n in iterparse(lex("    text\nfoo"))]
+        self.assertEqual(events, [
+            (EVENT_ENTER, NODE_ROOT),
+            (EVENT_LEAF, NODE_TEXT),
+            (EVENT_LEAF, NODE_TEXT),
+            (EVENT_LEAVE, NODE_ROOT)
+        ])
+
+    def test_parse(self):
+        root = parse(lex(SCROLL))
+        self.assertEqual(len(root.nodes), 2)
+        foo = root.nodes[0]
+        self.assertEqual(foo.value, ("foo", [""]))
+        self.assertEqual([n.kind for n in foo.nodes], [NODE_RUNE, NODE_TEXT])
+        self.assertEqual([n.kind for n in foo.nodes[0].nodes], [NODE_TEXT, NODE_BLANK])
+
+
+class TestItercollate(TestCase):
+    SRC = "one\ntwo\n!<a>\n!<b>\nthree\n    nested\n    lines\nfour\n\nfive\n"
+
+    def test_events(self):
+        events = [(e, n.kind, n.value) for e, n in itercollate(iterparse(lex(self.SRC)))]
+        self.assertEqual(events, [
+            (EVENT_ENTER, NODE_ROOT, None),
+            (EVENT_LEAF, NODE_TEXT, "one two"),
+            (EVENT_LEAF, NODE_RAW, "<a>\n<b>"),
+            (EVENT_ENTER, NODE_TEXT, "three"),
+            (EVENT_LEAF, NODE_TEXT, "nested"),
+            (EVENT_LEAF, NODE_TEXT, "lines"),
+            (EVENT_LEAVE, NODE_TEXT, "three"),
+            (EVENT_LEAF, NODE_TEXT, "four"),
+            (EVENT_LEAF, NODE_BLANK, None),
+            (EVENT_LEAF, NODE_TEXT, "five"),
+            (EVENT_LEAVE, NODE_ROOT, None)
+        ])
+
+    def test_same_as_tree(self):
+        root = parse(lex(self.SRC))
+        collate(root)
+        scope_stack = []
+        for event, node in itercollate(iterparse(lex(self.SRC))):
+            if event is not EVENT_LEAVE and scope_stack:
+                scope_stack[-1].nodes.append(node)
+            if event is EVENT_ENTER:
+                scope_stack.append(node)
+            elif event is EVENT_LEAVE:
+                collated = scope_stack.pop()
+        self.assertEqual(collated, root)
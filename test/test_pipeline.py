@@ -0,0 +1,39 @@
+from unittest import TestCase
+
+from surrect.pipeline import *
+
+
+class TestPipeline(TestCase):
+    def test_order(self):
+        out = []
+        stages = [
+            Stage("double", lambda x: x * 2, depth=1),
+            Stage("inc", lambda x: x + 1, depth=2),
+            Stage("collect", out.append)
+        ]
+        with Pipeline(stages) as pipeline:
+            for i in range(50):
+                pipeline.put(i)
+        self.assertEqual(out, [i * 2 + 1 for i in range(50)])
+        self.assertEqual([st.items for st in pipeline.stats()], [50, 50, 50])
+
+    def test_workers(self):
+        out = []
+        stages = [Stage("square", lambda x: x * x, workers=4), Stage("collect", out.append)]
+        with Pipeline(stages) as pipeline:
+            for i in range(100):
+                pipeline.put(i)
+        self.assertEqual(sorted(out), [i * i for i in range(100)])
+
+    def test_error(self):
+        def fail(x):
+            if x == 3:
+                raise ValueError(x)
+            return x
+
+        pipeline = Pipeline([Stage("fail", fail), Stage("pass", lambda x: x)])
+        with self.assertRaises(ValueError):
+            with pipeline:
+                for i in range(10):
+                    pipeline.put(i)
+        self.assertFalse(any(t.is_alive() for t in pipeline.threads))
@@ -0,0 +1,241 @@
+import asyncio
+
+from unittest import TestCase
+
+from surrect import core_runes, core_format, scroll
+from surrect.rune import *
+
+
+SCROLL = """== Heading ==
+Some text,
+more text & stuff.
+
+:section()
+    Nested text.
+!<hr/>
+:list()
+    one
+    two
+Trailing text.
+"""
+
+
+def build(src=SCROLL):
+    return assemble(scroll.parse(scroll.lex(src)))
+
+
+class TestInscribeIter(TestCase):
+    def assertSameOutput(self, rtype):
+        whole = "".join(n.data for n in inscribe(build(), rtype, {})
+                        if type(n.data) is str)
+        streamed = "".join(n.data for n in inscribe_iter(build(), rtype, {}))
+        self.assertEqual(whole, streamed)
+
+    def test_html(self):
+        self.assertSameOutput("html")
+
+    def test_plain(self):
+        self.assertSameOutput(None)
+
+    def test_yields_incrementally(self):
+        it = inscribe_iter(build(), "html", {})
+        self.assertEqual(next(it).data, "<h2>Heading</h2>")
+
+    def test_empty(self):
+        self.assertEqual(list(inscribe_iter(build(""), "html", {})), [])
+
+    def test_collated(self):
+        whole = "".join(n.data for n in inscribe_iter(build(), "html", {}))
+        events = scroll.itercollate(scroll.iterparse(scroll.lex(SCROLL)), collators("html"))
+        self.assertEqual("".join(n.data for n in inscribe_iter(assemble_iter(events), "html", {})), whole)
+        self.assertIsNone(collators(None))
+
+
+def article_root(nodes, attrs, context):
+    # Wraps the whole page, so can't be called for runs of it.
+    return [mkdata("<article>")] + [n for n in nodes if isdata(n)] + [mkdata("</article>")]
+
+
+class TestWholeRoot(TestCase):
+    def setUp(self):
+        register("root", "test-root", article_root)
+
+    def tearDown(self):
+        unregister("root", "test-root")
+
+    def test_called_once(self):
+        src = "para\n= H =\n\n!raw\n"
+        streamed = "".join(n.data for n in inscribe_iter(build(src), "test-root", {}))
+        self.assertEqual(streamed, "".join(n.data for n in inscribe(build(src), "test-root", {})
+                                           if type(n.data) is str))
+        self.assertEqual(streamed.count("<article>"), 1)
+
+
+class TestAssembleIter(TestCase):
+    def test_same_tree(self):
+        whole = build()
+        streamed = assemble_iter(scroll.iterparse(scroll.lex(SCROLL)))
+        self.assertEqual(streamed.data, whole.data)
+        self.assertEqual(list(streamed.nodes), whole.nodes)
+
+    def test_inscribe(self):
+        whole = "".join(n.data for n in inscribe_iter(build(), "html", {}))
+        streamed = assemble_iter(scroll.iterparse(scroll.lex(SCROLL)))
+        self.assertEqual(whole, "".join(n.data for n in inscribe_iter(streamed, "html", {})))
+
+
+ASYNC_SCROLL = """:wait("a")
+:wait("b")
+:twice()
+    :wait("c")
+"""
+
+running = []
+peak = []
+loops = []
+
+
+async def wait_rune(arg, nodes, attrs, context):
+    running.append(arg)
+    peak.append(len(running))
+    loops.append(asyncio.get_running_loop())
+    await asyncio.sleep(0.01)
+    running.remove(arg)
+    return [mkdata(arg)]
+
+
+def twice_rune(*args, nodes):
+    # Returns runes, which must be inscribed in turn.
+    return nodes + [mkrune("wait", ("d",))]
+
+
+def plain_rune(arg, nodes):
+    return [mkdata("%s%d" % (arg, len(nodes)))]
+
+
+ASYNC_RUNES = {"wait": wait_rune, "twice": twice_rune, "plain": plain_rune}
+
+
+class TestAsyncRunes(TestCase):
+    def setUp(self):
+        peak.clear()
+        loops.clear()
+        for runeid, runefunc in ASYNC_RUNES.items():
+            register(runeid, "test-async", runefunc)
+
+    def tearDown(self):
+        for runeid in ASYNC_RUNES:
+            unregister(runeid, "test-async")
+
+    def output(self, nodes):
+        return "".join(n.data for n in nodes if type(n.data) is str)
+
+    def test_inscribe(self):
+        self.assertEqual(self.output(inscribe(build(ASYNC_SCROLL), "test-async", {})), "abcd")
+        self.assertEqual(max(peak), 1)
+
+    def test_inscribe_async(self):
+        nodes = asyncio.run(inscribe_async(build(ASYNC_SCROLL), "test-async", {}))
+        self.assertEqual(self.output(nodes), "abcd")
+        self.assertGreater(max(peak), 1)
+
+    def test_limit(self):
+        asyncio.run(inscribe_async(build(ASYNC_SCROLL), "test-async", {}, asyncio.Semaphore(1)))
+        self.assertEqual(max(peak), 1)
+
+    def test_inscribe_iter(self):
+        self.assertEqual(self.output(inscribe_iter(build(ASYNC_SCROLL), "test-async", {}, 4)), "abcd")
+        self.assertEqual(self.output(inscribe_iter(build(SCROLL), "html", {}, 4)),
+                         self.output(inscribe_iter(build(SCROLL), "html", {})))
+
+    def test_argfilter(self):
+        self.assertEqual(self.output(inscribe(build(':plain("x")\n'), "test-async", {})), "x0")
+
+    def test_one_loop(self):
+        # Each inscription runs its coroutine runes on one loop of its own.
+        self.output(inscribe(build(ASYNC_SCROLL), "test-async", {}))
+        self.output(inscribe_iter(build(ASYNC_SCROLL), "test-async", {}))
+        self.assertEqual(len(loops), 8)
+        self.assertEqual(len(set(loops[:4])), 1)
+        self.assertEqual(len(set(loops[4:])), 1)
+        self.assertNotEqual(loops[0], loops[4])
+        self.assertTrue(loops[0].is_closed())
+
+    def test_running_loop(self):
+        async def inside():
+            return self.output(inscribe(build(ASYNC_SCROLL), "test-async", {}))
+        self.assertEqual(asyncio.run(inside()), "abcd")
+
+
+calls = []
+
+
+def count_rune(arg, nodes):
+    calls.append(arg)
+    return [mkdata("<%s>" % arg)] + nodes
+
+
+class TestRuneMemo(TestCase):
+    def setUp(self):
+        calls.clear()
+        memo.clear()
+        memo.maxsize = 4096
+        register("count", "test-memo", count_rune, pure=True)
+        register("plain", "test-memo", plain_rune)
+
+    def tearDown(self):
+        memo.maxsize = 0
+        unregister("count", "test-memo")
+        unregister("plain", "test-memo")
+
+    def inscribe(self, src):
+        return "".join(n.data for n in inscribe(build(src), "test-memo", {}) if type(n.data) is str)
+
+    def test_reuse(self):
+        src = ':count("a")\n:count("a")\n:count("b")\n:count("a")\n    !x\n'
+        self.assertEqual(self.inscribe(src), "<a><a><b><a>x")
+        self.assertEqual(calls, ["a", "b", "a"])
+        self.assertEqual((memo.hits, memo.misses), (1, 3))
+        self.assertEqual(self.inscribe(src), "<a><a><b><a>x")
+        self.assertEqual(len(calls), 3)
+
+    def test_children(self):
+        # Keyed on the inscribed children, so only identical ones hit.
+        src = ':count("a")\n    !x\n:count("a")\n    !x\n:count("a")\n    !y\n:count("a")\n    :count("b")\n'
+        self.assertEqual(self.inscribe(src), "<a>x<a>x<a>y<a><b>")
+        self.assertEqual(calls, ["a", "a", "b", "a"])
+        self.assertEqual((memo.hits, memo.misses), (1, 4))
+
+    def test_copies(self):
+        first = inscribe(build(':count("a")\n'), "test-memo", {})
+        first.append(mkdata("<b>"))
+        self.assertEqual(self.inscribe(':count("a")\n'), "<a>")
+        # Data nodes without children are shared rather than copied.
+        second = inscribe(build(':count("a")\n'), "test-memo", {})
+        self.assertIs(first[0], second[0])
+
+    def test_disabled(self):
+        memo.maxsize = 0
+        self.inscribe(':count("a")\n:count("a")\n')
+        self.assertEqual(calls, ["a", "a"])
+        self.assertEqual(len(memo.entries), 0)
+
+    def test_bounded(self):
+        memo.maxsize = 2
+        self.inscribe(':count("a")\n:count("b")\n:count("c")\n:count("a")\n')
+        self.assertEqual(calls, ["a", "b", "c", "a"])
+        self.assertEqual(len(memo.entries), 2)
+
+    def test_impure(self):
+        inscribe(build(':plain("x")\n:plain("x")\n'), "test-memo", {})
+        self.assertEqual(memo.hits + memo.misses, 0)
+
+
+class TestDepend(TestCase):
+    def test_recording(self):
+        files = set()
+        depend({}, "unrecorded")
+        with recording(files):
+            depend({"dependencies": "metadata"}, "a", "b")
+        depend({}, "unrecorded")
+        self.assertEqual(files, {"a", "b"})
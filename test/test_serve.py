@@ -0,0 +1,66 @@
+from unittest import TestCase
+from tempfile import TemporaryDirectory
+from os import makedirs, path, utime
+
+from surrect import core_runes, core_format
+from surrect.serve import *
+
+
+def write(pth, text, mtime=None):
+    makedirs(path.dirname(pth), exist_ok=True)
+    with open(pth, "w") as f:
+        f.write(text)
+    if mtime is not None:
+        utime(pth, ns=(mtime, mtime))
+
+
+class TestSite(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.root = path.join(self.tmp.name, "root")
+        write(path.join(self.root, "index.scroll"), "### title: Home\n== Home ==\n")
+        write(path.join(self.root, "page.scroll"), "### title: Page\nSome text.\n")
+        makedirs(path.join(self.tmp.name, "runes"))
+        self.loads = []
+        self.site = Site({
+            "summon": {
+                "root dir": self.root,
+                "rune dir": path.join(self.tmp.name, "runes"),
+                "build dir": path.join(self.tmp.name, "build"),
+                "map": [["*", "site"]]
+            },
+            "renderers": {
+                "site": {
+                    "renderer": "site:html",
+                    "path format": "{dir}{filebase}.html",
+                    "page composition": ["main"]
+                }
+            }
+        }, self.loads.append, cache_size=1, check_interval=0)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_lazy(self):
+        self.assertEqual(sorted(self.site.pages), ["index.html", "page.html"])
+        self.assertEqual(self.site.output.files, 0)
+        self.assertEqual(self.site.get("index.html"), b"<h2>Home</h2>")
+        self.assertEqual(self.site.output.files, 1)
+        self.assertIsNone(self.site.get("missing.html"))
+
+    def test_cache(self):
+        self.site.get("index.html")
+        self.site.get("index.html")
+        self.assertEqual((self.site.hits, self.site.misses), (1, 1))
+        self.site.get("page.html")
+        self.site.get("index.html")
+        self.assertEqual((self.site.hits, self.site.misses), (1, 3))
+
+    def test_reload(self):
+        self.assertEqual(self.site.get("page.html"), b"<p>Some text.</p>")
+        write(path.join(self.root, "page.scroll"), "### title: Page\nOther text.\n", 1)
+        self.assertEqual(self.site.get("page.html"), b"<p>Other text.</p>")
+        self.assertEqual(len(self.loads), 2)
+        write(path.join(self.tmp.name, "runes", "new.py"), "")
+        self.site.get("page.html")
+        self.assertEqual(len(self.loads), 3)
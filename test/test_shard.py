@@ -0,0 +1,72 @@
+from unittest import TestCase
+from tempfile import TemporaryDirectory
+from os import makedirs, path
+
+from surrect.output import DirectoryOutput, MemoryOutput
+from surrect.shard import *
+
+
+def write(pth, text):
+    makedirs(path.dirname(pth), exist_ok=True)
+    with open(pth, "w") as f:
+        f.write(text)
+
+
+class TestShardOf(TestCase):
+    def test_parse(self):
+        self.assertEqual(parse_shard("2/3"), (2, 3))
+        for spec in ("0/3", "4/3", "2", "a/b"):
+            with self.assertRaises(ValueError):
+                parse_shard(spec)
+
+    def test_partition(self):
+        paths = ["dir/page%d.scroll" % i for i in range(100)]
+        shards = [shard_of(p, 4) for p in paths]
+        self.assertEqual(shards, [shard_of(p, 4) for p in paths])
+        self.assertEqual(set(shards), {1, 2, 3, 4})
+
+
+class TestMerge(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def shard(self, k, n, pages, extra=(), total=3):
+        root = path.join(self.tmp.name, "shard%d" % k)
+        makedirs(root)
+        for dst in pages + list(extra):
+            write(path.join(root, dst), "contents of " + dst)
+        write_record(DirectoryOutput(root), k, n, "site", total, pages)
+        return root
+
+    def test_merge(self):
+        shards = [self.shard(1, 2, ["a.html", "sub/b.html"], ["nav.html"]),
+                  self.shard(2, 2, ["c.html"], ["nav.html"])]
+        output = MemoryOutput()
+        files, problems = merge_shards(shards, output)
+        self.assertEqual(problems, [])
+        self.assertEqual(sorted(output.contents), ["a.html", "c.html", "nav.html", "sub/b.html"])
+        self.assertEqual(sorted(files), sorted(output.contents))
+
+    def test_incomplete(self):
+        shards = [self.shard(1, 3, ["a.html"]), self.shard(2, 3, ["b.html"])]
+        files, problems = merge_shards(shards, MemoryOutput())
+        self.assertEqual(problems, ["missing shard 3 of 3"])
+
+    def test_missing_output(self):
+        shards = [self.shard(1, 2, ["a.html", "b.html"]), self.shard(2, 2, ["c.html"])]
+        write_record(DirectoryOutput(shards[1]), 2, 2, "site", 4, ["c.html", "d.html"])
+        files, problems = merge_shards(shards, MemoryOutput())
+        self.assertEqual(problems, ["shards summoned 4 sources, not 3"])
+        write_record(DirectoryOutput(shards[0]), 1, 2, "site", 4, ["a.html", "b.html"])
+        files, problems = merge_shards(shards, MemoryOutput())
+        self.assertEqual(problems, ["\"d.html\" is missing from shard 2 (\"%s\")" % shards[1]])
+
+    def test_conflict(self):
+        shards = [self.shard(1, 2, ["a.html", "b.html"]), self.shard(2, 2, ["c.html"])]
+        write(path.join(shards[0], "nav.html"), "one")
+        write(path.join(shards[1], "nav.html"), "two")
+        files, problems = merge_shards(shards, MemoryOutput())
+        self.assertEqual(problems, ["\"nav.html\" differs between shards"])
@@ -0,0 +1,125 @@
+from io import StringIO
+from unittest import TestCase
+from tempfile import TemporaryDirectory
+from os import makedirs, path
+
+from surrect import scroll
+from surrect.source import *
+
+
+def write(pth, text):
+    makedirs(path.dirname(pth), exist_ok=True)
+    with open(pth, "w") as f:
+        f.write(text)
+
+
+class TestReadScrollHeader(TestCase):
+    def assertSameMetadata(self, src):
+        lexed = {}
+        parse_scroll_metadata(scroll.lex(StringIO(src)), lexed)
+        for chunk_size in (1, 5, 4096):
+            self.assertEqual(read_scroll_header(StringIO(src), {}, chunk_size), lexed)
+
+    def test_header(self):
+        self.assertSameMetadata("### title: A title\n# comment\n### k: v: w\ntext\n### not: meta\n")
+
+    def test_stops(self):
+        self.assertSameMetadata("### a: 1\n    ### b: 2\n")
+        self.assertSameMetadata("### a: 1\n\n### b: 2\n")
+        self.assertSameMetadata("text\n### a: 1\n")
+
+    def test_unterminated(self):
+        self.assertSameMetadata("### a: 1")
+        self.assertSameMetadata("")
+
+    def test_stops_reading(self):
+        src = StringIO("### a: 1\ntext\n" + "x" * 100000)
+        read_scroll_header(src, {}, 16)
+        self.assertLess(src.tell(), 100)
+
+
+class TestCategorySnapshot(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.root = path.join(self.tmp.name, "root")
+        self.snappath = path.join(self.tmp.name, "cache", "snapshot")
+        write(path.join(self.root, "a.scroll"), "### title: A\ntext\n")
+        write(path.join(self.root, "sub", "b.scroll"), "### title: B\ntext\n")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def build(self):
+        snapshot = CategorySnapshot.load(self.snappath, self.root)
+        tree = category_build(self.root, snapshot=snapshot)
+        snapshot.save(self.snappath)
+        return snapshot, tree
+
+    def titles(self, tree):
+        return sorted(src.metadata["title"] for src in tree.sources())
+
+    def test_reuse(self):
+        snapshot, tree = self.build()
+        self.assertEqual((snapshot.hits, snapshot.misses), (0, 2))
+        snapshot, cached = self.build()
+        self.assertEqual((snapshot.hits, snapshot.misses), (2, 0))
+        self.assertEqual(self.titles(tree), self.titles(cached))
+        self.assertIs(cached["Sub"].parent, cached)
+
+    def test_changed_scroll(self):
+        self.build()
+        write(path.join(self.root, "sub", "b.scroll"), "### title: Changed B\ntext\n")
+        snapshot, tree = self.build()
+        self.assertEqual((snapshot.hits, snapshot.misses), (1, 1))
+        self.assertEqual(self.titles(tree), ["A", "Changed B"])
+
+    def test_other_root(self):
+        self.build()
+        snapshot = CategorySnapshot.load(self.snappath, self.tmp.name)
+        self.assertEqual(snapshot.listings, {})
+
+
+class TestCategoryBuild(TestCase):
+    def test_threaded(self):
+        with TemporaryDirectory() as root:
+            for d in range(4):
+                for f in range(5):
+                    write(path.join(root, "d%d" % d, "s%d" % d, "p%d.scroll" % f),
+                          "### title: %d-%d\n" % (d, f))
+
+            def shape(cat):
+                return [(ent.name, shape(ent)) if isinstance(ent, Category)
+                        else (ent.name, ent.metadata["title"]) for ent in cat]
+
+            self.assertEqual(shape(category_build(root)),
+                             shape(category_build(root, workers=4)))
+
+
+class TestCategoryIndex(TestCase):
+    def setUp(self):
+        self.root = Category(None)
+        self.sub = Category("sub")
+        self.page = Source(SourceType.SCROLL, "page", True, "sub/page.scroll", "sub/page.html", None)
+        self.sub.add(self.page)
+        self.root.add(self.sub)
+
+    def test_lookup(self):
+        self.assertIs(self.root.lookup(("sub", "page")), self.page)
+        self.assertIs(self.root.lookup("sub/page"), self.page)
+        self.assertIs(self.root.lookup(("sub", "..", "sub")), self.sub)
+        with self.assertRaises(UnknownPath) as cm:
+            self.root.lookup("sub/missing")
+        self.assertIsInstance(cm.exception, KeyError)
+        self.assertEqual(str(cm.exception), "No \"missing\" in \"sub\", looking up \"sub/missing\"")
+        with self.assertRaises(UnknownPath):
+            self.root.lookup("sub/page/deeper")
+
+    def test_changed(self):
+        self.assertEqual(list(self.root.sources()), [self.page])
+        other = Source(SourceType.RESOURCE, "other", True, "sub/other.png", "sub/other.png", None)
+        self.sub.add(other)
+        self.assertIs(self.root.lookup("sub/other"), other)
+        self.assertEqual(list(self.root.sources()), [self.page, other])
+        del self.sub["page"]
+        self.assertNotIn(("sub", "page"), self.root.paths())
+        self.assertEqual(list(self.root.sources()), [other])
@@ -0,0 +1,102 @@
+from unittest import TestCase
+
+from surrect.source import Category, Link, Source, SourceType, UnknownPath
+from surrect.summon import Referencer, gen_navigation_renderer, navigation_expanded, navigation_scope
+
+
+class TestReferencer(TestCase):
+    def setUp(self):
+        self.root = Category(None)
+        docs = Category("docs")
+        api = Category("api")
+        self.page = Source(SourceType.SCROLL, "page", True, "docs/api/page.scroll", "docs/api/page.html", None)
+        api.add(self.page)
+        api.add(Link("home", True, "https://example.com/"))
+        docs.add(api)
+        self.root.add(docs)
+        self.record = []
+        self.ref = Referencer(self.root, self.page, lambda ent, current: "/" + ent.destination, self.record)
+
+    def test_resolve(self):
+        self.assertEqual(self.ref["docs"]["api"]["page"], "/docs/api/page.html")
+        self.assertEqual(self.ref["docs/api/page"], "/docs/api/page.html")
+        self.assertEqual(self.ref["docs"]["api/home"], "https://example.com/")
+        self.assertEqual(self.ref.resolve(["docs", "api", "page"]), "/docs/api/page.html")
+        self.assertEqual("{0[docs][api][page]}".format(self.ref), "/docs/api/page.html")
+        self.assertEqual(self.record[0], (("docs", "api", "page"), "/docs/api/page.html"))
+        self.assertEqual(self.record[1], (("docs", "api", "page"), "/docs/api/page.html"))
+
+    def test_digits(self):
+        # str.format passes digit only indexes as ints.
+        year = Category("2024")
+        year.add(Source(SourceType.SCROLL, "12", True, "2024/12.scroll", "2024/12.html", None))
+        self.root.add(year)
+        self.assertEqual("{0[2024][12]}".format(self.ref), "/2024/12.html")
+        self.assertEqual(self.ref.resolve([2024, "12"]), "/2024/12.html")
+        self.assertIs(self.root.lookup([2024]), year)
+        with self.assertRaises(UnknownPath):
+            self.root.lookup([2024, 2])
+
+    def test_unknown(self):
+        with self.assertRaises(UnknownPath):
+            self.ref["docs"]["nope"]
+        with self.assertRaises(KeyError):
+            self.ref.resolve(["docs", "api", "nope"])
+
+
+class TestNavigation(TestCase):
+    def setUp(self):
+        # root: home, docs: [intro, api: [one]], blog: [post]
+        self.root = Category(None)
+        docs, api, blog = Category("docs"), Category("api"), Category("blog")
+        self.home = Source(SourceType.SCROLL, "home", True, "home.scroll", "home.html", None)
+        self.one = Source(SourceType.SCROLL, "one", True, "one.scroll", "docs/api/one.html", None)
+        self.root.add(self.home)
+        docs.add(Source(SourceType.SCROLL, "intro", True, "intro.scroll", "docs/intro.html", None))
+        api.add(self.one)
+        docs.add(api)
+        blog.add(Source(SourceType.SCROLL, "post", True, "post.scroll", "blog/post.html", None))
+        self.root.add(docs)
+        self.root.add(blog)
+
+    def render(self, current, expand="all", depth=None):
+        fmt = lambda f: lambda ctx: f.format_map(ctx)
+        render = gen_navigation_renderer(
+            fmt("["), fmt("]"), fmt("("), fmt(")"), fmt(""), fmt(" "),
+            fmt("{name}"), fmt("{name}"), fmt("{name}"), fmt("*{name}"),
+            lambda text, context: text, lambda ent, cur: ent.destination,
+            expand, depth
+        )
+        return "".join(render(self.root, current, {}))
+
+    def scope(self, current, expand="all", depth=None):
+        return sorted(cat.location() for cat in navigation_scope(self.root, current, expand, depth))
+
+    def test_location(self):
+        self.assertEqual(self.root.location(), ())
+        self.assertEqual(self.one.location(), ("docs", "api", "one"))
+        self.assertEqual(self.one.parent.location(), ("docs", "api"))
+
+    def test_expanded(self):
+        self.assertTrue(navigation_expanded((), set(), 0))
+        self.assertTrue(navigation_expanded(("docs",), None, None))
+        self.assertTrue(navigation_expanded(("docs",), {(), ("docs",)}, None))
+        self.assertFalse(navigation_expanded(("blog",), {(), ("docs",)}, None))
+        self.assertTrue(navigation_expanded(("docs", "api"), None, 2))
+        self.assertFalse(navigation_expanded(("docs", "api"), None, 1))
+
+    def test_all(self):
+        self.assertEqual(self.render(self.one), "[homedocs(intro api(*one ) )blog(post )]")
+        self.assertEqual(self.scope(self.one), [(), ("blog",), ("docs",), ("docs", "api")])
+
+    def test_ancestors(self):
+        self.assertEqual(self.render(self.one, "ancestors"), "[homedocs(intro api(*one ) )blog]")
+        self.assertEqual(self.scope(self.one, "ancestors"), [(), ("docs",), ("docs", "api")])
+        self.assertEqual(self.render(self.home, "ancestors"), "[*homedocsblog]")
+        self.assertEqual(self.scope(self.home, "ancestors"), [()])
+
+    def test_depth(self):
+        self.assertEqual(self.render(self.one, depth=1), "[homedocs(intro api )blog(post )]")
+        self.assertEqual(self.scope(self.one, depth=1), [(), ("blog",), ("docs",)])
+        self.assertEqual(self.render(self.one, depth=0), "[homedocsblog]")
+        self.assertEqual(self.render(self.one, "ancestors", 1), "[homedocs(intro api )blog]")
@@ -0,0 +1,70 @@
+from unittest import TestCase
+
+from surrect.template import *
+
+
+class Obj:
+    attr = "attribute"
+
+
+class Counter:
+    """Formats as the number of times it has been formatted."""
+    def __init__(self):
+        self.count = 0
+
+    def __format__(self, spec):
+        self.count += 1
+        return str(self.count)
+
+
+class TestTemplate(TestCase):
+    def assertFormats(self, fmt, mapping):
+        self.assertEqual(Template(fmt)(mapping), fmt.format_map(mapping))
+
+    def test_format_map(self):
+        mapping = {"a": "alpha", "n": 4.5, "d": {"k": ["x", "y"]}, "o": Obj()}
+        self.assertFormats("plain {{text}}", mapping)
+        self.assertFormats("{a} and {a!r} {n:>8.2f}", mapping)
+        self.assertFormats("{d[k][1]} {o.attr}", mapping)
+        self.assertFormats("{n:{a}}".replace("{a}", "{w}"), {"n": 1, "w": 5})
+
+    def test_keys(self):
+        self.assertEqual(Template("{a} {b[c]} {a.x}").keys, ["a", "b"])
+        self.assertEqual(Template("{a:{w}}").keys, ["a", "w"])
+        self.assertEqual(Template("none").keys, [])
+
+    def test_missing(self):
+        t = Template("{title} {ref[a]}")
+        self.assertEqual(t.missing({"title": "t"}), ["ref"])
+        self.assertRaises(KeyError, t, {"title": "t"})
+
+    def test_shared(self):
+        t = Template("<title>{title}</title>")
+        self.assertEqual(t({"title": "a"}), t({"title": "a", "other": 1}))
+        self.assertEqual(t.cached.cache_info().hits, 1)
+        self.assertEqual(Template("{x}")({"x": True}), "True")
+        t = Template("{x}")
+        self.assertEqual([t({"x": 1}), t({"x": True})], ["1", "True"])
+        self.assertEqual(t({"x": [1]}), "[1]")
+
+    def test_not_shared(self):
+        # Objects may change, or record being used, so aren't cached on.
+        t = Template("{c}")
+        c = Counter()
+        self.assertEqual([t({"c": c}), t({"c": c})], ["1", "2"])
+        self.assertEqual(t.cached.cache_info().currsize, 0)
+
+
+class TestSplitFieldName(TestCase):
+    def test_split(self):
+        self.assertEqual(split_field_name("a"), ("a", []))
+        self.assertEqual(split_field_name("0"), (0, []))
+        self.assertEqual(split_field_name("a.b[c][2024].d"),
+                         ("a", [(True, "b"), (False, "c"), (False, 2024), (True, "d")]))
+        self.assertEqual(split_field_name("a.12"), ("a", [(True, "12")]))
+        self.assertEqual(split_field_name("a[x.y]"), ("a", [(False, "x.y")]))
+
+    def test_errors(self):
+        for name in ("a[b", "a[b]c", "a.", "a[]", "a..b"):
+            with self.assertRaises(ValueError):
+                split_field_name(name)
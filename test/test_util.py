@@ -1,4 +1,7 @@
-from unittest import TestCase
+from unittest import TestCase, mock
+from tempfile import TemporaryDirectory
+from os import listdir, stat, utime
+from os import path as ospath
 
 from surrect.util import *
 
@@ -36,3 +39,53 @@ class TestBraceExpand(TestCase):
         self.assertEqual(expanded[0], "foo-1")
         self.assertEqual(expanded[1], "foo-2")
         self.assertEqual(expanded[2], "foo-3")
+
+
+class TestSettle(TestCase):
+    def write(self, name, text):
+        pth = ospath.join(self.tmp.name, name)
+        with open(pth, "w") as f:
+            f.write(text)
+        return pth
+
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_new(self):
+        dst = ospath.join(self.tmp.name, "page.html")
+        tmp = self.write(ospath.basename(temp_path(dst)), "a")
+        self.assertTrue(settle(tmp, dst))
+        self.assertEqual(listdir(self.tmp.name), ["page.html"])
+
+    def test_unchanged(self):
+        dst = self.write("page.html", "a")
+        utime(dst, ns=(1, 1))
+        self.assertFalse(settle(self.write(".page.html.tmp", "a"), dst))
+        self.assertEqual(stat(dst).st_mtime_ns, 1)
+        self.assertTrue(settle(self.write(".page.html.tmp", "b"), dst))
+        with open(dst) as f:
+            self.assertEqual(f.read(), "b")
+        self.assertEqual(listdir(self.tmp.name), ["page.html"])
+
+    def test_copy(self):
+        src = self.write("src", "a")
+        self.assertTrue(copy_if_changed(src, ospath.join(self.tmp.name, "dst")))
+        self.assertFalse(copy_if_changed(src, ospath.join(self.tmp.name, "dst")))
+
+
+class TestRss(TestCase):
+    def test_unmeasurable(self):
+        with mock.patch("builtins.open", side_effect=OSError):
+            self.assertIsNone(current_rss())
+
+    def test_collected(self):
+        # Back under the limit once garbage is collected.
+        with mock.patch("surrect.util.current_rss", side_effect=[200, 50]):
+            self.assertIsNone(over_rss_limit(100))
+        with mock.patch("surrect.util.current_rss", side_effect=[200, 150]):
+            self.assertEqual(over_rss_limit(100), 150)
+        with mock.patch("surrect.util.current_rss", side_effect=[50]):
+            self.assertIsNone(over_rss_limit(100))